@@ -1,5 +1,6 @@
 import os
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 from flask import Flask, session, request, render_template, redirect, url_for
 
@@ -84,78 +85,177 @@ except ImportError:
     print("WARNING: flask_sqlalchemy not found. Database operations will not work.")
     db = None
 
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+# Configure login manager
+login_manager = LoginManager()
 
-# Set Flask debug mode from environment
-app.config["DEBUG"] = os.environ.get("FLASK_DEBUG", "True").lower() == "true"
+# Bump when the schema or seed data changes so initialize_database runs again
+SCHEMA_VERSION = 3
 
-# Configure database
-current_dir = os.path.dirname(os.path.abspath(__file__))
-db_path_env = os.environ.get("DATABASE_PATH")
+# Every request holds the database gate so a restore can swap the file between requests
+from db_gate import db_gate
+from phase_timing import PHASE_TIMING_ENABLED, init_phase_timing, phase
+from query_stats import QUERY_STATS_ENABLED, init_query_stats
+from metrics import METRICS_ENABLED, init_metrics
+from tracing import TRACING_ENABLED, init_tracing
 
-if db_path_env:
-    # Use the environment variable if provided
-    if os.path.isabs(db_path_env):
-        # Absolute path from environment
-        db_path = db_path_env
-    else:
+def get_database_path():
+    """Resolve the database path from DATABASE_PATH, relative to the application directory"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    db_path_env = os.environ.get("DATABASE_PATH")
+    
+    if db_path_env:
+        # Use the environment variable if provided
+        if os.path.isabs(db_path_env):
+            # Absolute path from environment
+            return db_path_env
         # Relative path from environment - make it absolute
-        db_path = os.path.join(current_dir, db_path_env)
-else:
+        return os.path.join(current_dir, db_path_env)
     # Default path in the application directory
-    db_path = os.path.join(current_dir, "data", "distributor_tracker.db")
-
-# Create directory if it doesn't exist
-db_dir = os.path.dirname(db_path)
-if not os.path.exists(db_dir) and db_dir:
-    os.makedirs(db_dir, exist_ok=True)
-
-print(f"Database path: {db_path}")
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Security settings
-app.config['SESSION_COOKIE_SECURE'] = False  # Not needed for internal app
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['REMEMBER_COOKIE_SECURE'] = False  # Not needed for internal app
-app.config['REMEMBER_COOKIE_HTTPONLY'] = True
-app.config['REMEMBER_COOKIE_DURATION'] = 86400  # 1 day in seconds
-
-# Completely disable WTF CSRF
-app.config['WTF_CSRF_ENABLED'] = False
-
-# Create a context processor to provide a dummy csrf_token function to templates
-@app.context_processor
-def inject_csrf_token():
-    def csrf_token():
-        return "dummy_token"
-    return dict(csrf_token=csrf_token)
-
-# Initialize database with app
-if db:
-    db.init_app(app)
+    return os.path.join(current_dir, "data", "distributor_tracker.db")
 
-# Configure login manager
-login_manager = LoginManager()
-if HAS_FLASK_LOGIN:
-    login_manager.init_app(app)
-    login_manager.login_view = 'login'
-else:
-    print("WARNING: Using dummy login manager, all authentication is bypassed")
-
-# Import models if database is available
-if db:
-    try:
-        with app.app_context():
+def create_app(config=None):
+    """
+    Create and configure the Flask application
+    
+    Building the app does no database or file I/O, so importing and creating
+    it is cheap for every worker, CLI command and test. Schema creation and
+    seeding happen separately in initialize_database.
+    
+    Args:
+        config (dict): Optional settings applied over the defaults
+        
+    Returns:
+        Flask: The configured application
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    
+    # Set Flask debug mode from environment
+    app.config["DEBUG"] = os.environ.get("FLASK_DEBUG", "True").lower() == "true"
+    
+    # Configure database
+    app.config["DATABASE_PATH"] = get_database_path()
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{app.config['DATABASE_PATH']}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    
+    # Security settings
+    app.config['SESSION_COOKIE_SECURE'] = False  # Not needed for internal app
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['REMEMBER_COOKIE_SECURE'] = False  # Not needed for internal app
+    app.config['REMEMBER_COOKIE_HTTPONLY'] = True
+    app.config['REMEMBER_COOKIE_DURATION'] = 86400  # 1 day in seconds
+    
+    # Completely disable WTF CSRF
+    app.config['WTF_CSRF_ENABLED'] = False
+    
+    # Per-request phase timers (see phase_timing)
+    app.config["PHASE_TIMING"] = PHASE_TIMING_ENABLED
+    # Statement counts per route and the slow-query log (see query_stats)
+    app.config["QUERY_STATS"] = QUERY_STATS_ENABLED
+    # Prometheus metrics at /metrics (see metrics)
+    app.config["METRICS"] = METRICS_ENABLED
+    # Request and report spans written to traces/ (see tracing)
+    app.config["TRACING"] = TRACING_ENABLED
+    
+    if config:
+        app.config.update(config)
+    
+    # Create a context processor to provide a dummy csrf_token function to templates
+    @app.context_processor
+    def inject_csrf_token():
+        def csrf_token():
+            return "dummy_token"
+        return dict(csrf_token=csrf_token)
+    
+    # Initialize database with app and tune its SQLite connections
+    if db:
+        from db_config import configure_database
+        db.init_app(app)
+        configure_database(app, db)
+        init_phase_timing(app, db)
+        init_query_stats(app, db)
+        init_metrics(app, db)
+        init_tracing(app)
+    
+    @app.before_request
+    def enter_database_gate():
+        db_gate.enter()
+    
+    @app.teardown_request
+    def leave_database_gate(exc):
+        db_gate.leave()
+    
+    if HAS_FLASK_LOGIN:
+        login_manager.init_app(app)
+        login_manager.login_view = 'main.login'
+    else:
+        print("WARNING: Using dummy login manager, all authentication is bypassed")
+    
+    register_handlers(app)
+    
+    # Admins can profile a single request with X-Profile or ?_profile (see profiling)
+    from profiling import init_profiling
+    init_profiling(app)
+    
+    # Routes live in the main blueprint
+    with phase("import_routes"):
+        from routes import main
+    app.register_blueprint(main)
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create tables and seed initial data"""
+        initialize_database(app, force=True)
+        print('Database initialization complete')
+    
+    return app
+
+def initialize_database(app, force=False):
+    """
+    Create the schema and seed the admin user and distributors
+    
+    This is the explicit init phase. The schema version is recorded in
+    PRAGMA user_version, so once a database has been initialised later
+    starts skip it after a single PRAGMA read.
+    
+    Args:
+        app: Application created by create_app
+        force (bool): Run even if the database is already at SCHEMA_VERSION
+        
+    Returns:
+        bool: Whether initialisation ran
+    """
+    if not db:
+        return False
+    
+    # Create directory if it doesn't exist
+    db_dir = os.path.dirname(app.config["DATABASE_PATH"])
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+    
+    with app.app_context():
+        with db.engine.connect() as conn:
+            version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if version >= SCHEMA_VERSION and not force:
+            return False
+        
+        try:
             from models import User, Distributor, Target, Actual
+            from database.init_db import seed_distributors
+        except ImportError:
+            print("WARNING: Unable to import models - database migrations skipped")
+            return False
+        
+        logging.info(f"Initializing database at {app.config['DATABASE_PATH']}")
+        with phase("create_all"):
             db.create_all()
-            
+            with db.engine.begin() as conn:
+                upgrade_schema(conn)
+        
+        with phase("seed"):
             # Create admin user if it doesn't exist
             from werkzeug.security import generate_password_hash
-            from models import User
             
             admin = User.query.filter_by(username='admin').first()
             if not admin:
@@ -164,10 +264,45 @@ if db:
                     password_hash=generate_password_hash('admin123')
                 )
                 db.session.add(admin)
-                db.session.commit()
                 logging.info("Created default admin user")
-    except ImportError:
-        print("WARNING: Unable to import models - database migrations skipped")
+            
+            seed_distributors(db, Distributor)
+            db.session.commit()
+        
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
+
+def upgrade_schema(conn):
+    """
+    Add the columns and indexes introduced after a table was first created
+
+    create_all only creates missing tables, so tables from an older schema
+    are altered here. Each step checks first and is safe to run again.
+
+    Args:
+        conn: Connection inside a transaction
+    """
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(idempotency_key)")}
+    if "request_hash" not in columns:
+        conn.exec_driver_sql("ALTER TABLE idempotency_key ADD COLUMN request_hash VARCHAR(64)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_idempotency_key_created_at ON idempotency_key (created_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_change_log_changed_at ON change_log (changed_at)"
+    )
+
+@contextmanager
+def quiesce_database():
+    """Wait for in-flight requests, close pooled connections, and hold new requests back"""
+    with db_gate.exclusive():
+        db.session.remove()
+        db.engine.dispose()
+        try:
+            yield
+        finally:
+            db.engine.dispose()
 
 # User loader for Flask-Login
 if HAS_FLASK_LOGIN:
@@ -180,62 +315,65 @@ if HAS_FLASK_LOGIN:
             # Fallback to dummy user
             return DummyUser()
 
-# Simplified security headers for internal app
-@app.after_request
-def add_security_headers(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'SAMEORIGIN'
-    return response
-
-# Error handlers
-@app.errorhandler(404)
-def page_not_found(e):
-    logging.warning(f"Page not found: {request.url}")
-    return render_template('error.html', 
-                         error_code=404, 
-                         error_message="The page you're looking for doesn't exist. Please check the URL or contact IT support."), 404
-
-@app.errorhandler(500)
-def server_error(e):
-    logging.error(f"Server error: {str(e)}")
-    return render_template('error.html', 
-                         error_code=500, 
-                         error_message="Something went wrong on our end. Please try again or contact IT support if the problem persists."), 500
-
-@app.errorhandler(403)
-def forbidden(e):
-    logging.warning(f"Access forbidden: {request.url} by {request.remote_addr}")
-    return render_template('error.html', 
-                         error_code=403, 
-                         error_message="You don't have permission to access this page. Please contact your administrator if you believe this is an error."), 403
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    logging.error(f"Unhandled exception: {str(e)}")
-    return render_template('error.html', 
-                         error_code=500, 
-                         error_message="An unexpected error occurred. Please contact IT support with the error details."), 500
-
-# Jinja2 template filters
-@app.template_filter('format_date')
-def format_date(value, format='%Y-%m-%d'):
-    if value:
-        if isinstance(value, str):
-            try:
-                return datetime.strptime(value, '%Y-%m-%d').strftime(format)
-            except ValueError:
-                return value
-        return value.strftime(format)
-    return ""
-
-@app.template_filter('format_currency')
-def format_currency(value):
-    if value is not None:
-        return f"{int(value):,} cases" if value else "0 cases"
-    return "0 cases"
-
-@app.template_filter('format_percent')
-def format_percent(value):
-    if value is not None:
-        return f"{int(value)}%" if value else "0%"
-    return "0%"
+def register_handlers(app):
+    """Register response hooks, error handlers and template filters on the app"""
+    
+    # Simplified security headers for internal app
+    @app.after_request
+    def add_security_headers(response):
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.headers['X-Frame-Options'] = 'SAMEORIGIN'
+        return response
+    
+    # Error handlers
+    @app.errorhandler(404)
+    def page_not_found(e):
+        logging.warning(f"Page not found: {request.url}")
+        return render_template('error.html', 
+                             error_code=404, 
+                             error_message="The page you're looking for doesn't exist. Please check the URL or contact IT support."), 404
+    
+    @app.errorhandler(500)
+    def server_error(e):
+        logging.error(f"Server error: {str(e)}")
+        return render_template('error.html', 
+                             error_code=500, 
+                             error_message="Something went wrong on our end. Please try again or contact IT support if the problem persists."), 500
+    
+    @app.errorhandler(403)
+    def forbidden(e):
+        logging.warning(f"Access forbidden: {request.url} by {request.remote_addr}")
+        return render_template('error.html', 
+                             error_code=403, 
+                             error_message="You don't have permission to access this page. Please contact your administrator if you believe this is an error."), 403
+    
+    @app.errorhandler(Exception)
+    def handle_exception(e):
+        logging.error(f"Unhandled exception: {str(e)}")
+        return render_template('error.html', 
+                             error_code=500, 
+                             error_message="An unexpected error occurred. Please contact IT support with the error details."), 500
+    
+    # Jinja2 template filters
+    @app.template_filter('format_date')
+    def format_date(value, format='%Y-%m-%d'):
+        if value:
+            if isinstance(value, str):
+                try:
+                    return datetime.strptime(value, '%Y-%m-%d').strftime(format)
+                except ValueError:
+                    return value
+            return value.strftime(format)
+        return ""
+    
+    @app.template_filter('format_currency')
+    def format_currency(value):
+        if value is not None:
+            return f"{int(value):,} cases" if value else "0 cases"
+        return "0 cases"
+    
+    @app.template_filter('format_percent')
+    def format_percent(value):
+        if value is not None:
+            return f"{int(value)}%" if value else "0%"
+        return "0%"
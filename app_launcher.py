@@ -2,6 +2,8 @@ import webbrowser
 import os
 import sys
 import logging
+import argparse
+import multiprocessing
 from threading import Timer
 from dotenv import load_dotenv
 
@@ -15,39 +17,90 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
+HOST = "127.0.0.1"  # Only allow local connections for security
+PORT = 8765
+
+def parse_args(argv=None):
+    """
+    Parse launcher options; each falls back to an environment variable
+    
+    Production mode serves the app with waitress, a multi-threaded WSGI
+    server, with debug off. Otherwise the Werkzeug development server is used.
+    """
+    parser = argparse.ArgumentParser(description="Start the Distributor Sales Management System")
+    parser.add_argument("--production", action="store_true",
+                        default=os.environ.get("APP_PRODUCTION", "false").lower() == "true",
+                        help="Serve with waitress instead of the development server (APP_PRODUCTION)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("APP_THREADS", 8)),
+                        help="Worker threads handling requests (APP_THREADS)")
+    parser.add_argument("--connection-limit", type=int, default=int(os.environ.get("APP_CONNECTION_LIMIT", 100)),
+                        help="Maximum simultaneous client connections (APP_CONNECTION_LIMIT)")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("APP_BACKLOG", 1024)),
+                        help="Connections queued by the OS before being accepted (APP_BACKLOG)")
+    parser.add_argument("--channel-timeout", type=int, default=int(os.environ.get("APP_CHANNEL_TIMEOUT", 120)),
+                        help="Seconds before an inactive connection is closed (APP_CHANNEL_TIMEOUT)")
+    return parser.parse_args(argv)
+
+def serve_production(app, options):
+    """Serve the app with waitress; requests beyond the thread count wait in its task queue"""
+    from waitress import serve
+    
+    app.debug = False
+    app.config["DEBUG"] = False
+    logging.info(
+        f"Serving with waitress: {options.threads} threads, "
+        f"{options.connection_limit} connections, backlog {options.backlog}"
+    )
+    serve(
+        app,
+        host=HOST,
+        port=PORT,
+        threads=options.threads,
+        connection_limit=options.connection_limit,
+        backlog=options.backlog,
+        channel_timeout=options.channel_timeout,
+        ident="Distributor Sales Management System"
+    )
+
 def open_browser():
     try:
-        webbrowser.open("http://127.0.0.1:8765")
+        webbrowser.open(f"http://{HOST}:{PORT}")
         logging.info("Browser opened successfully")
     except Exception as e:
         logging.error(f"Failed to open browser: {str(e)}")
 
 def main():
+    options = parse_args()
     try:
         # Add the current directory to sys.path
         sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
         
-        # Import app after setting up path
-        from app import app, db
-        import routes
-        from backup_utils import start_backup_scheduler
-        from models import Distributor
-        from database.init_db import DISTRIBUTORS
+        from phase_timing import startup_timing, phase
         
-        # Initialize database
-        with app.app_context():
-            db.create_all()
+        # With PHASE_TIMING=true each start-up step is logged with its duration
+        with startup_timing():
+            # Import app after setting up path
+            with phase("import"):
+                from app import create_app, initialize_database
+                from backup_utils import start_backup_scheduler, stop_backup_scheduler
+                from leader_election import LeaderElector
             
-            # Seed initial distributors
-            existing = {d.name for d in Distributor.query.all()}
-            for name in DISTRIBUTORS:
-                if name not in existing:
-                    db.session.add(Distributor(name=name))
-            db.session.commit()
-        
-        # Start the backup scheduler
-        backup_scheduler = start_backup_scheduler()
-        logging.info("Local backup scheduler started")
+            # Create the app, then create the schema and seed data if this database needs it
+            with phase("create_app"):
+                app = create_app()
+            with phase("initialize_database"):
+                if initialize_database(app):
+                    logging.info("Database initialized")
+            
+            # Only the elected leader among running instances starts the backup scheduler
+            with phase("leader_election"):
+                # The elector and scheduler run outside any app context, so they get the path explicitly
+                db_path = app.config["DATABASE_PATH"]
+                scheduler_election = LeaderElector(
+                    "backup_scheduler", on_elected=lambda: start_backup_scheduler(db_path),
+                    on_demoted=stop_backup_scheduler, db_path=db_path
+                ).start()
+            logging.info("Backup scheduler leader election started")
         
         print("\n╭─────────────────────────────────────────────────────────────────╮")
         print("│                                                                 │")
@@ -64,15 +117,20 @@ def main():
         Timer(2, open_browser).start()
         
         # Run the Flask app
-        app.run(
-            host="127.0.0.1",  # Only allow local connections for security
-            port=8765,
-            debug=True,  # Enable debug for internal app
-            use_reloader=False  # Important for PyInstaller
-        )
+        if options.production:
+            serve_production(app, options)
+        else:
+            app.run(
+                host=HOST,
+                port=PORT,
+                debug=True,  # Enable debug for internal app
+                use_reloader=False  # Important for PyInstaller
+            )
     except Exception as e:
         logging.error(f"Application error: {str(e)}")
         sys.exit(1)
 
 if __name__ == "__main__":
+    # Backups run in a spawned child process, which needs this in a frozen build
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
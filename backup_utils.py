@@ -2,16 +2,137 @@ import os
 import json
 import logging
 import sqlite3
-import pandas as pd
-from datetime import datetime
+import gzip
+import time
+import zlib
+import hashlib
+import threading
+import ctypes
+import platform
+import multiprocessing
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 import shutil
 import os
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from metrics import BACKUP_DURATION, BACKUPS, BACKUP_SIZE, BACKUP_WRITTEN
+from tracing import span, start_span
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pages copied per backup step and pause between steps, so writers are never blocked for long
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", 256))
+BACKUP_STEP_SLEEP = float(os.environ.get("BACKUP_STEP_SLEEP", 0.01))
+
+# "incremental" stores snapshots as deduplicated, compressed chunks; "full" keeps a plain database.db copy
+BACKUP_MODE = os.environ.get("BACKUP_MODE", "incremental")
+BACKUP_CHUNK_SIZE = int(os.environ.get("BACKUP_CHUNK_SIZE", 64 * 1024))
+
+# Backups older than the retention period are pruned, but the newest few are always kept
+BACKUP_RETENTION_DAYS = int(os.environ.get("BACKUP_RETENTION_DAYS", 30))
+BACKUP_KEEP_MIN = int(os.environ.get("BACKUP_KEEP_MIN", 3))
+
+class BackupFileLock:
+    """
+    Exclusive lock on a file in backups/, held across processes
+
+    Backups run in a child process and several app processes may share the
+    backups directory, so a threading lock alone cannot serialise them. The
+    lock is taken with fcntl.flock, or msvcrt.locking on Windows, on a lock
+    file that is opened on first acquisition. It is reentrant for the thread
+    holding it, and other threads of the same process wait on a local lock.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._local_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._local_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(os.path.join(ensure_backup_dir(), self.file_name), 'a+')
+                self._lock_file()
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._local_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file()
+            finally:
+                self._file.close()
+                self._file = None
+        self._local_lock.release()
+
+    def _lock_file(self):
+        if os.name == "nt":
+            import msvcrt
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    return
+                except OSError:
+                    # LK_LOCK gives up after ten one-second attempts; keep waiting
+                    continue
+        import fcntl
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(self):
+        if os.name == "nt":
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        import fcntl
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+# Serialises backups, pruning and WAL archive bases in every process, so chunk
+# garbage collection never deletes chunks a base or backup is still writing
+_backup_lock = BackupFileLock("chunks.lock")
+
+# Catalog of backups kept in backups/manifest.json; guarded across processes so
+# the backup child and the web process's verifier don't clobber each other's updates
+MANIFEST_FILE = "manifest.json"
+_manifest_lock = BackupFileLock("manifest.lock")
+
+# Scheduled and manual backups run in a child process at this nice level, with idle I/O priority
+BACKUP_NICE = int(os.environ.get("BACKUP_NICE", 10))
+BACKUP_IDLE_IO = os.environ.get("BACKUP_IDLE_IO", "true").lower() == "true"
+
+# Status of the most recent backup process, reported back over a pipe, and of
+# the most recent background verification
+_backup_status = {"state": "idle"}
+_verify_status = {"state": "idle"}
+_backup_status_lock = threading.Lock()
+
+def resolve_database_path(db_path=None):
+    """
+    Return db_path, or the database of the current Flask app
+
+    Scheduler jobs and the backup child process run outside any app context,
+    so they are given the path explicitly.
+    """
+    if db_path:
+        return db_path
+    from flask import current_app
+    return current_app.config["DATABASE_PATH"]
+
 def ensure_backup_dir():
     """Create backups directory if it doesn't exist"""
     backup_dir = os.path.join(os.getcwd(), 'backups')
@@ -19,179 +140,1087 @@ def ensure_backup_dir():
         os.makedirs(backup_dir)
     return backup_dir
 
-def backup_table(db_path, table_name):
+def backup_table(db_path, table_name, file_path, compress=False, batch_size=1000):
     """
-    Extract data from a SQLite table and convert to a list of dictionaries.
+    Stream a SQLite table to a newline-delimited JSON file.
+    
+    Rows are fetched in batches and written one JSON object per line, so
+    memory use stays constant however large the table is.
     
     Args:
         db_path: Path to the SQLite database
         table_name: Name of the table to backup
+        file_path: Path of the .ndjson file to write (".gz" is appended when compressed)
+        compress: Gzip the output
+        batch_size: Rows fetched per fetchmany call
         
     Returns:
-        List of dictionaries representing the rows
+        tuple: (path written, number of rows)
     """
+    if compress and not file_path.endswith(".gz"):
+        file_path += ".gz"
+    
+    conn = sqlite3.connect(db_path)
     try:
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
+        cursor = conn.execute(f"SELECT * FROM {table_name}")
+        columns = [column[0] for column in cursor.description]
+        row_count = 0
         
-        # Read the table into a DataFrame
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+        opener = gzip.open if compress else open
+        with opener(file_path, 'wt', encoding='utf-8') as f:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    f.write(json.dumps(dict(zip(columns, row))))
+                    f.write("\n")
+                row_count += len(rows)
+    finally:
+        conn.close()
+    
+    return file_path, row_count
+
+def iter_backup_records(file_path):
+    """
+    Stream records from a table export written by backup_table.
+    
+    Reads .ndjson and .ndjson.gz exports line by line; legacy .json exports
+    (a single JSON array) are still accepted.
+    
+    Args:
+        file_path: Path to the export file
         
-        # Convert to list of dictionaries
-        records = df.to_dict(orient='records')
+    Yields:
+        dict: One record per row
+    """
+    if file_path.endswith(".json"):
+        with open(file_path, 'r') as f:
+            yield from json.load(f)
+        return
+    
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def find_table_export(backup_path, table_name):
+    """Return the path of a table's export in a backup directory, or None"""
+    for file_name in (f"{table_name}.ndjson.gz", f"{table_name}.ndjson", f"{table_name}.json"):
+        file_path = os.path.join(backup_path, file_name)
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+def copy_database(db_path, dest_path, pages=None, step_sleep=None):
+    """
+    Copy a live SQLite database with the online backup API
+
+    The copy is made in steps of a few pages, pausing between steps, so the
+    result is a consistent snapshot and writers are only briefly held up.
+
+    Args:
+        db_path: Path to the source SQLite database
+        dest_path: Path of the copy to create
+        pages: Pages copied per step (defaults to BACKUP_PAGES_PER_STEP)
+        step_sleep: Seconds to pause between steps (defaults to BACKUP_STEP_SLEEP)
+
+    Returns:
+        int: Size of the copy in bytes
+    """
+    pages = pages or BACKUP_PAGES_PER_STEP
+    step_sleep = BACKUP_STEP_SLEEP if step_sleep is None else step_sleep
+
+    def pause_between_steps(status, remaining, total):
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    source = sqlite3.connect(db_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=pages, progress=pause_between_steps)
+    finally:
+        dest.close()
+        source.close()
+
+    return os.path.getsize(dest_path)
+
+def ensure_chunk_dir():
+    """Create the shared content-addressed chunk store if it doesn't exist"""
+    chunk_dir = os.path.join(ensure_backup_dir(), 'chunks')
+    os.makedirs(chunk_dir, exist_ok=True)
+    return chunk_dir
+
+def chunk_path(chunk_dir, chunk_hash):
+    """Return the storage path of a chunk, fanned out by hash prefix"""
+    return os.path.join(chunk_dir, chunk_hash[:2], f"{chunk_hash}.z")
+
+def store_chunks(file_path, chunk_dir, chunk_size=None):
+    """
+    Split a file into fixed-size chunks and store each one by its SHA-256.
+    
+    Chunks already in the store are not written again, so unchanged regions
+    of the database cost nothing in later backups.
+    
+    Args:
+        file_path: Path of the file to store
+        chunk_dir: Path of the chunk store
+        chunk_size: Bytes per chunk (defaults to BACKUP_CHUNK_SIZE)
         
-        # Close connection
+    Returns:
+        tuple: (list of chunk hashes in file order, compressed bytes newly written)
+    """
+    chunk_size = chunk_size or BACKUP_CHUNK_SIZE
+    hashes = []
+    new_bytes = 0
+    
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            
+            chunk_hash = hashlib.sha256(data).hexdigest()
+            hashes.append(chunk_hash)
+            
+            path = chunk_path(chunk_dir, chunk_hash)
+            if os.path.exists(path):
+                continue
+            
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zlib.compress(data, 6)
+            with open(path + ".tmp", 'wb') as out:
+                out.write(compressed)
+            os.replace(path + ".tmp", path)
+            new_bytes += len(compressed)
+    
+    return hashes, new_bytes
+
+def assemble_chunks(manifest, chunk_dir, dest_path):
+    """
+    Rebuild a database file from a chunk manifest, verifying every chunk.
+    
+    Args:
+        manifest: Parsed chunks.json of a backup
+        chunk_dir: Path of the chunk store
+        dest_path: Path of the file to write
+        
+    Raises:
+        ValueError: If a chunk is missing or does not match its hash
+    """
+    with open(dest_path, 'wb') as out:
+        for chunk_hash in manifest["chunks"]:
+            path = chunk_path(chunk_dir, chunk_hash)
+            if not os.path.exists(path):
+                raise ValueError(f"Missing backup chunk {chunk_hash}")
+            
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            if hashlib.sha256(data).hexdigest() != chunk_hash:
+                raise ValueError(f"Corrupted backup chunk {chunk_hash}")
+            out.write(data)
+
+def prune_backups(retention_days=None, keep_min=None):
+    """
+    Apply the retention policy and drop chunks no remaining backup uses.
+    
+    Args:
+        retention_days: Delete backups older than this many days
+            (defaults to BACKUP_RETENTION_DAYS)
+        keep_min: Always keep this many of the newest backups
+            (defaults to BACKUP_KEEP_MIN)
+        
+    Returns:
+        int: Number of backups deleted
+    """
+    retention_days = BACKUP_RETENTION_DAYS if retention_days is None else retention_days
+    keep_min = BACKUP_KEEP_MIN if keep_min is None else keep_min
+    backup_dir = ensure_backup_dir()
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    
+    backups = sorted(
+        (dir_name for dir_name in os.listdir(backup_dir) if dir_name.startswith("backup_")),
+        reverse=True
+    )
+    
+    deleted = 0
+    for dir_name in backups[keep_min:]:
+        try:
+            timestamp = datetime.strptime(dir_name.split("_", 1)[1], "%Y-%m-%d_%H-%M-%S")
+        except ValueError:
+            continue
+        if timestamp < cutoff:
+            shutil.rmtree(os.path.join(backup_dir, dir_name), ignore_errors=True)
+            remove_manifest_entry(dir_name)
+            deleted += 1
+    
+    # Garbage-collect chunks that are no longer referenced by a backup or a WAL archive base
+    chunk_dir = os.path.join(backup_dir, 'chunks')
+    if os.path.exists(chunk_dir):
+        manifest_paths = [
+            os.path.join(backup_dir, dir_name, "chunks.json")
+            for dir_name in os.listdir(backup_dir) if dir_name.startswith("backup_")
+        ]
+        bases_dir = os.path.join(backup_dir, 'wal_archive', 'bases')
+        if os.path.exists(bases_dir):
+            manifest_paths += [
+                os.path.join(bases_dir, file_name)
+                for file_name in os.listdir(bases_dir) if file_name.endswith(".json")
+            ]
+        
+        referenced = set()
+        for manifest_path in manifest_paths:
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    referenced.update(json.load(f)["chunks"])
+        
+        for prefix in os.listdir(chunk_dir):
+            prefix_dir = os.path.join(chunk_dir, prefix)
+            for file_name in os.listdir(prefix_dir):
+                if file_name.split(".", 1)[0] not in referenced:
+                    os.remove(os.path.join(prefix_dir, file_name))
+    
+    if deleted:
+        logger.info(f"Pruned {deleted} backups older than {retention_days} days")
+    return deleted
+
+def file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def count_rows(db_path, tables):
+    """Return the row count of each table that exists in a database"""
+    conn = sqlite3.connect(db_path)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in tables if table in existing
+        }
+    finally:
         conn.close()
+
+def checksum_backup_files(backup_path):
+    """Return SHA-256 checksums of the files in a backup directory"""
+    return {
+        file_name: file_sha256(os.path.join(backup_path, file_name))
+        for file_name in sorted(os.listdir(backup_path))
+        if file_name != "backup_info.json" and os.path.isfile(os.path.join(backup_path, file_name))
+    }
+
+def load_manifest():
+    """
+    Load the backup catalog, rebuilding it from the backup directories if missing
+    
+    Returns:
+        dict: {"backups": {backup_id: entry}}
+    """
+    manifest_path = os.path.join(ensure_backup_dir(), MANIFEST_FILE)
+    with _manifest_lock:
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    return json.load(f)
+            except ValueError as e:
+                logger.error(f"Backup manifest unreadable, rebuilding: {str(e)}")
+        manifest = rebuild_manifest()
+        save_manifest(manifest)
+        return manifest
+
+def save_manifest(manifest):
+    """Write the backup catalog atomically"""
+    manifest_path = os.path.join(ensure_backup_dir(), MANIFEST_FILE)
+    with _manifest_lock:
+        with open(manifest_path + ".tmp", 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+def update_manifest_entry(backup_id, entry):
+    """Add or replace a backup's catalog entry"""
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest["backups"][backup_id] = entry
+        save_manifest(manifest)
+
+def remove_manifest_entry(backup_id):
+    """Drop a deleted backup from the catalog"""
+    with _manifest_lock:
+        manifest = load_manifest()
+        if manifest["backups"].pop(backup_id, None) is not None:
+            save_manifest(manifest)
+
+def rebuild_manifest():
+    """
+    Build a catalog from the backup directories on disk
+    
+    Used for backups taken before the catalog existed. Checksums are left
+    empty and recorded the first time the backup is verified.
+    
+    Returns:
+        dict: {"backups": {backup_id: entry}}
+    """
+    backup_dir = ensure_backup_dir()
+    backups = {}
+    for dir_name in os.listdir(backup_dir):
+        if not dir_name.startswith("backup_"):
+            continue
+        try:
+            timestamp = datetime.strptime(dir_name.split("_", 1)[1], "%Y-%m-%d_%H-%M-%S")
+        except ValueError:
+            continue
+        
+        info = {}
+        info_path = os.path.join(backup_dir, dir_name, "backup_info.json")
+        if os.path.exists(info_path):
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+        
+        backups[dir_name] = {
+            "id": dir_name,
+            "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "mode": info.get("mode", "full"),
+            "size": info.get("database_size"),
+            "bytes_written": info.get("bytes_written"),
+            "row_counts": {},
+            "database_sha256": None,
+            "files": {},
+            "status": "unverified",
+            "verified_at": None
+        }
+    return {"backups": backups}
+
+def verify_backup(backup_id, entry):
+    """
+    Check a backup's file checksums and the integrity of its database
+    
+    Args:
+        backup_id: ID of the backup to verify
+        entry: Its catalog entry
+        
+    Returns:
+        dict: Catalog changes (status, verified_at and, for legacy entries,
+            checksums), or None if the backup was pruned while being checked
+    """
+    backup_dir = ensure_backup_dir()
+    backup_path = os.path.join(backup_dir, backup_id)
+    changes = {"verified_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    temp_path = None
+    
+    try:
+        if not os.path.isdir(backup_path):
+            raise ValueError("Backup directory is missing")
+        
+        files = checksum_backup_files(backup_path)
+        if entry.get("files"):
+            for file_name, checksum in entry["files"].items():
+                if files.get(file_name) != checksum:
+                    raise ValueError(f"Checksum mismatch for {file_name}")
+        else:
+            changes["files"] = files
         
-        return records
+        db_file = os.path.join(backup_path, "database.db")
+        manifest_path = os.path.join(backup_path, "chunks.json")
+        if not os.path.exists(db_file) and os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                temp_path = os.path.join(backup_path, "database.db.verify")
+                assemble_chunks(json.load(f), os.path.join(backup_dir, 'chunks'), temp_path)
+            db_file = temp_path
+        
+        if not os.path.exists(db_file):
+            if not any(find_table_export(backup_path, table) for table in ["distributor", "target", "actual", "user"]):
+                raise ValueError("Backup holds no database copy or table exports")
+        else:
+            if entry.get("database_sha256") and file_sha256(db_file) != entry["database_sha256"]:
+                raise ValueError("Database checksum mismatch")
+            conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+            try:
+                integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+            if integrity != "ok":
+                raise ValueError(f"Integrity check failed: {integrity}")
+        
+        changes["status"] = "ok"
     except Exception as e:
-        logger.error(f"Error backing up table {table_name}: {str(e)}")
-        return []
+        # A backup pruned by a concurrent backup run is gone, not broken
+        if not os.path.isdir(backup_path):
+            logger.info(f"Backup {backup_id} was removed while being verified; skipping it")
+            return None
+        logger.error(f"Verification of backup {backup_id} failed: {str(e)}")
+        changes["status"] = "failed"
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    return changes
 
-def perform_backup():
-    """Perform a full backup of the database to local storage"""
+def verify_backups(backup_ids=None, max_workers=4, progress=None):
+    """
+    Verify backups in a thread pool and record the results in the catalog
+    
+    Backups whose directory disappears before or during the check (pruned
+    by a backup running meanwhile) are skipped rather than reported failed.
+    
+    Args:
+        backup_ids: IDs to verify (defaults to every catalogued backup)
+        max_workers: Number of verifier threads
+        progress: Optional callable receiving (checked, total) after each backup
+        
+    Returns:
+        dict: Backup ID -> "ok" or "failed"
+    """
+    progress = progress or (lambda checked, total: None)
+    entries = load_manifest()["backups"]
+    backup_ids = [backup_id for backup_id in (backup_ids or list(entries)) if backup_id in entries]
+    progress(0, len(backup_ids))
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(verify_backup, backup_id, entries[backup_id]): backup_id
+            for backup_id in backup_ids
+        }
+        for checked, future in enumerate(as_completed(futures), 1):
+            changes = future.result()
+            if changes is not None:
+                results[futures[future]] = changes
+            progress(checked, len(backup_ids))
+    
+    with _manifest_lock:
+        manifest = load_manifest()
+        for backup_id, changes in results.items():
+            if backup_id in manifest["backups"]:
+                manifest["backups"][backup_id].update(changes)
+        save_manifest(manifest)
+    
+    return {backup_id: changes["status"] for backup_id, changes in results.items()}
+
+def start_verification(backup_ids=None):
+    """
+    Verify backups in a background thread
+    
+    Verification assembles and integrity-checks every backup, which takes
+    time in proportion to their number and size, so it stays out of the
+    request. get_backup_status() reports its progress.
+    
+    Args:
+        backup_ids: IDs to verify (defaults to every catalogued backup)
+        
+    Returns:
+        bool: Whether verification was started (False if one is already running)
+    """
+    with _backup_status_lock:
+        if _verify_status["state"] == "running":
+            return False
+        _verify_status.clear()
+        _verify_status.update({
+            "state": "running",
+            "checked": 0,
+            "total": None,
+            "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "finished_at": None,
+            "message": None
+        })
+    
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_run_verification, backup_ids), daemon=True).start()
+    return True
+
+def _update_verify_status(**changes):
+    with _backup_status_lock:
+        _verify_status.update(changes)
+
+def _run_verification(backup_ids):
+    state = "failed"
+    try:
+        results = verify_backups(
+            backup_ids, progress=lambda checked, total: _update_verify_status(checked=checked, total=total)
+        )
+        failed = [backup_id for backup_id, status in results.items() if status != "ok"]
+        if failed:
+            message = f"{len(failed)} of {len(results)} backups failed verification: {', '.join(failed)}"
+        else:
+            state = "succeeded"
+            message = f"All {len(results)} backups verified successfully"
+    except Exception as e:
+        logger.error(f"Backup verification failed: {str(e)}")
+        message = str(e)
+    _update_verify_status(
+        state=state, message=message, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    )
+
+def perform_backup(include_json=None, mode=None, progress=None, result=None, db_path=None):
+    """
+    Perform a backup of the database to local storage
+
+    In incremental mode the snapshot is stored as compressed chunks in a
+    shared content-addressed store, so each run only writes the chunks that
+    changed since earlier backups. The retention policy is applied afterwards.
+
+    Args:
+        include_json: Also write per-table JSON exports. Defaults to the
+            BACKUP_JSON_EXPORT environment variable (off unless "true").
+        mode: "incremental" or "full" (defaults to BACKUP_MODE)
+        progress: Optional callable receiving the name of each step as it starts
+        result: Optional dict filled with the backup's id, duration_seconds,
+            database_size and bytes_written when it succeeds
+        db_path: Database to back up (defaults to the current app's DATABASE_PATH)
+
+    Returns:
+        bool: Success status
+    """
+    progress = progress or (lambda step: None)
+    with _backup_lock:
+        success = _perform_backup(resolve_database_path(db_path), include_json, mode or BACKUP_MODE, progress, result)
+        if success:
+            try:
+                progress("prune")
+                prune_backups()
+            except Exception as e:
+                logger.error(f"Pruning backups failed: {str(e)}")
+        return success
+
+def _perform_backup(db_path, include_json, mode, progress, result=None):
     backup_dir = ensure_backup_dir()
-    db_path = os.environ.get("DATABASE_PATH", "instance/distributor_tracker.db")
     tables = ["distributor", "target", "actual", "user"]
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     backup_id = f"backup_{timestamp}"
+    if include_json is None:
+        include_json = os.environ.get("BACKUP_JSON_EXPORT", "false").lower() == "true"
     
+    started = time.perf_counter()
+    backup_path = os.path.join(backup_dir, backup_id)
+    catalogued = False
     try:
         # Create backup directory for this backup
-        backup_path = os.path.join(backup_dir, backup_id)
         os.makedirs(backup_path)
         
-        # Backup each table
-        for table in tables:
-            data = backup_table(db_path, table)
-            if not data:
-                continue
+        # Copy a consistent snapshot of the database
+        progress("snapshot")
+        db_backup_path = os.path.join(backup_path, "database.db")
+        database_size = copy_database(db_path, db_backup_path)
+        bytes_written = database_size
+        database_sha256 = file_sha256(db_backup_path)
+        row_counts = count_rows(db_backup_path, tables)
+        
+        # Optionally export each table as newline-delimited JSON
+        if include_json:
+            progress("export")
+            compress = os.environ.get("BACKUP_JSON_COMPRESS", "true").lower() == "true"
+            for table in tables:
+                file_path, row_count = backup_table(
+                    db_backup_path, table, os.path.join(backup_path, f"{table}.ndjson"), compress=compress
+                )
+                bytes_written += os.path.getsize(file_path)
                 
-            # Save as JSON file
-            file_path = os.path.join(backup_path, f"{table}.json")
-            with open(file_path, 'w') as f:
-                json.dump(data, f)
-            
-            logger.info(f"Saved {table} backup with {len(data)} records to {file_path}")
+                logger.info(f"Saved {table} backup with {row_count} records to {file_path}")
         
-        # Copy database file
-        db_backup_path = os.path.join(backup_path, "database.db")
-        shutil.copy2(db_path, db_backup_path)
+        # Replace the plain copy with deduplicated chunks
+        if mode == "incremental":
+            progress("chunks")
+            hashes, new_bytes = store_chunks(db_backup_path, ensure_chunk_dir())
+            manifest_path = os.path.join(backup_path, "chunks.json")
+            with open(manifest_path, 'w') as f:
+                json.dump({"chunk_size": BACKUP_CHUNK_SIZE, "size": database_size, "chunks": hashes}, f)
+            os.remove(db_backup_path)
+            bytes_written += new_bytes + os.path.getsize(manifest_path) - database_size
         
-        logger.info(f"Local backup completed: {backup_id}")
+        # Record how long the run took and how much it wrote
+        duration = time.perf_counter() - started
+        with open(os.path.join(backup_path, "backup_info.json"), 'w') as f:
+            json.dump({
+                "id": backup_id,
+                "mode": mode,
+                "duration_seconds": round(duration, 3),
+                "database_size": database_size,
+                "bytes_written": bytes_written,
+                "json_export": include_json
+            }, f)
+        
+        # Add the backup to the catalog with checksums of everything it holds
+        progress("catalog")
+        update_manifest_entry(backup_id, {
+            "id": backup_id,
+            "timestamp": datetime.strptime(timestamp, "%Y-%m-%d_%H-%M-%S").strftime("%Y-%m-%d %H:%M:%S"),
+            "mode": mode,
+            "size": database_size,
+            "bytes_written": bytes_written,
+            "row_counts": row_counts,
+            "database_sha256": database_sha256,
+            "files": checksum_backup_files(backup_path),
+            "status": "unverified",
+            "verified_at": None
+        })
+        catalogued = True
+        
+        if result is not None:
+            result.update({
+                "id": backup_id,
+                "duration_seconds": duration,
+                "database_size": database_size,
+                "bytes_written": bytes_written
+            })
+        
+        logger.info(f"Local backup completed: {backup_id} ({mode}, {bytes_written} bytes in {duration:.2f}s)")
         return True
     
     except Exception as e:
-        logger.error(f"Backup failed: {str(e)}")
+        logger.error(f"Backup failed after {time.perf_counter() - started:.2f}s: {str(e)}")
+        # A partial backup must not be catalogued or picked up by rebuild_manifest later
+        shutil.rmtree(backup_path, ignore_errors=True)
+        if catalogued:
+            remove_manifest_entry(backup_id)
         return False
 
-def start_backup_scheduler():
-    """Start a scheduler to run backups three times a week."""
+def lower_process_priority(nice=None, idle_io=None):
+    """
+    Lower the CPU and disk priority of the current process
+    
+    On Windows the process enters background mode, which lowers both. On
+    other platforms the nice value is raised and, on Linux, the process is
+    moved to the idle I/O scheduling class. Failures are logged and ignored.
+    
+    Args:
+        nice: Amount to raise the nice value by (defaults to BACKUP_NICE)
+        idle_io: Use idle I/O priority (defaults to BACKUP_IDLE_IO)
+    """
+    nice = BACKUP_NICE if nice is None else nice
+    idle_io = BACKUP_IDLE_IO if idle_io is None else idle_io
+    
+    try:
+        if os.name == "nt":
+            PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN)
+            return
+        
+        if nice:
+            os.nice(nice)
+        
+        # ioprio_set(IOPRIO_WHO_PROCESS, self, IOPRIO_CLASS_IDLE); there is no os wrapper for it
+        syscall_numbers = {"x86_64": 251, "aarch64": 30, "i386": 289, "i686": 289}
+        syscall_number = syscall_numbers.get(platform.machine())
+        if idle_io and platform.system() == "Linux" and syscall_number:
+            IOPRIO_WHO_PROCESS, IOPRIO_CLASS_IDLE = 1, 3
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << 13) != 0:
+                raise OSError(ctypes.get_errno(), "ioprio_set failed")
+    except Exception as e:
+        logger.warning(f"Could not lower backup process priority: {str(e)}")
+
+def _backup_process_main(conn, include_json, mode, db_path):
+    """Entry point of the backup child process; reports each step over the pipe"""
+    lower_process_priority()
+    try:
+        result = {}
+        success = perform_backup(
+            include_json, mode, progress=lambda step: conn.send({"step": step}), result=result, db_path=db_path
+        )
+        conn.send({"state": "succeeded" if success else "failed", "result": result})
+    except Exception as e:
+        conn.send({"state": "failed", "message": str(e)})
+    finally:
+        conn.close()
+
+def get_backup_status():
+    """
+    Return the status of the current or most recent backup process
+    
+    Returns:
+        dict: state ("idle", "running", "succeeded" or "failed"), and when a
+            backup has run: step, pid, started_at, finished_at and message.
+            verification holds the state of the most recent verification,
+            and once one has run: checked, total, started_at, finished_at
+            and message
+    """
+    with _backup_status_lock:
+        status = dict(_backup_status)
+        status["verification"] = dict(_verify_status)
+        return status
+
+def _update_backup_status(**changes):
+    with _backup_status_lock:
+        _backup_status.update(changes)
+
+def run_backup_process(include_json=None, mode=None, wait=True, db_path=None):
+    """
+    Run a backup in a separate low-priority process
+    
+    The backup's serialisation and file copying then compete with request
+    handling neither for the GIL nor, at idle I/O priority, for the disk.
+    The child reports its progress over a pipe and get_backup_status()
+    reflects it. Only one backup process runs at a time.
+    
+    Args:
+        include_json: Passed to perform_backup
+        mode: Passed to perform_backup
+        wait: Block until the backup finishes; otherwise it is supervised
+            from a background thread
+        db_path: Database to back up (defaults to the current app's DATABASE_PATH)
+        
+    Returns:
+        bool: Success status when waiting; otherwise whether the backup was
+            started (False if one is already running)
+    """
+    # Resolved here, in the caller's app context; the child has no app
+    db_path = resolve_database_path(db_path)
+    with _backup_status_lock:
+        if _backup_status["state"] == "running":
+            logger.warning("Backup already running; not starting another")
+            return False
+        _backup_status.clear()
+        _backup_status.update({
+            "state": "running",
+            "step": "starting",
+            "pid": None,
+            "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "finished_at": None,
+            "message": None
+        })
+    
+    if wait:
+        return _supervise_backup_process(include_json, mode, db_path)
+    
+    # The supervising thread carries on the caller's trace
+    context = contextvars.copy_context()
+    threading.Thread(
+        target=context.run, args=(_supervise_backup_process, include_json, mode, db_path), daemon=True
+    ).start()
+    return True
+
+def _supervise_backup_process(include_json, mode, db_path):
+    with span("backup.process", **{"backup.mode": mode or BACKUP_MODE}) as backup_span:
+        succeeded = _run_backup_child(include_json, mode, db_path, backup_span)
+        if backup_span is not None and not succeeded:
+            backup_span.set_error("Backup failed")
+        return succeeded
+
+def _run_backup_child(include_json, mode, db_path, backup_span=None):
+    # Spawned rather than forked so the child inherits none of the web process's threads or connections
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    state = "failed"
+    message = None
+    result = {}
+    started = time.perf_counter()
+    # Each step the child reports is traced as a span lasting until the next one
+    step_span = None
+    
+    # The child takes _backup_lock itself for the backup and pruning, which
+    # serialises it with WAL archive bases and with other processes' backups
+    try:
+        process = context.Process(
+            target=_backup_process_main, args=(child_conn, include_json, mode, db_path),
+            name="backup", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        _update_backup_status(pid=process.pid)
+        
+        while True:
+            if parent_conn.poll(1):
+                try:
+                    update = parent_conn.recv()
+                except EOFError:
+                    break
+                if "state" in update:
+                    state = update["state"]
+                    message = update.get("message")
+                    result = update.get("result") or {}
+                else:
+                    _update_backup_status(**update)
+                    if step_span is not None:
+                        step_span.end()
+                    step_span = start_span(f"backup.{update['step']}")
+            elif not process.is_alive():
+                break
+        
+        process.join()
+        if state == "failed" and message is None and process.exitcode:
+            message = f"Backup process exited with code {process.exitcode}"
+    except Exception as e:
+        message = str(e)
+    finally:
+        parent_conn.close()
+        if step_span is not None:
+            step_span.end()
+    
+    _update_backup_status(
+        state=state, message=message, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    )
+    BACKUPS.inc(result=state)
+    BACKUP_DURATION.observe(result.get("duration_seconds", time.perf_counter() - started))
+    if result:
+        BACKUP_SIZE.set(result["database_size"])
+        BACKUP_WRITTEN.set(result["bytes_written"])
+        if backup_span is not None:
+            backup_span.set_attribute("backup.id", result["id"])
+            backup_span.set_attribute("backup.database_size", result["database_size"])
+            backup_span.set_attribute("backup.bytes_written", result["bytes_written"])
+    if state == "succeeded":
+        logger.info("Backup process completed")
+    else:
+        logger.error(f"Backup process failed: {message or 'see backup log output'}")
+    return state == "succeeded"
+
+def start_backup_scheduler(db_path):
+    """
+    Start a scheduler to run backups three times a week.
+    
+    Args:
+        db_path: Database to back up and archive; jobs run outside any app context
+    """
     scheduler = BackgroundScheduler()
     
-    # Run backups three times a week:
+    # Run backups three times a week, each in a low-priority child process:
     # 1. Monday at 3 PM
     # 2. Wednesday at 12 PM
     # 3. Saturday at 11 AM
-    scheduler.add_job(perform_backup, 'cron', day_of_week='mon', hour=15)  # Monday 3 PM
-    scheduler.add_job(perform_backup, 'cron', day_of_week='wed', hour=12)  # Wednesday 12 PM
-    scheduler.add_job(perform_backup, 'cron', day_of_week='sat', hour=11)  # Saturday 11 AM
+    job_args = {"db_path": db_path}
+    scheduler.add_job(run_backup_process, 'cron', day_of_week='mon', hour=15, kwargs=job_args)  # Monday 3 PM
+    scheduler.add_job(run_backup_process, 'cron', day_of_week='wed', hour=12, kwargs=job_args)  # Wednesday 12 PM
+    scheduler.add_job(run_backup_process, 'cron', day_of_week='sat', hour=11, kwargs=job_args)  # Saturday 11 AM
     
     # Start the scheduler
     scheduler.start()
     logger.info("Backup scheduler started. Backups will run three times a week: Monday at 3 PM, Wednesday at 12 PM, and Saturday at 11 AM.")
     
+    # Delete rows kept only for a while, such as idempotency keys
+    from retention import start_retention_jobs
+    start_retention_jobs(scheduler, db_path)
+    
+    # Archive the WAL continuously so changes between backups can be recovered
+    from wal_archive import start_wal_archiver
+    try:
+        start_wal_archiver(scheduler, db_path)
+    except Exception as e:
+        logger.error(f"WAL archiver failed to start: {str(e)}")
+    
     return scheduler
 
-def restore_from_backup(backup_id):
+def stop_backup_scheduler(scheduler):
+    """Stop a scheduler started by start_backup_scheduler, and the WAL archiver"""
+    from wal_archive import stop_wal_archiver
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    stop_wal_archiver()
+    logger.info("Backup scheduler stopped")
+
+def quote_identifier(name):
+    """Quote a table or column name for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+def restore_tables_from_exports(db_path, backup_path, tables, chunk_size=5000):
+    """
+    Bulk-load table exports from a backup directory in one transaction.
+    
+    Records are streamed from each export and inserted with executemany in
+    chunks. The chunks share one transaction rather than committing one by
+    one: the load goes into a temporary file that is only swapped in once
+    complete, so a failed restore leaves nothing half-loaded. Column names
+    come from the export and must exist in the table. Secondary indexes and
+    triggers on the table are dropped for the load and recreated afterwards,
+    and durability PRAGMAs are relaxed while the transaction runs. Because
+    triggers are suspended, the restored rows are not written to the change
+    log; change feed consumers should resync.
+    
+    Args:
+        db_path: Path to the SQLite database to load into
+        backup_path: Backup directory holding the exports
+        tables: Table names to restore, in dependency order
+        chunk_size: Rows per executemany call
+        
+    Returns:
+        dict: Table name -> number of rows restored
+    
+    Raises:
+        ValueError: If an export has a column the table doesn't
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    restored = {}
+    try:
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        
+        try:
+            for table in tables:
+                json_file = find_table_export(backup_path, table)
+                if not json_file:
+                    continue
+                
+                # Explicit indexes and triggers; automatic UNIQUE indexes cannot be dropped
+                schema_objects = conn.execute(
+                    "SELECT type, name, sql FROM sqlite_master "
+                    "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                    (table,)
+                ).fetchall()
+                for object_type, name, _ in schema_objects:
+                    conn.execute(f'DROP {object_type.upper()} "{name}"')
+                
+                table_sql = quote_identifier(table)
+                conn.execute(f"DELETE FROM {table_sql}")
+                
+                records = iter_backup_records(json_file)
+                first = next(records, None)
+                count = 0
+                if first is not None:
+                    columns = list(first.keys())
+                    table_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_sql})")}
+                    unknown = [col for col in columns if col not in table_columns]
+                    if unknown:
+                        raise ValueError(f"Backup of {table} has columns the table doesn't: {', '.join(unknown)}")
+                    placeholders = ", ".join(["?" for _ in columns])
+                    column_str = ", ".join(quote_identifier(col) for col in columns)
+                    sql = f"INSERT INTO {table_sql} ({column_str}) VALUES ({placeholders})"
+                    
+                    chunk = [tuple(first[col] for col in columns)]
+                    for record in records:
+                        chunk.append(tuple(record.get(col) for col in columns))
+                        if len(chunk) >= chunk_size:
+                            conn.executemany(sql, chunk)
+                            count += len(chunk)
+                            chunk = []
+                    if chunk:
+                        conn.executemany(sql, chunk)
+                        count += len(chunk)
+                
+                # Rebuild indexes in one pass over the loaded data, then restore triggers
+                for object_type, _, object_sql in sorted(schema_objects, key=lambda obj: obj[0] != 'index'):
+                    conn.execute(object_sql)
+                
+                restored[table] = count
+                logger.info(f"Restored {count} {table} records")
+            
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute(f"PRAGMA synchronous = {synchronous}")
+    finally:
+        conn.close()
+    
+    return restored
+
+def swap_database(temp_path, db_path, quiesce=None):
+    """
+    Check a rebuilt database and atomically replace the live file with it
+    
+    quiesce only holds back this process. Other processes (further app
+    instances) keep their connections and would go on using the replaced
+    file and its deleted WAL, so the swap is refused while any of them is
+    still heartbeating in the lease file.
+    
+    Args:
+        temp_path: Path of the rebuilt database, next to the live one
+        db_path: Path of the live database
+        quiesce: Optional context manager factory that stops database use
+            (and disposes pooled connections) around the swap
+        
+    Raises:
+        ValueError: If the rebuilt database fails PRAGMA integrity_check
+        RuntimeError: If other processes are using the database
+    """
+    conn = sqlite3.connect(temp_path)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if integrity != "ok":
+        raise ValueError(f"Restored database failed integrity check: {integrity}")
+    
+    from leader_election import other_live_processes
+    # The WAL archiver holds its own connections and must start a new chain afterwards
+    from wal_archive import archiver_paused
+    with (quiesce or nullcontext)():
+        others = other_live_processes(db_path)
+        if others:
+            raise RuntimeError(
+                f"Other app processes are using the database ({', '.join(others)}); stop them before restoring"
+            )
+        with archiver_paused():
+            # The old database's WAL must not be replayed onto the new file
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+            os.replace(temp_path, db_path)
+
+def restore_from_backup(backup_id, quiesce=None, db_path=None):
     """
     Restore database from a local backup
     
+    The backup is restored into a temporary file next to the database and
+    checked with PRAGMA integrity_check. Only then is the live file swapped
+    with os.replace while writers are quiesced, so readers see either the
+    old database or the new one, never a mixture.
+    
     Args:
         backup_id: ID of the backup to restore
+        quiesce: Optional context manager factory that stops database use
+            (and disposes pooled connections) around the swap
+        db_path: Database to replace (defaults to the current app's DATABASE_PATH)
         
     Returns:
         bool: Success status
     """
     backup_dir = os.path.join(os.getcwd(), 'backups')
     backup_path = os.path.join(backup_dir, backup_id)
-    db_path = os.environ.get("DATABASE_PATH", "instance/distributor_tracker.db")
+    db_path = resolve_database_path(db_path)
+    temp_path = db_path + ".restore"
     
     if not os.path.exists(backup_path):
         logger.error(f"Backup {backup_id} not found")
         return False
     
     try:
-        # Restore database file
         db_backup = os.path.join(backup_path, "database.db")
+        manifest_path = os.path.join(backup_path, "chunks.json")
+        
         if os.path.exists(db_backup):
-            shutil.copy2(db_backup, db_path)
-            logger.info("Database file restored successfully")
-            return True
-        
-        # Fallback to JSON restoration
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        conn.execute("BEGIN TRANSACTION")
-        
-        for table in ["distributor", "target", "actual", "user"]:
-            json_file = os.path.join(backup_path, f"{table}.json")
-            if not os.path.exists(json_file):
-                continue
-            
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            cursor.execute(f"DELETE FROM {table}")
-            columns = list(data[0].keys())
-            placeholders = ", ".join(["?" for _ in columns])
-            column_str = ", ".join(columns)
-            sql = f"INSERT INTO {table} ({column_str}) VALUES ({placeholders})"
-            
-            for record in data:
-                values = [record[col] for col in columns]
-                cursor.execute(sql, values)
-            
-            logger.info(f"Restored {len(data)} {table} records")
+            # Restore database file
+            shutil.copy2(db_backup, temp_path)
+        elif os.path.exists(manifest_path):
+            # Rebuild the database file from deduplicated chunks
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            assemble_chunks(manifest, os.path.join(backup_dir, 'chunks'), temp_path)
+        else:
+            # Fallback to JSON restoration into a copy of the current database
+            copy_database(db_path, temp_path)
+            restore_tables_from_exports(temp_path, backup_path, ["distributor", "target", "actual", "user"])
+        
+        swap_database(temp_path, db_path, quiesce)
         
-        conn.commit()
-        conn.close()
         logger.info(f"Successfully restored from backup {backup_id}")
         return True
     
     except Exception as e:
         logger.error(f"Restore failed: {str(e)}")
-        try:
-            conn.rollback()
-            conn.close()
-        except:
-            pass
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         return False
 
 # Function to get list of available backups
 def get_available_backups():
     """
-    Get list of local backups
+    Get list of local backups from the backup catalog
     
     Returns:
-        list: Sorted backup IDs with timestamps
+        list: Catalog entries (id, timestamp, size, row counts, status), newest first
     """
-    backup_dir = os.path.join(os.getcwd(), 'backups')
-    backups = []
-    
     try:
-        if os.path.exists(backup_dir):
-            for dir_name in os.listdir(backup_dir):
-                if dir_name.startswith("backup_"):
-                    timestamp_str = dir_name.split("_", 1)[1]
-                    timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d_%H-%M-%S")
-                    backups.append({
-                        "id": dir_name,
-                        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S")
-                    })
-        
+        backups = list(load_manifest()["backups"].values())
         return sorted(backups, key=lambda x: x["timestamp"], reverse=True)
     
     except Exception as e:
         logger.error(f"Error listing backups: {str(e)}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,46 @@
+"""
+Fixtures for the benchmark suite
+
+The app runs against a temporary database seeded with synthetic data.
+BENCH_DISTRIBUTORS (10 to 5000, default 50) and BENCH_YEARS (default 2) set
+the scale. Every run is saved under .benchmarks/ with the commit id in its
+name, so runs can be compared with --benchmark-compare or
+`pytest-benchmark compare`.
+"""
+import os
+from datetime import datetime
+
+import pytest
+
+BENCH_DISTRIBUTORS = int(os.environ.get("BENCH_DISTRIBUTORS", 50))
+BENCH_YEARS = int(os.environ.get("BENCH_YEARS", 2))
+
+def pytest_configure(config):
+    # pytest-benchmark reads its options after this hook, so autosave can be defaulted here
+    if config.pluginmanager.hasplugin("benchmark"):
+        if not (config.option.benchmark_save or config.option.benchmark_autosave):
+            config.option.benchmark_autosave = True
+
+@pytest.fixture(scope="session")
+def bench_app(make_app):
+    """App on a seeded temporary database"""
+    return make_app("bench", distributors=BENCH_DISTRIBUTORS, years=BENCH_YEARS)
+
+@pytest.fixture(scope="session")
+def client(bench_app, login):
+    """Test client logged in as the default admin"""
+    return login(bench_app)
+
+@pytest.fixture
+def app_context(bench_app):
+    with bench_app.app_context():
+        yield
+
+@pytest.fixture(scope="session")
+def period():
+    """Last complete financial year in the data, and a month and week inside it"""
+    from database.synthetic import financial_year_label
+
+    today = datetime.now()
+    fy_start = (today.year if today.month >= 4 else today.year - 1) - 1
+    return {"financial_year": financial_year_label(fy_start), "month": "Jun", "date_range": f"03 Jun {fy_start} - 09 Jun {fy_start}"}
@@ -0,0 +1,124 @@
+"""
+Benchmarks of the hot routes, report generators, batch saves and backups
+
+Run with `python -m pytest benchmarks`; requires pytest-benchmark.
+"""
+import time
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app import db, quiesce_database
+from models import Distributor, Target, Actual
+from database.synthetic import SYNTHETIC_PREFIX
+
+AJAX = {"X-Requested-With": "XMLHttpRequest"}
+
+def get_ok(client, url, **kwargs):
+    response = client.get(url, **kwargs)
+    assert response.status_code == 200, url
+    return response
+
+# Dashboard in JSON mode, as its filters request it
+
+def test_dashboard_month(benchmark, client, period):
+    url = f"/dashboard?financial_year={period['financial_year']}&month={period['month']}"
+    response = benchmark(get_ok, client, url, headers=AJAX)
+    assert response.json["distributor_performance"]
+
+def test_dashboard_all_months(benchmark, client, period):
+    url = f"/dashboard?financial_year={period['financial_year']}&month=All"
+    response = benchmark(get_ok, client, url, headers=AJAX)
+    assert response.json["overall_data"]["actual"] > 0
+
+def test_dashboard_date_range(benchmark, client, period):
+    url = (f"/dashboard?financial_year={period['financial_year']}&month={period['month']}"
+           f"&date_range={period['date_range']}")
+    benchmark(get_ok, client, url, headers=AJAX)
+
+# Listing pages
+
+def test_reports(benchmark, client, period):
+    benchmark(get_ok, client, f"/reports?financial_year={period['financial_year']}&month=All")
+
+def test_targets(benchmark, client, period):
+    benchmark(get_ok, client, f"/targets?financial_year={period['financial_year']}&month={period['month']}")
+
+def test_actuals(benchmark, client, period):
+    benchmark(get_ok, client, f"/actuals?financial_year={period['financial_year']}&month={period['month']}")
+
+# Report generation
+
+def test_generate_performance_data(benchmark, app_context, period):
+    from utils import generate_performance_data
+
+    distributor = Distributor.query.filter(Distributor.name.like(f"{SYNTHETIC_PREFIX}%")).first()
+    period_identifier = f"{period['month']}-{period['financial_year']}"
+    data = benchmark(generate_performance_data, distributor.id, 'Monthly', period_identifier, db, Actual, Target)
+    assert data["target"] > 0
+
+def test_generate_summary_pdf(benchmark, app_context):
+    from utils import generate_summary_pdf
+
+    distributors = Distributor.query.all()
+    pdf = benchmark.pedantic(generate_summary_pdf, args=(distributors, db, Actual, Target), rounds=3)
+    assert pdf.startswith(b"%PDF")
+
+def test_bulk_export_reports(benchmark, client, period):
+    # The Excel reports are written with xlsxwriter
+    pytest.importorskip("xlsxwriter")
+
+    def export():
+        response = client.post("/bulk_export_reports", data={
+            "financial_year": period["financial_year"], "month": period["month"]
+        })
+        assert response.mimetype == "application/zip"
+        return response
+
+    benchmark.pedantic(export, rounds=3)
+
+# Batch saves
+
+def test_save_batch_targets(benchmark, client, app_context, period):
+    distributor_ids = [str(d.id) for d in Distributor.query.all()]
+    form = {
+        "financial_year": period["financial_year"],
+        "month": period["month"],
+        "date_range": period["date_range"],
+        "distributor_ids": distributor_ids,
+        **{f"target_values[{distributor_id}]": "5000" for distributor_id in distributor_ids}
+    }
+    response = benchmark(client.post, "/save_batch_targets", data=form)
+    assert response.status_code == 302
+
+def test_save_batch_sales(benchmark, client, app_context, period):
+    distributor_ids = [str(d.id) for d in Distributor.query.all()]
+    form = {
+        "financial_year": period["financial_year"],
+        "month": period["month"],
+        "date_range": period["date_range"],
+        "distributor_ids": distributor_ids,
+        **{f"sales_values[{distributor_id}]": "1200" for distributor_id in distributor_ids}
+    }
+    response = benchmark(client.post, "/save_batch_sales", data=form)
+    assert response.status_code == 302
+
+# Backup and restore, run in-process to leave out the child process start-up
+
+def wait_for_next_second():
+    # Backup ids have one-second resolution
+    time.sleep(1 - time.time() % 1)
+
+def test_backup(benchmark, app_context):
+    from backup_utils import perform_backup
+
+    assert benchmark.pedantic(perform_backup, setup=wait_for_next_second, rounds=3)
+
+def test_restore(benchmark, app_context):
+    from backup_utils import perform_backup, get_available_backups, restore_from_backup
+
+    wait_for_next_second()
+    assert perform_backup()
+    backup_id = get_available_backups()[0]["id"]
+    assert benchmark.pedantic(restore_from_backup, args=(backup_id,), kwargs={"quiesce": quiesce_database}, rounds=3)
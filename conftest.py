@@ -0,0 +1,61 @@
+"""
+Fixtures shared by the tests and the benchmark suite
+
+Apps are built with make_app on their own temporary database, optionally
+seeded with synthetic data. The working directory is moved to a temporary
+directory first, since backups/ and the WAL archive are written beside it.
+"""
+import pytest
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """Temporary working directory for the session"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        path = tmp_path_factory.mktemp("workdir")
+        monkeypatch.chdir(path)
+        yield path
+
+@pytest.fixture(scope="session")
+def make_app(tmp_path_factory, workdir):
+    """
+    Factory building an initialized app on a fresh temporary database
+
+    Args:
+        name (str): Name of the temporary directory and database file
+        config (dict): Settings applied over the defaults
+        distributors (int): Synthetic distributors to seed, none by default
+        years (int): Years of synthetic targets and actuals per distributor
+
+    Returns:
+        Flask: The app
+    """
+    def make(name, config=None, distributors=0, years=2):
+        from app import create_app, initialize_database, db
+        from db_config import run_in_write_transaction
+        from models import Distributor, Target, Actual
+        from database.synthetic import seed_synthetic_data
+
+        db_path = tmp_path_factory.mktemp(name) / f"{name}.db"
+        app = create_app({
+            "DATABASE_PATH": str(db_path),
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+            **(config or {})
+        })
+        initialize_database(app)
+        if distributors:
+            with app.app_context():
+                run_in_write_transaction(db, lambda: seed_synthetic_data(
+                    db, Distributor, Target, Actual, distributors=distributors, years=years
+                ))
+        return app
+    return make
+
+@pytest.fixture(scope="session")
+def login():
+    """Function returning a new test client for an app, logged in as the default admin"""
+    def login_admin(app):
+        client = app.test_client()
+        response = client.post("/login", data={"username": "admin", "password": "admin123"})
+        assert response.status_code == 302
+        return client
+    return login_admin
@@ -1,6 +1,3 @@
-from app import app, db
-from models import Distributor
-
 DISTRIBUTORS = [
     'Prit Enterprise Retail',
     'Firdos Colddrinks',
@@ -11,18 +8,10 @@ DISTRIBUTORS = [
     'Patel Colddrinks'
 ]
 
-@app.cli.command('init-db')
-def initialize_database():
-    """Create tables and seed initial data"""
-    with app.app_context():
-        db.create_all()
-        
-        # Seed distributors
-        existing = {d.name for d in Distributor.query.all()}
-        for name in DISTRIBUTORS:
-            if name not in existing:
-                db.session.add(Distributor(name=name))
-                print(f'Added distributor: {name}')
-        
-        db.session.commit()
-        print('Database initialization complete')
\ No newline at end of file
+def seed_distributors(db, Distributor):
+    """Add any of the initial distributors that don't exist yet; the caller commits"""
+    existing = {d.name for d in Distributor.query.all()}
+    for name in DISTRIBUTORS:
+        if name not in existing:
+            db.session.add(Distributor(name=name))
+            print(f'Added distributor: {name}')
@@ -0,0 +1,118 @@
+"""
+Synthetic distributors, weekly actuals and monthly targets for benchmarking
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+SYNTHETIC_PREFIX = "Synthetic Distributor "
+AREAS = ["North", "South", "East", "West", "Central", "Coastal", "Highlands", "Metro"]
+MONTHS = ['Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
+
+def financial_year_label(start_year):
+    """Return the label used across the app for the financial year starting in April of start_year"""
+    return f"FY{start_year % 100:02d}-{(start_year + 1) % 100:02d}"
+
+def clear_synthetic_data(db, Distributor, Target, Actual):
+    """Delete synthetic distributors with their targets and actuals; the caller commits"""
+    synthetic_ids = select(Distributor.id).where(Distributor.name.like(f"{SYNTHETIC_PREFIX}%"))
+    db.session.execute(delete(Actual).where(Actual.distributor_id.in_(synthetic_ids)))
+    db.session.execute(delete(Target).where(Target.distributor_id.in_(synthetic_ids)))
+    db.session.execute(delete(Distributor).where(Distributor.name.like(f"{SYNTHETIC_PREFIX}%")))
+
+def seed_synthetic_data(db, Distributor, Target, Actual, distributors=100, years=3,
+                        today=None, seed=42, chunk_size=5000):
+    """
+    Generate synthetic distributors with weekly actuals and monthly targets
+
+    Covers the last `years` financial years up to today. Every distributor
+    gets one actual per week and one monthly target per month, with values
+    drawn around a per-distributor baseline so achievement varies. Rows are
+    inserted with executemany in chunks; the caller commits.
+
+    Args:
+        db: Database session
+        Distributor, Target, Actual: Model classes
+        distributors (int): Number of distributors to create
+        years (int): Financial years of history
+        today (datetime): Last day of generated actuals (defaults to now)
+        seed (int): Random seed, so the same arguments give the same data
+        chunk_size (int): Rows per insert batch
+
+    Returns:
+        dict: Counts of distributors, targets and actuals inserted
+
+    Raises:
+        ValueError: If synthetic distributors already exist
+    """
+    from utils import calculate_periods
+
+    if db.session.execute(
+        select(Distributor.id).where(Distributor.name.like(f"{SYNTHETIC_PREFIX}%")).limit(1)
+    ).first():
+        raise ValueError("Synthetic data already exists; clear it first")
+
+    rng = random.Random(seed)
+    today = today or datetime.now()
+    current_fy_start = today.year if today.month >= 4 else today.year - 1
+    first_fy_start = current_fy_start - years + 1
+
+    db.session.execute(insert(Distributor), [
+        {
+            "name": f"{SYNTHETIC_PREFIX}{number:04d}",
+            "email": f"distributor{number:04d}@example.com",
+            "area": rng.choice(AREAS)
+        }
+        for number in range(1, distributors + 1)
+    ])
+    distributor_ids = db.session.execute(
+        select(Distributor.id).where(Distributor.name.like(f"{SYNTHETIC_PREFIX}%")).order_by(Distributor.id)
+    ).scalars().all()
+    baselines = {distributor_id: rng.uniform(200, 2000) for distributor_id in distributor_ids}
+
+    # Monthly targets for every month of every financial year
+    target_rows = []
+    for fy_start in range(first_fy_start, current_fy_start + 1):
+        label = financial_year_label(fy_start)
+        for month in MONTHS:
+            for distributor_id in distributor_ids:
+                target_rows.append({
+                    "distributor_id": distributor_id,
+                    "period_type": "Monthly",
+                    "period_identifier": f"{month}-{label}",
+                    "target_value": round(baselines[distributor_id] * 4.3 * rng.uniform(0.9, 1.2))
+                })
+    _insert_chunks(db, Target, target_rows, chunk_size)
+
+    # Weekly actuals from the first Monday of the first financial year up to today
+    week_start = datetime(first_fy_start, 4, 1)
+    week_start += timedelta(days=(7 - week_start.weekday()) % 7)
+    actual_count = 0
+    actual_rows = []
+    while week_start <= today:
+        start = week_start.strftime('%Y-%m-%d')
+        end = (week_start + timedelta(days=6)).strftime('%Y-%m-%d')
+        month, quarter, year = calculate_periods(start)
+        for distributor_id in distributor_ids:
+            actual_rows.append({
+                "distributor_id": distributor_id,
+                "week_start_date": start,
+                "week_end_date": end,
+                "actual_sales": round(baselines[distributor_id] * rng.uniform(0.6, 1.3)),
+                "month": month,
+                "quarter": quarter,
+                "year": year
+            })
+        if len(actual_rows) >= chunk_size:
+            actual_count += _insert_chunks(db, Actual, actual_rows, chunk_size)
+            actual_rows = []
+        week_start += timedelta(days=7)
+    actual_count += _insert_chunks(db, Actual, actual_rows, chunk_size)
+
+    return {"distributors": len(distributor_ids), "targets": len(target_rows), "actuals": actual_count}
+
+def _insert_chunks(db, model, rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(model), rows[start:start + chunk_size])
+    return len(rows)
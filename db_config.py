@@ -0,0 +1,185 @@
+import os
+import time
+import random
+import logging
+import threading
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied to every SQLite connection the app opens
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Negative values are KiB, as in PRAGMA cache_size; this is per pooled connection
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -16000))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# Write transactions that still find the database locked are retried this many times
+DB_WRITE_RETRIES = int(os.environ.get("DB_WRITE_RETRIES", 5))
+DB_WRITE_BACKOFF = float(os.environ.get("DB_WRITE_BACKOFF", 0.05))
+DB_WRITE_BACKOFF_MAX = 2.0
+
+# Set while a write transaction is being opened, so its BEGIN takes the write lock up front
+_begin_immediate = ContextVar("begin_immediate", default=False)
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "transactions": 0,
+    "immediate_transactions": 0,
+    "lock_wait_seconds_total": 0.0,
+    "lock_wait_seconds_max": 0.0,
+    "busy_errors": 0,
+    "retries": 0,
+    "failed_writes": 0
+}
+
+def _record(**changes):
+    with _metrics_lock:
+        for key, value in changes.items():
+            if key == "lock_wait_seconds_max":
+                _metrics[key] = max(_metrics[key], value)
+            else:
+                _metrics[key] += value
+
+def get_contention_metrics():
+    """
+    Return counters describing write-lock contention since startup
+
+    Returns:
+        dict: transactions, immediate_transactions, lock_wait_seconds_total,
+            lock_wait_seconds_max, busy_errors, retries and failed_writes
+    """
+    with _metrics_lock:
+        return dict(_metrics)
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_writes(session, flush_context):
+    # Flushed changes are in the transaction but no longer show in session.new/dirty/deleted
+    session.info["flushed_writes"] = True
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_flushed_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("flushed_writes", None)
+
+def has_uncommitted_writes(session):
+    """Return whether a session holds changes, flushed or not, that are not yet committed"""
+    return bool(session.new or session.dirty or session.deleted or session.info.get("flushed_writes"))
+
+def configure_sqlite_engine(engine):
+    """
+    Tune every connection of a SQLite engine and take over transaction control
+
+    Each new connection gets WAL journaling, synchronous=NORMAL, memory
+    mapping, a larger page cache and a busy timeout. pysqlite's own implicit
+    BEGIN is disabled so SQLAlchemy's begin event decides how transactions
+    start: a plain deferred BEGIN for reads, and BEGIN IMMEDIATE inside
+    run_in_write_transaction.
+
+    Args:
+        engine: SQLAlchemy engine for a SQLite database
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(conn):
+        if not _begin_immediate.get():
+            conn.exec_driver_sql("BEGIN")
+            _record(transactions=1)
+            return
+
+        started = time.perf_counter()
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        waited = time.perf_counter() - started
+        _record(transactions=1, immediate_transactions=1,
+                lock_wait_seconds_total=waited, lock_wait_seconds_max=waited)
+
+def configure_database(app, db):
+    """Apply the SQLite connection settings to the app's engine"""
+    with app.app_context():
+        configure_sqlite_engine(db.engine)
+
+def is_busy_error(error):
+    """Return whether an exception means the database was locked by another writer"""
+    message = str(getattr(error, "orig", error)).lower()
+    return "database is locked" in message or "database is busy" in message
+
+def run_in_write_transaction(db, work, retries=None):
+    """
+    Run work in a BEGIN IMMEDIATE transaction and commit it
+
+    Taking the write lock at BEGIN means the transaction cannot fail halfway
+    when another writer commits first; it waits up to the busy timeout
+    instead. If the database is still locked, the transaction is rolled back
+    and retried with exponential backoff and jitter. work must therefore be
+    safe to run again from the start.
+
+    The session must not hold uncommitted changes when this is called:
+    they would not be retried with work or rolled back with it.
+
+    Args:
+        db: Database session
+        work (callable): Performs the session operations and returns a result
+        retries (int): Retries after the first attempt (defaults to DB_WRITE_RETRIES)
+
+    Returns:
+        The value returned by work
+
+    Raises:
+        OperationalError: If the database is still locked after every retry
+        RuntimeError: If the session already holds uncommitted changes
+    """
+    retries = DB_WRITE_RETRIES if retries is None else retries
+
+    session = db.session()
+    if has_uncommitted_writes(session):
+        raise RuntimeError(
+            "run_in_write_transaction called with uncommitted changes in the session; "
+            "commit or roll them back first"
+        )
+    # Any read transaction the session already has open would keep a deferred BEGIN
+    if session.in_transaction():
+        session.rollback()
+
+    for attempt in range(retries + 1):
+        token = _begin_immediate.set(True)
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_busy_error(e):
+                raise
+            _record(busy_errors=1)
+            if attempt == retries:
+                _record(failed_writes=1)
+                logger.error(f"Write transaction gave up after {retries + 1} attempts: {str(e.orig)}")
+                raise
+            _record(retries=1)
+            delay = min(DB_WRITE_BACKOFF * (2 ** attempt), DB_WRITE_BACKOFF_MAX)
+            time.sleep(delay + random.uniform(0, delay))
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            _begin_immediate.reset(token)
@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+
+class DatabaseGate:
+    """
+    Lets requests share the database while allowing one exclusive holder
+
+    Every request enters the gate for its lifetime. An exclusive holder (such
+    as a restore swapping the database file) stops new requests at the gate,
+    waits for in-flight ones to finish, and then runs alone. Requests made by
+    the exclusive holder's own thread are not waited for.
+
+    The gate only covers this process. Other processes sharing the database
+    file are not held back; a restore refuses to run while any are live.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active = 0
+        self._exclusive = False
+        self._local = threading.local()
+
+    def enter(self):
+        """Enter the gate, waiting while an exclusive holder is active"""
+        with self._condition:
+            while self._exclusive:
+                self._condition.wait()
+            self._active += 1
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+
+    def leave(self):
+        """Leave the gate; ignored if this thread never entered"""
+        if getattr(self._local, 'depth', 0) == 0:
+            return
+        self._local.depth -= 1
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self, timeout=30):
+        """
+        Hold the gate exclusively
+
+        Args:
+            timeout (float): Seconds to wait for in-flight requests
+
+        Raises:
+            TimeoutError: If in-flight requests do not finish in time
+        """
+        own = getattr(self._local, 'depth', 0)
+        with self._condition:
+            while self._exclusive:
+                self._condition.wait()
+            self._exclusive = True
+
+            if not self._condition.wait_for(lambda: self._active <= own, timeout):
+                self._exclusive = False
+                self._condition.notify_all()
+                raise TimeoutError("Timed out waiting for in-flight requests to finish")
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+# Shared by all requests in this process
+db_gate = DatabaseGate()
@@ -0,0 +1,365 @@
+import io
+import re
+import csv
+import logging
+from datetime import date, datetime, timedelta
+
+from utils import calculate_periods, upsert_actuals, upsert_targets
+from db_config import run_in_write_transaction
+
+logger = logging.getLogger(__name__)
+
+# Accepted header names for each field (compared lower-cased, spaces as underscores)
+COLUMN_ALIASES = {
+    'distributor': ['distributor', 'distributor_name', 'name'],
+    'week_start_date': ['week_start_date', 'week_start', 'start_date', 'start'],
+    'week_end_date': ['week_end_date', 'week_end', 'end_date', 'end'],
+    'actual_sales': ['actual_sales', 'sales', 'actual', 'cases']
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d %b %Y']
+
+# Rejected rows kept for the report; the rest are only counted
+MAX_REJECTED_ROWS = 1000
+
+def iter_csv_rows(file_obj):
+    """
+    Stream rows from a CSV file without reading it into memory
+
+    Args:
+        file_obj: Binary or text file object
+
+    Yields:
+        list: Raw cell values for each row, starting with the header
+    """
+    if isinstance(file_obj, io.TextIOBase):
+        text_stream = file_obj
+    else:
+        text_stream = io.TextIOWrapper(file_obj, encoding='utf-8-sig', newline='')
+
+    for row in csv.reader(text_stream):
+        yield row
+
+def iter_xlsx_rows(file_obj):
+    """
+    Stream rows from the first sheet of an XLSX workbook
+
+    Args:
+        file_obj: Binary file object or path
+
+    Yields:
+        tuple: Raw cell values for each row, starting with the header
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+def map_columns(header):
+    """
+    Map header cells to field positions
+
+    Args:
+        header (list): Header row
+
+    Returns:
+        dict: Field name -> column index
+
+    Raises:
+        ValueError: If a required column is missing
+    """
+    normalized = [str(cell or '').strip().lower().replace(' ', '_') for cell in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+
+    missing = [field for field in ('distributor', 'week_start_date', 'actual_sales') if field not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return columns
+
+def parse_import_date(value):
+    """
+    Convert a spreadsheet date cell into a 'YYYY-MM-DD' string
+
+    Args:
+        value: datetime, date or string cell value
+
+    Returns:
+        str: Date in 'YYYY-MM-DD' format
+
+    Raises:
+        ValueError: If the value is not a recognised date
+    """
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+
+    text = str(value or '').strip()
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {text!r}")
+
+def import_actuals(file_obj, filename, db, Actual, Distributor, chunk_size=5000):
+    """
+    Import weekly actuals from a CSV or XLSX file in chunked transactions
+
+    Rows are streamed from the file, distributor names are resolved through an
+    in-memory index, and each chunk is upserted and committed on its own so
+    memory stays bounded regardless of the file size.
+
+    Args:
+        file_obj: Binary file object or path of the upload
+        filename (str): Original file name, used to pick the reader
+        db: Database session
+        Actual, Distributor: Database models
+        chunk_size (int): Rows per transaction
+
+    Returns:
+        dict: Import summary with keys:
+            - imported: Number of rows written
+            - rejected_count: Number of rows rejected
+            - rejected: {'row': line number, 'reason': message} for the first
+              MAX_REJECTED_ROWS of them
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        rows = iter_xlsx_rows(file_obj)
+    elif filename.lower().endswith('.csv'):
+        rows = iter_csv_rows(file_obj)
+    else:
+        raise ValueError("Unsupported file type. Upload a .csv or .xlsx file.")
+
+    result = {'imported': 0, 'rejected_count': 0, 'rejected': []}
+
+    header = next(rows, None)
+    if header is None:
+        return result
+    columns = map_columns(header)
+
+    # Distributor name -> id, raw date cell -> ISO date, and week start -> financial periods
+    distributor_index = {
+        name.strip().lower(): distributor_id
+        for distributor_id, name in db.session.query(Distributor.id, Distributor.name)
+    }
+    date_lookup = {}
+    period_lookup = {}
+
+    def lookup_date(value):
+        if value not in date_lookup:
+            date_lookup[value] = parse_import_date(value)
+        return date_lookup[value]
+
+    chunk = []
+    for line_number, row in enumerate(rows, start=2):
+        if not any(cell not in (None, '') for cell in row):
+            continue
+
+        try:
+            name = str(row[columns['distributor']] or '').strip()
+            distributor_id = distributor_index.get(name.lower())
+            if distributor_id is None:
+                raise ValueError(f"Unknown distributor: {name!r}")
+
+            week_start_date = lookup_date(row[columns['week_start_date']])
+            if 'week_end_date' in columns and row[columns['week_end_date']] not in (None, ''):
+                week_end_date = lookup_date(row[columns['week_end_date']])
+            else:
+                week_end_date = None
+
+            try:
+                actual_sales = float(row[columns['actual_sales']])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid sales value: {row[columns['actual_sales']]!r}")
+            if actual_sales < 0:
+                raise ValueError("Sales value cannot be negative")
+        except (IndexError, ValueError) as e:
+            result['rejected_count'] += 1
+            if len(result['rejected']) < MAX_REJECTED_ROWS:
+                result['rejected'].append({'row': line_number, 'reason': str(e)})
+            continue
+
+        if week_start_date not in period_lookup:
+            default_end = date.fromisoformat(week_start_date) + timedelta(days=6)
+            period_lookup[week_start_date] = calculate_periods(week_start_date) + (default_end.isoformat(),)
+        month, quarter, year, default_end_date = period_lookup[week_start_date]
+
+        chunk.append({
+            'distributor_id': distributor_id,
+            'week_start_date': week_start_date,
+            'week_end_date': week_end_date or default_end_date,
+            'actual_sales': actual_sales,
+            'month': month,
+            'quarter': quarter,
+            'year': year
+        })
+
+        if len(chunk) >= chunk_size:
+            result['imported'] += _write_chunk(db, Actual, chunk)
+            chunk = []
+
+    if chunk:
+        result['imported'] += _write_chunk(db, Actual, chunk)
+
+    logger.info(f"Imported {result['imported']} actuals from {filename}, rejected {result['rejected_count']} rows")
+    return result
+
+def _write_chunk(db, Actual, chunk):
+    """Upsert one chunk of actuals and commit it as its own write transaction"""
+    run_in_write_transaction(db, lambda: upsert_actuals(db, Actual, chunk))
+    return len(chunk)
+
+MONTH_NAMES = ['Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
+
+def _resolve_distributor(value, distributor_index, distributor_ids):
+    """Resolve a distributor given by id or by name, raising ValueError if unknown"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value in distributor_ids:
+            return value
+    elif isinstance(value, str):
+        distributor_id = distributor_index.get(value.strip().lower())
+        if distributor_id is not None:
+            return distributor_id
+    raise ValueError(f"Unknown distributor: {value!r}")
+
+def _parse_amount(value, field):
+    """Parse a non-negative numeric field, raising ValueError otherwise"""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid {field} value: {value!r}")
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field} value: {value!r}")
+    if amount < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return amount
+
+def ingest_records(payload, db, Actual, Target, Distributor):
+    """
+    Validate and upsert a batch of actual and target records in one transaction
+
+    Every record is validated up front against a single distributor lookup;
+    valid records are then written with upsert_actuals/upsert_targets and the
+    caller commits once for the whole batch. Invalid records are reported and
+    skipped without failing the rest of the batch.
+
+    Args:
+        payload (dict): JSON body with optional 'actuals' and 'targets' arrays.
+            Actuals: {distributor, week_start, week_end, sales}
+            Targets: {distributor, fy, month, target}
+        db: Database session
+        Actual, Target, Distributor: Database models
+
+    Returns:
+        dict: Per-record results with keys 'actuals' and 'targets', each a list
+            of {'index', 'status', 'error'} where status is 'new', 'updated'
+            or 'rejected'
+
+    Raises:
+        ValueError: If the payload is not shaped like a batch
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    actual_records = payload.get('actuals') or []
+    target_records = payload.get('targets') or []
+    if not isinstance(actual_records, list) or not isinstance(target_records, list):
+        raise ValueError("'actuals' and 'targets' must be arrays")
+
+    distributor_index = {}
+    distributor_ids = set()
+    for distributor_id, name in db.session.query(Distributor.id, Distributor.name):
+        distributor_index[name.strip().lower()] = distributor_id
+        distributor_ids.add(distributor_id)
+
+    period_lookup = {}
+    results = {'actuals': [], 'targets': []}
+
+    # Validate actuals
+    actual_rows = []
+    actual_keys = []
+    for index, record in enumerate(actual_records):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("Record must be an object")
+            distributor_id = _resolve_distributor(record.get('distributor'), distributor_index, distributor_ids)
+            week_start_date = parse_import_date(record.get('week_start'))
+            week_end_date = parse_import_date(record.get('week_end'))
+            if week_end_date < week_start_date:
+                raise ValueError("week_end is before week_start")
+            actual_sales = _parse_amount(record.get('sales'), 'sales')
+        except ValueError as e:
+            results['actuals'].append({'index': index, 'status': 'rejected', 'error': str(e)})
+            actual_keys.append(None)
+            continue
+
+        if week_start_date not in period_lookup:
+            period_lookup[week_start_date] = calculate_periods(week_start_date)
+        month, quarter, year = period_lookup[week_start_date]
+
+        actual_rows.append({
+            'distributor_id': distributor_id,
+            'week_start_date': week_start_date,
+            'week_end_date': week_end_date,
+            'actual_sales': actual_sales,
+            'month': month,
+            'quarter': quarter,
+            'year': year
+        })
+        actual_keys.append((distributor_id, week_start_date, week_end_date))
+        results['actuals'].append({'index': index, 'status': None, 'error': None})
+
+    # Validate targets, grouped by period so each period is one upsert
+    target_groups = {}
+    target_keys = []
+    for index, record in enumerate(target_records):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("Record must be an object")
+            distributor_id = _resolve_distributor(record.get('distributor'), distributor_index, distributor_ids)
+            financial_year = str(record.get('fy') or '')
+            if not re.fullmatch(r'FY\d{2}-\d{2}', financial_year):
+                raise ValueError(f"Invalid financial year: {record.get('fy')!r}")
+            month = record.get('month')
+            if month not in MONTH_NAMES:
+                raise ValueError(f"Invalid month: {month!r}")
+            target_value = _parse_amount(record.get('target'), 'target')
+            if target_value == 0:
+                raise ValueError("target must be greater than zero")
+        except ValueError as e:
+            results['targets'].append({'index': index, 'status': 'rejected', 'error': str(e)})
+            target_keys.append(None)
+            continue
+
+        period_identifier = f"{month}-{financial_year}"
+        target_groups.setdefault(period_identifier, {})[distributor_id] = target_value
+        target_keys.append((period_identifier, distributor_id))
+        results['targets'].append({'index': index, 'status': None, 'error': None})
+
+    # Write everything; the caller owns the transaction
+    actual_outcomes = upsert_actuals(db, Actual, actual_rows)
+    for result, key in zip(results['actuals'], actual_keys):
+        if key is not None:
+            result['status'] = actual_outcomes.get(key, 'updated')
+
+    target_outcomes = {}
+    for period_identifier, target_values in target_groups.items():
+        for distributor_id, outcome in upsert_targets(db, Target, target_values, 'Monthly', period_identifier).items():
+            target_outcomes[(period_identifier, distributor_id)] = outcome
+    for result, key in zip(results['targets'], target_keys):
+        if key is not None:
+            result['status'] = target_outcomes.get(key, 'updated')
+
+    return results
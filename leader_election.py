@@ -0,0 +1,223 @@
+import os
+import time
+import uuid
+import socket
+import atexit
+import logging
+import sqlite3
+import threading
+
+from backup_utils import resolve_database_path
+
+logger = logging.getLogger(__name__)
+
+# Seconds between lease renewals, and how long a lease outlives its last renewal
+LEADER_HEARTBEAT_SECONDS = float(os.environ.get("LEADER_HEARTBEAT_SECONDS", 10))
+LEADER_LEASE_SECONDS = float(os.environ.get("LEADER_LEASE_SECONDS", 30))
+
+def get_lease_path(db_path):
+    """
+    Return the lease file kept beside a database
+
+    Heartbeats write to this file rather than the database itself, so they
+    never add WAL frames for the archiver, pages for backups to copy, or
+    rows for a restore to roll back. Backups and the archiver only read the
+    database file, so the lease is never part of them.
+    """
+    return db_path + ".lease"
+
+def other_live_processes(db_path):
+    """
+    Return the other processes whose electors are heartbeating against a database
+
+    Each elector records its process in the lease file on every heartbeat and
+    removes it when stopped; a process that stops heartbeating drops out once
+    LEADER_LEASE_SECONDS have passed.
+
+    Args:
+        db_path (str): App database
+
+    Returns:
+        list: Holder ids of live electors in processes other than this one
+    """
+    lease_path = get_lease_path(db_path)
+    if not os.path.exists(lease_path):
+        return []
+    conn = sqlite3.connect(lease_path, timeout=5)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'lease_member'").fetchone():
+            return []
+        rows = conn.execute(
+            "SELECT holder FROM lease_member WHERE heartbeat_at > ? AND NOT (host = ? AND pid = ?)",
+            (time.time() - LEADER_LEASE_SECONDS, socket.gethostname(), os.getpid())
+        ).fetchall()
+    finally:
+        conn.close()
+    return [holder for (holder,) in rows]
+
+class LeaderElector:
+    """
+    Elects one process to run background jobs, using a lease row in SQLite
+
+    The lease lives in a small SQLite file next to the database (see
+    get_lease_path), and its tables are created once when the elector starts.
+    Every heartbeat also records this process as a live member, which lets
+    a restore see whether other processes still have the database open.
+
+    Every process runs an elector. Each heartbeat it tries to take or renew
+    the named lease in a single UPDATE, which succeeds only for the current
+    holder or once the lease has expired. The holder runs on_elected; if it
+    stops renewing (it crashed, hung or lost the database), another process
+    takes over once the lease expires. A holder that cannot renew its
+    lease steps down with on_demoted before the lease runs out.
+    """
+
+    def __init__(self, name, on_elected, on_demoted=None, db_path=None,
+                 heartbeat=None, lease=None):
+        """
+        Args:
+            name (str): Lease name; processes competing for the same work share it
+            on_elected (callable): Called when this process becomes leader; its
+                return value is passed to on_demoted
+            on_demoted (callable): Called with that value when leadership is lost
+            db_path (str): App database the lease file sits beside (defaults to
+                the current app's DATABASE_PATH)
+            heartbeat (float): Seconds between renewals (defaults to LEADER_HEARTBEAT_SECONDS)
+            lease (float): Lease duration (defaults to LEADER_LEASE_SECONDS)
+        """
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lease_path = get_lease_path(resolve_database_path(db_path))
+        self.heartbeat = heartbeat or LEADER_HEARTBEAT_SECONDS
+        self.lease = lease or LEADER_LEASE_SECONDS
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.holder = f"{self.host}:{self.pid}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._expires_at = 0
+        self._leader_state = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Create the lease tables if needed and start campaigning in a background thread"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leader_lease ("
+                "name TEXT PRIMARY KEY, holder TEXT, expires_at REAL NOT NULL, heartbeat_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lease_member ("
+                "holder TEXT PRIMARY KEY, host TEXT NOT NULL, pid INTEGER NOT NULL, heartbeat_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Step down and release the lease so another process can take over at once"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.heartbeat + 5)
+        if self.is_leader:
+            self._demote()
+            try:
+                self._release()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not release {self.name} lease: {str(e)}")
+        try:
+            self._leave()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not remove {self.holder} from the lease members: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._beat()
+            self._stop.wait(self.heartbeat)
+
+    def _beat(self):
+        try:
+            held = self._try_acquire()
+        except sqlite3.Error as e:
+            logger.warning(f"{self.name} lease heartbeat failed: {str(e)}")
+            # Keep leading only while the lease we already hold is still valid
+            held = self.is_leader and time.time() < self._expires_at - self.heartbeat
+
+        if held and not self.is_leader:
+            logger.info(f"Elected {self.name} leader ({self.holder})")
+            self.is_leader = True
+            try:
+                self._leader_state = self.on_elected()
+            except Exception as e:
+                logger.error(f"Starting {self.name} as leader failed: {str(e)}")
+                self.is_leader = False
+                try:
+                    self._release()
+                except sqlite3.Error:
+                    pass
+        elif not held and self.is_leader:
+            logger.warning(f"Lost {self.name} leadership ({self.holder})")
+            self._demote()
+
+    def _demote(self):
+        self.is_leader = False
+        state, self._leader_state = self._leader_state, None
+        if self.on_demoted:
+            try:
+                self.on_demoted(state)
+            except Exception as e:
+                logger.error(f"Stopping {self.name} leader work failed: {str(e)}")
+
+    def _connect(self):
+        return sqlite3.connect(self.lease_path, timeout=5, isolation_level=None)
+
+    def _try_acquire(self):
+        """Take or renew the lease; returns whether this process holds it"""
+        now = time.time()
+        expires_at = now + self.lease
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO lease_member (holder, host, pid, heartbeat_at) VALUES (?, ?, ?, ?)",
+                (self.holder, self.host, self.pid, now)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO leader_lease (name, holder, expires_at, heartbeat_at) VALUES (?, NULL, 0, 0)",
+                (self.name,)
+            )
+            updated = conn.execute(
+                "UPDATE leader_lease SET holder = ?, expires_at = ?, heartbeat_at = ? "
+                "WHERE name = ? AND (holder = ? OR holder IS NULL OR expires_at < ?)",
+                (self.holder, expires_at, now, self.name, self.holder, now)
+            ).rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if updated:
+            self._expires_at = expires_at
+        return bool(updated)
+
+    def _release(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE leader_lease SET holder = NULL, expires_at = 0 WHERE name = ? AND holder = ?",
+                (self.name, self.holder)
+            )
+        finally:
+            conn.close()
+        self._expires_at = 0
+
+    def _leave(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM lease_member WHERE holder = ?", (self.holder,))
+        finally:
+            conn.close()
@@ -0,0 +1,261 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+Counters, gauges and histograms are plain dictionaries behind one lock per
+metric, updated in place by the code they describe. Values that other
+modules already keep (write-lock contention, backup status) are read by
+collectors when /metrics is scraped. render() produces the exposition text,
+so the endpoint can be tested without a Prometheus server.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("METRICS", "true").lower() == "true"
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+JOB_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BACKUP_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_registry = []
+_collectors = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds, whether or not it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(s["counts"]), s["sum"], s["count"]) for key, s in sorted(self._values.items())]
+        rows = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                rows.append((f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), cumulative))
+            rows.append((f"{self.name}_sum", key, total))
+            rows.append((f"{self.name}_count", key, count))
+        return rows
+
+def register_collector(collect):
+    """
+    Add a callable run at scrape time
+
+    It returns a list of (name, kind, description, [(labels dict, value)]) for
+    values another module already tracks.
+    """
+    _collectors.append(collect)
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for collect in _collectors:
+        for name, kind, description, samples in collect():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# Requests
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to handle a request, by route", ("endpoint", "method")
+)
+REQUESTS = Counter("http_requests_total", "Requests handled, by route and status", ("endpoint", "method", "status"))
+REQUEST_STATEMENTS = Histogram(
+    "db_statements_per_request", "SQL statements run by one request, by route", ("endpoint",), STATEMENT_BUCKETS
+)
+
+# Caches
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result"))
+
+# Report exports
+EXPORT_DURATION = Histogram("export_duration_seconds", "Time to build an export, by job", ("job",), JOB_BUCKETS)
+
+# Email
+EMAIL_DURATION = Histogram("email_send_duration_seconds", "Time to send an email, by kind", ("kind",), JOB_BUCKETS)
+EMAIL_SENDS = Counter("email_sends_total", "Emails sent, by kind and result (success or failure)", ("kind", "result"))
+
+# Backups
+BACKUP_DURATION = Histogram("backup_duration_seconds", "Time the backup process took", (), BACKUP_BUCKETS)
+BACKUPS = Counter("backups_total", "Backup runs, by result (succeeded or failed)", ("result",))
+BACKUP_SIZE = Gauge("backup_last_size_bytes", "Database size captured by the last successful backup")
+BACKUP_WRITTEN = Gauge("backup_last_written_bytes", "Bytes the last successful backup added to storage")
+
+def _collect_cache_ratios():
+    with CACHE_LOOKUPS._lock:
+        totals = {}
+        for key, value in CACHE_LOOKUPS._values.items():
+            labels = dict(key)
+            hits, lookups = totals.get(labels["cache"], (0, 0))
+            totals[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), lookups + value)
+    return [(
+        "cache_hit_ratio", "gauge", "Share of cache lookups that were hits since startup",
+        [({"cache": cache}, hits / lookups) for cache, (hits, lookups) in sorted(totals.items()) if lookups]
+    )]
+
+def _collect_contention():
+    from db_config import get_contention_metrics
+
+    contention = get_contention_metrics()
+    return [
+        ("db_transactions_total", "counter", "Transactions started", [({}, contention["transactions"])]),
+        ("db_immediate_transactions_total", "counter", "Write transactions started with BEGIN IMMEDIATE",
+         [({}, contention["immediate_transactions"])]),
+        ("db_lock_wait_seconds_total", "counter", "Time spent waiting for the write lock",
+         [({}, contention["lock_wait_seconds_total"])]),
+        ("db_busy_errors_total", "counter", "Write transactions that found the database locked",
+         [({}, contention["busy_errors"])]),
+        ("db_write_retries_total", "counter", "Write transactions retried after a busy error",
+         [({}, contention["retries"])]),
+        ("db_failed_writes_total", "counter", "Write transactions that gave up after every retry",
+         [({}, contention["failed_writes"])])
+    ]
+
+def _collect_backup_status():
+    from backup_utils import get_backup_status
+
+    return [(
+        "backup_running", "gauge", "Whether a backup process is running",
+        [({}, 1 if get_backup_status()["state"] == "running" else 0)]
+    )]
+
+register_collector(_collect_cache_ratios)
+register_collector(_collect_contention)
+register_collector(_collect_backup_status)
+
+def _install_cache_counter(engine):
+    from sqlalchemy import event
+    from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def count_compiled_cache(conn, cursor, statement, parameters, context, executemany):
+        # Textual SQL and DDL have no cache key and are left out of the ratio
+        if context is None:
+            return
+        if context.cache_hit is CACHE_HIT:
+            CACHE_LOOKUPS.inc(cache="sqlalchemy_compiled", result="hit")
+        elif context.cache_hit is CACHE_MISS:
+            CACHE_LOOKUPS.inc(cache="sqlalchemy_compiled", result="miss")
+
+def init_metrics(app, db):
+    """
+    Record request metrics on the app when METRICS is enabled
+
+    Args:
+        app: Flask application
+        db: Flask-SQLAlchemy extension bound to the app
+    """
+    if not app.config.get("METRICS"):
+        return
+
+    from flask import request
+
+    with app.app_context():
+        _install_cache_counter(db.engine)
+
+    @app.before_request
+    def start_request_metrics():
+        request.environ["metrics.started"] = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = request.environ.get("metrics.started")
+        if started is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        tracker = request.environ.get("query_stats.tracker")
+        if tracker is not None:
+            REQUEST_STATEMENTS.observe(tracker.count, endpoint=endpoint)
+        return response
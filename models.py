@@ -1,7 +1,7 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, DDL, event
 from werkzeug.security import check_password_hash
 
 class User(UserMixin, db.Model):
@@ -57,3 +57,61 @@ class Actual(db.Model):
     
     def __repr__(self):
         return f"<Actual {self.distributor.name} - Week of {self.week_start_date}>"
+
+class IdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), unique=True, nullable=False)
+    request_hash = db.Column(db.String(64))  # SHA-256 of the user and body the key was first sent with
+    response_json = db.Column(db.Text, nullable=False)  # Stored response replayed on retries
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)  # Pruned after a TTL
+    
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key}>"
+
+
+class ChangeLog(db.Model):
+    """Append-only feed of row changes, written by SQLite triggers and pruned by retention.py"""
+    __tablename__ = 'change_log'
+    
+    seq = db.Column(db.Integer, primary_key=True)  # Monotonic cursor, never reused
+    table_name = db.Column(db.String(32), nullable=False)  # 'actual', 'target' or 'distributor'
+    row_id = db.Column(db.Integer, nullable=False)
+    distributor_id = db.Column(db.Integer)
+    operation = db.Column(db.String(10), nullable=False)  # 'insert', 'update' or 'delete'
+    changed_at = db.Column(db.String(23), nullable=False, index=True)  # UTC 'YYYY-MM-DD HH:MM:SS.SSS'
+    
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    def __repr__(self):
+        return f"<ChangeLog {self.seq} {self.operation} {self.table_name}:{self.row_id}>"
+
+# Tables tracked by the change log and the column holding their distributor id
+CHANGE_LOG_TABLES = {
+    'actual': 'distributor_id',
+    'target': 'distributor_id',
+    'distributor': 'id'
+}
+
+def _change_log_trigger(table, distributor_column, operation):
+    row = 'OLD' if operation == 'delete' else 'NEW'
+    when = ''
+    if operation == 'update':
+        # Skip no-op updates such as re-posting an unchanged upsert
+        when = 'WHEN ' + ' OR '.join(
+            f"NEW.{column.name} IS NOT OLD.{column.name}" for column in table.columns
+        ) + ' '
+    return DDL(
+        f"CREATE TRIGGER IF NOT EXISTS change_log_{table.name}_{operation} "
+        f"AFTER {operation.upper()} ON {table.name} {when}BEGIN "
+        f"INSERT INTO change_log (table_name, row_id, distributor_id, operation, changed_at) "
+        f"VALUES ('{table.name}', {row}.id, {row}.{distributor_column}, '{operation}', "
+        f"strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now')); END"
+    )
+
+# Triggers are created after every create_all, so existing databases pick them up too
+for _table_name, _distributor_column in CHANGE_LOG_TABLES.items():
+    for _operation in ('insert', 'update', 'delete'):
+        event.listen(
+            db.metadata, 'after_create',
+            _change_log_trigger(db.metadata.tables[_table_name], _distributor_column, _operation).execute_if(dialect='sqlite')
+        )
@@ -0,0 +1,240 @@
+"""
+Phase timers for app start-up and requests
+
+With PHASE_TIMING=true, start-up (import, create_app, schema creation,
+seeding) and every request are split into named phases. SQL execution and
+template rendering are timed automatically through SQLAlchemy engine events
+and Flask's template signals; routes mark their own phases, such as the
+aggregation loops, with phase() or start_phase()/end_phase(). Phase times
+are exclusive: time spent in SQL inside an aggregation loop counts as db, not
+aggregate.
+
+Each request ends with a structured log line on the phase_timing logger and a
+Server-Timing response header. When timing is off no hooks are installed and
+phase() returns a shared no-op context manager.
+"""
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+logger = logging.getLogger("phase_timing")
+
+PHASE_TIMING_ENABLED = os.environ.get("PHASE_TIMING", "false").lower() == "true"
+
+# Time this module was first imported, which the launcher does before anything else
+_process_started = time.perf_counter()
+
+# Timer of the start-up sequence or request running in this context, if timing is on
+_current = ContextVar("phase_timer", default=None)
+
+_disabled = nullcontext()
+
+class PhaseTimer:
+    """Accumulates exclusive time and call counts for nested named phases"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        # Open phases as [name, started, time spent in nested phases]
+        self._stack = []
+
+    def push(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def pop(self, name):
+        # A phase whose end event never came (e.g. a failed render) is discarded
+        while self._stack:
+            open_name, started, nested = self._stack.pop()
+            elapsed = time.perf_counter() - started
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            if open_name == name:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed - nested
+                self.counts[name] = self.counts.get(name, 0) + 1
+                return
+
+    def close_open(self):
+        """Count phases still open, such as one left by an exception, as ending now"""
+        while self._stack:
+            self.pop(self._stack[-1][0])
+
+    @contextmanager
+    def phase(self, name):
+        self.push(name)
+        try:
+            yield
+        finally:
+            self.pop(name)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """Return phase durations in milliseconds, with the remainder reported as other"""
+        total = self.elapsed()
+        phases = {name: round(seconds * 1000, 3) for name, seconds in self.durations.items()}
+        phases["other"] = round(max(0.0, total - sum(self.durations.values())) * 1000, 3)
+        return {
+            "total_ms": round(total * 1000, 3),
+            "phases_ms": phases,
+            "counts": dict(self.counts)
+        }
+
+def phase(name):
+    """
+    Time a block as the named phase of the current start-up or request
+
+    Returns a no-op context manager when nothing is being timed, so it can
+    stay in place in routes.
+
+    Args:
+        name (str): Phase name, e.g. "aggregate"
+    """
+    timer = _current.get()
+    if timer is None:
+        return _disabled
+    return timer.phase(name)
+
+def start_phase(name):
+    """
+    Start timing the named phase until end_phase(name)
+
+    For long stretches of route code that a with block would have to
+    re-indent. Early returns must call end_phase first; a phase still open
+    when the request ends, such as after an exception, is counted up to
+    that point.
+
+    Args:
+        name (str): Phase name, e.g. "aggregate"
+    """
+    timer = _current.get()
+    if timer is not None:
+        timer.push(name)
+
+def end_phase(name):
+    """Finish a phase started with start_phase"""
+    timer = _current.get()
+    if timer is not None:
+        timer.pop(name)
+
+def emit(event, timer, **fields):
+    """Write one structured log line for a finished timer"""
+    record = {"event": event, **fields, **timer.summary()}
+    logger.info(json.dumps(record, default=str))
+
+def server_timing_header(timer):
+    """Format a timer as a Server-Timing header value"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timer.durations.items()]
+    entries.append(f"total;dur={timer.elapsed() * 1000:.2f}")
+    return ", ".join(entries)
+
+@contextmanager
+def startup_timing(enabled=None):
+    """
+    Time the start-up sequence run inside the block
+
+    Phases marked with phase() inside the block, including SQL run by
+    create_all and seeding, are logged as one "startup" line when it exits.
+
+    Args:
+        enabled (bool): Override PHASE_TIMING
+    """
+    if not (PHASE_TIMING_ENABLED if enabled is None else enabled):
+        yield
+        return
+
+    timer = PhaseTimer()
+    token = _current.set(timer)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        timer.close_open()
+        emit("startup", timer, since_process_start_ms=round((time.perf_counter() - _process_started) * 1000, 3))
+
+def _install_sql_timer(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_sql_phase(conn, cursor, statement, parameters, context, executemany):
+        timer = _current.get()
+        if timer is not None:
+            timer.push("db")
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_sql_phase(conn, cursor, statement, parameters, context, executemany):
+        timer = _current.get()
+        if timer is not None:
+            timer.pop("db")
+
+    @event.listens_for(engine, "handle_error")
+    def end_failed_sql_phase(exception_context):
+        timer = _current.get()
+        if timer is not None:
+            timer.pop("db")
+
+def init_phase_timing(app, db):
+    """
+    Install request timing on the app when PHASE_TIMING is enabled
+
+    Args:
+        app: Flask application
+        db: Flask-SQLAlchemy extension bound to the app
+    """
+    if not app.config.get("PHASE_TIMING"):
+        return
+
+    from flask import request, before_render_template, template_rendered
+
+    with app.app_context():
+        _install_sql_timer(db.engine)
+
+    first_request = {"pending": True}
+
+    @app.before_request
+    def start_request_timer():
+        timer = PhaseTimer()
+        request.environ["phase_timing.token"] = _current.set(timer)
+        request.environ["phase_timing.timer"] = timer
+
+    @app.after_request
+    def report_request_timer(response):
+        timer = request.environ.get("phase_timing.timer")
+        if timer is None:
+            return response
+        timer.close_open()
+        response.headers["Server-Timing"] = server_timing_header(timer)
+        emit("request", timer, method=request.method, path=request.path,
+             endpoint=request.endpoint, status=response.status_code)
+        if first_request["pending"]:
+            first_request["pending"] = False
+            logger.info(json.dumps({
+                "event": "first_request",
+                "path": request.path,
+                "latency_ms": round(timer.elapsed() * 1000, 3),
+                "since_process_start_ms": round((time.perf_counter() - _process_started) * 1000, 3)
+            }))
+        return response
+
+    @app.teardown_request
+    def clear_request_timer(exc):
+        token = request.environ.pop("phase_timing.token", None)
+        if token is not None:
+            _current.reset(token)
+
+    def start_render_phase(sender, template, context, **extra):
+        timer = _current.get()
+        if timer is not None:
+            timer.push("render")
+
+    def end_render_phase(sender, template, context, **extra):
+        timer = _current.get()
+        if timer is not None:
+            timer.pop("render")
+
+    before_render_template.connect(start_render_phase, app, weak=False)
+    template_rendered.connect(end_render_phase, app, weak=False)
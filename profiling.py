@@ -0,0 +1,233 @@
+"""
+On-demand profiling of single requests
+
+An admin adds "X-Profile: 1" (or "?_profile=1") to a request to run it
+under cProfile. "memory" instead of "1" also traces allocations with
+tracemalloc. Each capture is saved to the profiles directory as
+<id>.prof (load it with pstats or snakeviz), <id>.txt (the top functions by
+cumulative time and, for memory captures, the top allocation sites) and
+<id>.json (request details). Only the newest PROFILE_KEEP captures are kept.
+The response carries the capture id in X-Profile-Id.
+"""
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = os.environ.get("PROFILES_DIR", "")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+# Usernames allowed to profile requests
+PROFILE_ADMINS = {name.strip() for name in os.environ.get("PROFILE_ADMINS", "admin").split(",") if name.strip()}
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_PARAM = "_profile"
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# One capture at a time: tracemalloc is process-wide, and from Python 3.12
+# only one cProfile profiler can be active per process
+_profile_lock = threading.Lock()
+
+def ensure_profiles_dir():
+    """Create the profiles directory if it doesn't exist"""
+    profiles_dir = PROFILES_DIR or os.path.join(os.getcwd(), 'profiles')
+    os.makedirs(profiles_dir, exist_ok=True)
+    return profiles_dir
+
+def is_profile_admin(user):
+    """Return whether a user may profile requests"""
+    return bool(getattr(user, "is_authenticated", False)) and getattr(user, "username", None) in PROFILE_ADMINS
+
+def requested_mode(request):
+    """
+    Return the capture a request asks for
+
+    Returns:
+        str: "cpu", "memory", or None when profiling was not requested
+    """
+    value = (request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_PARAM) or "").strip().lower()
+    if not value or value in ("0", "false", "off"):
+        return None
+    return "memory" if value == "memory" else "cpu"
+
+class RequestProfile:
+    """cProfile (and optionally tracemalloc) capture of one request"""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.profiler = cProfile.Profile()
+        self.started = None
+        self.duration = None
+        self.snapshot = None
+        self.peak = None
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start(10)
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        if self.memory:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def summary(self):
+        """Return the text report: top functions by cumulative time, then top allocation sites"""
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+        if self.snapshot is not None:
+            snapshot = self.snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+            ))
+            stats_by_line = snapshot.statistics("lineno")
+            out.write(f"\nPeak traced memory: {self.peak / 1024:.1f} KiB\n")
+            out.write(f"Top {TOP_ALLOCATIONS} allocation sites still held at the end of the request:\n")
+            for stat in stats_by_line[:TOP_ALLOCATIONS]:
+                out.write(f"  {stat}\n")
+        return out.getvalue()
+
+def save_profile(profile, details):
+    """
+    Write a capture to the profiles directory and rotate old ones
+
+    Args:
+        profile (RequestProfile): Stopped capture
+        details (dict): Request details (method, path, endpoint, status, user)
+
+    Returns:
+        str: Capture id
+    """
+    profiles_dir = ensure_profiles_dir()
+    endpoint = (details.get("endpoint") or "unmatched").replace(".", "_")
+    profile_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{endpoint}"
+
+    profile.profiler.dump_stats(os.path.join(profiles_dir, f"{profile_id}.prof"))
+    with open(os.path.join(profiles_dir, f"{profile_id}.txt"), 'w') as f:
+        f.write(profile.summary())
+    with open(os.path.join(profiles_dir, f"{profile_id}.json"), 'w') as f:
+        json.dump(dict(
+            details,
+            id=profile_id,
+            time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            duration_ms=round(profile.duration * 1000, 1),
+            memory=profile.memory,
+            peak_memory_bytes=profile.peak
+        ), f)
+
+    prune_profiles(profiles_dir)
+    logger.info(f"Saved request profile {profile_id} ({profile.duration * 1000:.0f} ms)")
+    return profile_id
+
+def prune_profiles(profiles_dir=None, keep=None):
+    """Delete all but the newest keep captures"""
+    profiles_dir = profiles_dir or ensure_profiles_dir()
+    keep = PROFILE_KEEP if keep is None else keep
+    ids = sorted(name[:-len(".json")] for name in os.listdir(profiles_dir) if name.endswith(".json"))
+    for profile_id in ids[:max(0, len(ids) - keep)]:
+        for extension in (".json", ".prof", ".txt"):
+            try:
+                os.remove(os.path.join(profiles_dir, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+def list_profiles():
+    """
+    List saved captures, newest first
+
+    Returns:
+        list: Request details of each capture (id, time, method, path,
+            endpoint, status, user, duration_ms, memory, peak_memory_bytes)
+    """
+    profiles_dir = ensure_profiles_dir()
+    profiles = []
+    for name in sorted(os.listdir(profiles_dir), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(profiles_dir, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable profile {name}: {str(e)}")
+    return profiles
+
+def profile_file(profile_id, extension):
+    """
+    Return the path of a capture's .prof or .txt file
+
+    Raises:
+        FileNotFoundError: If the id is not a saved capture
+    """
+    if extension not in (".prof", ".txt") or os.path.basename(profile_id) != profile_id:
+        raise FileNotFoundError(profile_id)
+    path = os.path.join(ensure_profiles_dir(), profile_id + extension)
+    if not os.path.exists(path):
+        raise FileNotFoundError(profile_id)
+    return path
+
+def init_profiling(app):
+    """Let admins profile a request on demand"""
+    from flask import request
+    try:
+        from flask_login import current_user
+    except ImportError:
+        from app import current_user
+
+    @app.before_request
+    def start_request_profile():
+        mode = requested_mode(request)
+        if mode is None or not is_profile_admin(current_user):
+            return
+        if not _profile_lock.acquire(blocking=False):
+            logger.warning(f"Profiling already in progress; not profiling {request.path}")
+            return
+        # Leave tracemalloc alone if something else (e.g. PYTHONTRACEMALLOC) is already tracing
+        memory = mode == "memory" and not tracemalloc.is_tracing()
+        profile = RequestProfile(memory=memory)
+        request.environ["profiling.profile"] = profile
+        profile.start()
+
+    @app.after_request
+    def save_request_profile(response):
+        profile = request.environ.pop("profiling.profile", None)
+        if profile is None:
+            return response
+        try:
+            profile.stop()
+            response.headers["X-Profile-Id"] = save_profile(profile, {
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                "user": current_user.username
+            })
+        except Exception as e:
+            logger.error(f"Could not save request profile: {str(e)}")
+        finally:
+            _profile_lock.release()
+        return response
+
+    @app.teardown_request
+    def abandon_request_profile(exc):
+        # Reached without after_request only when the request failed outright
+        profile = request.environ.pop("profiling.profile", None)
+        if profile is not None:
+            profile.profiler.disable()
+            if profile.memory:
+                tracemalloc.stop()
+            _profile_lock.release()
@@ -0,0 +1,208 @@
+"""
+SQL statement counts, slow-query log and repeated-statement detection
+
+Engine events count every statement and its execution time. Inside a request
+(or a track_queries() block) the statements are also grouped by shape, the
+SQL text with whitespace and IN-lists collapsed, so a loop issuing the same
+query per distributor shows up as one shape run many times. Requests that
+run any shape more than REPEATED_QUERY_THRESHOLD times are logged with the
+statement, and totals are kept per route for /api/db/queries.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters and
+SQLite's EXPLAIN QUERY PLAN wherever they run.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger("query_stats")
+
+QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+# A request running one statement shape more often than this is flagged as N+1
+REPEATED_QUERY_THRESHOLD = int(os.environ.get("REPEATED_QUERY_THRESHOLD", 10))
+
+# Statements whose plan EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"IN \(\?(?:, ?\?)*\)", re.IGNORECASE)
+
+_current = ContextVar("query_tracker", default=None)
+
+_routes_lock = threading.Lock()
+_routes = {}
+
+class QueryTracker:
+    """Statements run during one request or track_queries() block"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = 0
+        self.shapes = Counter()
+
+    def add(self, statement, seconds, slow):
+        self.count += 1
+        self.seconds += seconds
+        self.slow += slow
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=None):
+        """Return [(shape, count)] for shapes run more than threshold times, most frequent first"""
+        threshold = REPEATED_QUERY_THRESHOLD if threshold is None else threshold
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+def statement_shape(statement):
+    """Normalise SQL text so executions of the same query compare equal"""
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", statement).strip())
+
+def explain_query_plan(dbapi_connection, statement, parameters):
+    """
+    Return SQLite's query plan for a statement as a list of detail lines
+
+    Args:
+        dbapi_connection: Raw sqlite3 connection the statement ran on
+        statement (str): SQL text
+        parameters: Parameters the statement ran with
+
+    Returns:
+        list: Plan lines, or an empty list if the statement cannot be explained
+    """
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f"unavailable: {str(e)}"]
+    finally:
+        cursor.close()
+
+def install_query_stats(engine):
+    """Listen for statement execution on an engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_stats_started"].pop()
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+
+        tracker = _current.get()
+        if tracker is not None:
+            tracker.add(statement, elapsed, slow)
+
+        if slow:
+            params = parameters[0] if executemany and parameters else parameters
+            plan = explain_query_plan(conn.connection.dbapi_connection, statement, params)
+            logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms): {statement_shape(statement)} "
+                f"params={params!r} plan={plan}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def discard_failed_statement(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_stats_started"):
+            conn.info["query_stats_started"].pop()
+
+@contextmanager
+def track_queries():
+    """
+    Collect the statements run inside the block
+
+    Yields:
+        QueryTracker: count, seconds, slow and shapes of the statements run
+    """
+    tracker = QueryTracker()
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
+
+def record_route(endpoint, tracker):
+    """Add a finished request to its route's totals and flag repeated statements"""
+    repeated = tracker.repeated()
+    for shape, count in repeated:
+        logger.warning(f"Repeated query in {endpoint}: {count} executions of {shape}")
+
+    with _routes_lock:
+        stats = _routes.setdefault(endpoint, {
+            "requests": 0,
+            "statements": 0,
+            "statements_max": 0,
+            "db_seconds": 0.0,
+            "db_seconds_max": 0.0,
+            "slow_statements": 0,
+            "repeated_requests": 0,
+            "repeated_shapes": {}
+        })
+        stats["requests"] += 1
+        stats["statements"] += tracker.count
+        stats["statements_max"] = max(stats["statements_max"], tracker.count)
+        stats["db_seconds"] += tracker.seconds
+        stats["db_seconds_max"] = max(stats["db_seconds_max"], tracker.seconds)
+        stats["slow_statements"] += tracker.slow
+        if repeated:
+            stats["repeated_requests"] += 1
+            for shape, count in repeated:
+                stats["repeated_shapes"][shape] = max(stats["repeated_shapes"].get(shape, 0), count)
+
+def get_query_stats():
+    """
+    Return statement totals per route since startup
+
+    Returns:
+        dict: endpoint -> requests, statements, statements_max, db_seconds,
+            db_seconds_max, slow_statements, repeated_requests and
+            repeated_shapes (shape -> highest count in one request)
+    """
+    with _routes_lock:
+        return {
+            endpoint: dict(stats, repeated_shapes=dict(stats["repeated_shapes"]))
+            for endpoint, stats in _routes.items()
+        }
+
+def init_query_stats(app, db):
+    """
+    Count statements per request on the app when QUERY_STATS is enabled
+
+    Args:
+        app: Flask application
+        db: Flask-SQLAlchemy extension bound to the app
+    """
+    if not app.config.get("QUERY_STATS"):
+        return
+
+    from flask import request
+
+    with app.app_context():
+        install_query_stats(db.engine)
+
+    @app.before_request
+    def start_query_tracking():
+        tracker = QueryTracker()
+        request.environ["query_stats.token"] = _current.set(tracker)
+        request.environ["query_stats.tracker"] = tracker
+
+    @app.teardown_request
+    def finish_query_tracking(exc):
+        token = request.environ.pop("query_stats.token", None)
+        if token is None:
+            return
+        _current.reset(token)
+        # Requests that matched no route (404s) have no endpoint
+        endpoint = request.endpoint or "unmatched"
+        record_route(endpoint, request.environ["query_stats.tracker"])
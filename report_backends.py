@@ -0,0 +1,43 @@
+"""
+Report, spreadsheet and email backends, imported on first use
+
+pandas, ReportLab and the email/SMTP modules account for most of the time
+and memory it takes to import utils, yet only the report and email routes
+need them. The names here stand in for those modules and import the real
+module the first time an attribute is looked up, so a worker that never
+builds a report never loads them.
+"""
+import importlib
+
+class LazyModule:
+    """Proxy for a module that is imported when one of its attributes is first used"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            # import_module holds the import lock, so concurrent first uses are safe
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+# Excel reports
+pd = LazyModule("pandas")
+
+# PDF reports
+colors = LazyModule("reportlab.lib.colors")
+pagesizes = LazyModule("reportlab.lib.pagesizes")
+platypus = LazyModule("reportlab.platypus")
+stylesheet = LazyModule("reportlab.lib.styles")
+canvas = LazyModule("reportlab.pdfgen.canvas")
+
+# Email delivery
+smtplib = LazyModule("smtplib")
+mime_multipart = LazyModule("email.mime.multipart")
+mime_text = LazyModule("email.mime.text")
+mime_application = LazyModule("email.mime.application")
@@ -0,0 +1,101 @@
+"""
+Retention for tables that grow with every API call
+
+Idempotency keys are only needed while an integration job may still retry
+the request that used them. Change log entries are only needed until every
+client has read past them; a client whose cursor falls behind the retained
+log is told to resync. The leader's scheduler deletes expired rows every
+RETENTION_INTERVAL_MINUTES, working on the database file directly since
+scheduler jobs run outside any app context.
+"""
+import os
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Idempotency keys older than this are deleted; a retry after that writes again
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+# Change log entries older than this are deleted; clients behind them must resync
+CHANGE_LOG_RETENTION_DAYS = float(os.environ.get("CHANGE_LOG_RETENTION_DAYS", 30))
+# Minutes between pruning passes
+RETENTION_INTERVAL_MINUTES = int(os.environ.get("RETENTION_INTERVAL_MINUTES", 60))
+
+def prune_idempotency_keys(db_path, ttl_hours=None):
+    """
+    Delete idempotency keys older than the TTL
+
+    Args:
+        db_path: App database
+        ttl_hours (float): Key lifetime (defaults to IDEMPOTENCY_KEY_TTL_HOURS)
+
+    Returns:
+        int: Number of keys deleted
+    """
+    ttl_hours = IDEMPOTENCY_KEY_TTL_HOURS if ttl_hours is None else ttl_hours
+    # created_at is stored by SQLAlchemy as ISO text, which compares in time order
+    cutoff = (datetime.now() - timedelta(hours=ttl_hours)).strftime("%Y-%m-%d %H:%M:%S.%f")
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        deleted = conn.execute("DELETE FROM idempotency_key WHERE created_at < ?", (cutoff,)).rowcount
+    finally:
+        conn.close()
+    if deleted:
+        logger.info(f"Pruned {deleted} idempotency keys older than {ttl_hours:g} hours")
+    return deleted
+
+def prune_change_log(db_path, retention_days=None):
+    """
+    Delete change log entries older than the retention window
+
+    Only a prefix of the log is deleted, so the oldest retained sequence
+    tells the feeds which cursors are too old. The newest entry is always
+    kept, since an empty log could not tell a stale cursor from a new one.
+
+    Args:
+        db_path: App database
+        retention_days (float): Entry lifetime (defaults to CHANGE_LOG_RETENTION_DAYS)
+
+    Returns:
+        int: Number of entries deleted
+    """
+    retention_days = CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    # changed_at is written by the triggers as UTC 'YYYY-MM-DD HH:MM:SS.SSS'
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        deleted = conn.execute(
+            "DELETE FROM change_log "
+            "WHERE seq <= (SELECT MAX(seq) FROM change_log WHERE changed_at < ?) "
+            "AND seq < (SELECT MAX(seq) FROM change_log)",
+            (cutoff,)
+        ).rowcount
+    finally:
+        conn.close()
+    if deleted:
+        logger.info(f"Pruned {deleted} change log entries older than {retention_days:g} days")
+    return deleted
+
+def prune_expired(db_path):
+    """Run every retention pass, logging rather than raising failures"""
+    try:
+        prune_idempotency_keys(db_path)
+    except sqlite3.Error as e:
+        logger.error(f"Pruning idempotency keys failed: {str(e)}")
+    try:
+        prune_change_log(db_path)
+    except sqlite3.Error as e:
+        logger.error(f"Pruning the change log failed: {str(e)}")
+
+def start_retention_jobs(scheduler, db_path):
+    """
+    Prune expired rows on a scheduler
+
+    Args:
+        scheduler: Running APScheduler scheduler to add the job to
+        db_path: App database
+    """
+    scheduler.add_job(prune_expired, 'interval', minutes=RETENTION_INTERVAL_MINUTES,
+                      kwargs={"db_path": db_path}, max_instances=1, coalesce=True)
+    logger.info(f"Pruning expired rows every {RETENTION_INTERVAL_MINUTES} minutes")
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, send_file, abort
 try:
     from flask_login import login_user, logout_user, login_required, current_user
 except ImportError:
@@ -8,41 +8,56 @@ from werkzeug.security import check_password_hash
 from datetime import datetime, timedelta
 import io
 import logging
-from sqlalchemy import func, or_, and_
+from sqlalchemy import func, or_, and_, insert, update
+from sqlalchemy.exc import IntegrityError
 import os
 import zipfile
 import csv
 import json
+import hashlib
 import sqlite3
 import subprocess
 import calendar
 
-from app import app, db, login_manager
-from models import User, Distributor, Target, Actual
+from app import db, login_manager, quiesce_database
+from models import User, Distributor, Target, Actual, IdempotencyKey, ChangeLog
 from utils import (
     calculate_periods, get_current_week_start, get_current_week_end, 
     generate_performance_data, generate_pdf_report, generate_excel_report, 
     send_email_report, get_financial_year, get_financial_quarter, get_financial_month, 
-    get_all_financial_years, get_financial_quarter_dates, test_email_config, send_test_email
+    get_all_financial_years, get_financial_quarter_dates, test_email_config, send_test_email,
+    parse_date_range, upsert_targets, get_changes_since, get_sync_delta,
+    changes_pruned_after
 )
-from backup_utils import perform_backup, get_available_backups, restore_from_backup
+from db_config import run_in_write_transaction, get_contention_metrics
+from phase_timing import start_phase, end_phase
+from query_stats import get_query_stats
+import metrics
+from profiling import is_profile_admin, list_profiles, profile_file
+from backup_utils import run_backup_process, get_backup_status, get_available_backups, restore_from_backup, start_verification
+from wal_archive import restore_to_point_in_time, get_recovery_window
+from import_utils import import_actuals, ingest_records
+import click
+
+# All application routes; registered on the app by create_app
+main = Blueprint('main', __name__, cli_group=None)
 
 # Add current datetime to all templates
-@app.context_processor
+@main.app_context_processor
 def inject_now():
     return {'now': datetime.now()}
 
 # Login/Auth Routes
-@app.route('/')
+@main.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -53,21 +68,21 @@ def login():
         if user and user.check_password(password):
             login_user(user)
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         
         flash('Invalid username or password', 'danger')
     
     return render_template('login.html')
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # Dashboard Route
-@app.route('/dashboard', methods=['GET'])
+@main.route('/dashboard', methods=['GET'])
 @login_required
 def dashboard():
     # Get current date for default values
@@ -153,6 +168,7 @@ def dashboard():
             # Set the default date range
             selected_date_range = f"{first_week_start.strftime('%d %b')} - {first_week_end.strftime('%d %b')}"
     
+    start_phase("aggregate")
     # Get performance data for all distributors
     distributor_performance = []
     total_target = 0
@@ -211,7 +227,7 @@ def dashboard():
                     'shortfall': shortfall
                 })
             except Exception as e:
-                app.logger.error(f"Error calculating distributor performance for 'All' month: {str(e)}")
+                current_app.logger.error(f"Error calculating distributor performance for 'All' month: {str(e)}")
         else:
             # For a specific month, properly handle monthly aggregation
             period_identifier = f"{selected_month}-{selected_financial_year}"
@@ -279,7 +295,7 @@ def dashboard():
                         date_parts = selected_date_range.split(' to ')
                     else:
                         # If no delimiter found, just continue with monthly data
-                        app.logger.warning(f"Could not parse date range: {selected_date_range}")
+                        current_app.logger.warning(f"Could not parse date range: {selected_date_range}")
                         date_parts = []
                     
                     if len(date_parts) == 2:
@@ -288,7 +304,8 @@ def dashboard():
                         
                         # Handle case when there aren't enough parts
                         if len(start_parts) < 2:
-                            app.logger.warning(f"Invalid start date format: {date_parts[0]}")
+                            current_app.logger.warning(f"Invalid start date format: {date_parts[0]}")
+                            end_phase("aggregate")
                             return jsonify({"status": "error", "message": "Invalid date format"})
                             
                         start_day = int(start_parts[0])
@@ -299,7 +316,8 @@ def dashboard():
                         
                         # Handle case when there aren't enough parts
                         if len(end_parts) < 2:
-                            app.logger.warning(f"Invalid end date format: {date_parts[1]}")
+                            current_app.logger.warning(f"Invalid end date format: {date_parts[1]}")
+                            end_phase("aggregate")
                             return jsonify({"status": "error", "message": "Invalid date format"})
                             
                         end_day = int(end_parts[0])
@@ -366,12 +384,12 @@ def dashboard():
                                 # Prorate the target
                                 distributor_target = distributor_target * (days_in_range / days_in_month)
                             except Exception as e:
-                                app.logger.error(f"Error calculating proration: {str(e)}")
+                                current_app.logger.error(f"Error calculating proration: {str(e)}")
                         
                         # Use the specific date range actuals
                         distributor_actual = sum(a.actual_sales for a in date_range_actuals)
                 except Exception as e:
-                    app.logger.error(f"Error calculating date range performance: {str(e)}")
+                    current_app.logger.error(f"Error calculating date range performance: {str(e)}")
                     # Continue with the monthly data on error
             
             total_target += distributor_target
@@ -405,6 +423,7 @@ def dashboard():
     
     # Sort by achievement percent (descending)
     distributor_performance.sort(key=lambda x: x.get('achievement_percent', 0), reverse=True)
+    end_phase("aggregate")
     
     # Get selected distributor's performance data
     selected_distributor_performance = None
@@ -440,13 +459,13 @@ def dashboard():
     )
 
 # Distributor Routes
-@app.route('/distributors')
+@main.route('/distributors')
 @login_required
 def distributors():
     distributors = Distributor.query.all()
     return render_template('distributors.html', distributors=distributors)
 
-@app.route('/distributors/new', methods=['GET', 'POST'])
+@main.route('/distributors/new', methods=['GET', 'POST'])
 @login_required
 def new_distributor():
     if request.method == 'POST':
@@ -467,14 +486,14 @@ def new_distributor():
         try:
             db.session.commit()
             flash('Distributor added successfully!', 'success')
-            return redirect(url_for('distributors'))
+            return redirect(url_for('main.distributors'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error creating distributor: {str(e)}', 'danger')
     
     return render_template('distributor_form.html')
 
-@app.route('/distributors/<int:id>/edit', methods=['GET', 'POST'])
+@main.route('/distributors/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_distributor(id):
     distributor = Distributor.query.get_or_404(id)
@@ -503,14 +522,14 @@ def edit_distributor(id):
         try:
             db.session.commit()
             flash('Distributor updated successfully!', 'success')
-            return redirect(url_for('distributors'))
+            return redirect(url_for('main.distributors'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error updating distributor: {str(e)}', 'danger')
     
     return render_template('distributor_form.html', distributor=distributor)
 
-@app.route('/distributors/<int:id>/delete', methods=['GET', 'POST'])
+@main.route('/distributors/<int:id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_distributor(id):
     distributor = Distributor.query.get_or_404(id)
@@ -523,10 +542,10 @@ def delete_distributor(id):
         db.session.rollback()
         flash(f'Error deleting distributor: {str(e)}', 'danger')
     
-    return redirect(url_for('distributors'))
+    return redirect(url_for('main.distributors'))
 
 # Target Routes
-@app.route('/targets')
+@main.route('/targets')
 @login_required
 def targets():
     # Get current date for default values
@@ -621,7 +640,7 @@ def targets():
         targets=targets
     )
 
-@app.route('/targets/new', methods=['GET', 'POST'])
+@main.route('/targets/new', methods=['GET', 'POST'])
 @login_required
 def new_target():
     distributors = Distributor.query.all()
@@ -663,7 +682,7 @@ def new_target():
             db.session.add(target)
             db.session.commit()
             flash('Target added successfully!', 'success')
-            return redirect(url_for('targets'))
+            return redirect(url_for('main.targets'))
             
         except Exception as e:
             db.session.rollback()
@@ -674,7 +693,7 @@ def new_target():
     
     return render_template('target_form.html', distributors=distributors, financial_years=financial_years)
 
-@app.route('/targets/<int:id>/edit', methods=['GET', 'POST'])
+@main.route('/targets/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_target(id):
     target = Target.query.get_or_404(id)
@@ -714,7 +733,7 @@ def edit_target(id):
             
             db.session.commit()
             flash('Target updated successfully!', 'success')
-            return redirect(url_for('targets'))
+            return redirect(url_for('main.targets'))
             
         except Exception as e:
             db.session.rollback()
@@ -725,7 +744,7 @@ def edit_target(id):
     
     return render_template('target_form.html', target=target, distributors=distributors, financial_years=financial_years)
 
-@app.route('/targets/<int:id>/delete', methods=['GET', 'POST'])
+@main.route('/targets/<int:id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_target(id):
     target = Target.query.get_or_404(id)
@@ -738,10 +757,10 @@ def delete_target(id):
         db.session.rollback()
         flash(f'Error deleting target: {str(e)}', 'danger')
     
-    return redirect(url_for('targets'))
+    return redirect(url_for('main.targets'))
 
 # Actual Sales Routes
-@app.route('/actuals')
+@main.route('/actuals')
 @login_required
 def actuals():
     # Get current date for default values
@@ -821,7 +840,7 @@ def actuals():
         actuals=actuals
     )
 
-@app.route('/actuals/new', methods=['GET', 'POST'])
+@main.route('/actuals/new', methods=['GET', 'POST'])
 @login_required
 def new_actual():
     distributors = Distributor.query.all()
@@ -866,7 +885,7 @@ def new_actual():
             db.session.add(actual)
             db.session.commit()
             flash('Sales logged successfully!', 'success')
-            return redirect(url_for('actuals'))
+            return redirect(url_for('main.actuals'))
             
         except Exception as e:
             db.session.rollback()
@@ -880,7 +899,7 @@ def new_actual():
                           current_week_start=current_week_start,
                           current_week_end=current_week_end)
 
-@app.route('/actuals/<int:id>/edit', methods=['GET', 'POST'])
+@main.route('/actuals/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_actual(id):
     actual = Actual.query.get_or_404(id)
@@ -923,7 +942,7 @@ def edit_actual(id):
             
             db.session.commit()
             flash('Sales updated successfully!', 'success')
-            return redirect(url_for('actuals'))
+            return redirect(url_for('main.actuals'))
             
         except Exception as e:
             db.session.rollback()
@@ -931,7 +950,7 @@ def edit_actual(id):
     
     return render_template('actual_form.html', actual=actual, distributors=distributors)
 
-@app.route('/actuals/<int:id>/delete', methods=['GET', 'POST'])
+@main.route('/actuals/<int:id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_actual(id):
     actual = Actual.query.get_or_404(id)
@@ -944,17 +963,77 @@ def delete_actual(id):
         db.session.rollback()
         flash(f'Error deleting sales record: {str(e)}', 'danger')
     
-    return redirect(url_for('actuals'))
+    return redirect(url_for('main.actuals'))
+
+@main.route('/actuals/import', methods=['GET', 'POST'])
+@login_required
+def import_actuals_upload():
+    result = None
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or XLSX file to import', 'danger')
+            return render_template('import_actuals.html')
+        
+        try:
+            result = import_actuals(upload.stream, upload.filename, db, Actual, Distributor)
+            flash(f"{result['imported']} sales records imported, {result['rejected_count']} rows rejected", 
+                  'success' if not result['rejected_count'] else 'warning')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error importing sales: {str(e)}', 'danger')
+    
+    return render_template('import_actuals.html', result=result)
+
+@main.cli.command('import-actuals')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per transaction')
+def import_actuals_command(path, chunk_size):
+    """Import weekly actuals from a CSV or XLSX file"""
+    with open(path, 'rb') as f:
+        result = import_actuals(f, path, db, Actual, Distributor, chunk_size=chunk_size)
+    
+    click.echo(f"Imported {result['imported']} sales records")
+    for rejected in result['rejected']:
+        click.echo(f"Rejected row {rejected['row']}: {rejected['reason']}")
+    if result['rejected_count'] > len(result['rejected']):
+        click.echo(f"... and {result['rejected_count'] - len(result['rejected'])} more rejected rows")
+
+@main.cli.command('seed-synthetic')
+@click.option('--distributors', type=click.IntRange(10, 5000), default=100, show_default=True,
+              help='Synthetic distributors to create')
+@click.option('--years', type=click.IntRange(1, 10), default=3, show_default=True,
+              help='Financial years of weekly actuals and monthly targets')
+@click.option('--seed', default=42, show_default=True, help='Random seed')
+@click.option('--reset', is_flag=True, help='Replace synthetic data from an earlier run')
+def seed_synthetic_command(distributors, years, seed, reset):
+    """Generate synthetic distributors, actuals and targets for benchmarking"""
+    from database.synthetic import seed_synthetic_data, clear_synthetic_data
+    
+    def seed_data():
+        if reset:
+            clear_synthetic_data(db, Distributor, Target, Actual)
+        return seed_synthetic_data(db, Distributor, Target, Actual, distributors=distributors, years=years, seed=seed)
+    
+    try:
+        counts = run_in_write_transaction(db, seed_data)
+    except ValueError as e:
+        raise click.ClickException(f"{str(e)} (pass --reset)")
+    click.echo(f"Created {counts['distributors']} distributors, {counts['targets']} targets "
+               f"and {counts['actuals']} actuals")
 
 # Report Routes
-@app.route('/generate_summary_pdf')
+@main.route('/generate_summary_pdf')
 @login_required
 def summary_pdf():
     # Pass db, Actual, Target to the function
     from utils import generate_summary_pdf
-    distributors = Distributor.query.all()
-    # Correctly pass db, Actual, Target
-    pdf_data = generate_summary_pdf(distributors, db, Actual, Target) 
+    with metrics.EXPORT_DURATION.time(job="summary_pdf"):
+        distributors = Distributor.query.all()
+        # Correctly pass db, Actual, Target
+        pdf_data = generate_summary_pdf(distributors, db, Actual, Target)
     # Helper for timestamp
     export_time = datetime.now().strftime('%Y%m%d_%H%M')
     return send_file(
@@ -964,14 +1043,15 @@ def summary_pdf():
         download_name=f'summary_report_{export_time}.pdf'
     )
 
-@app.route('/bulk_export_pdf')
+@main.route('/bulk_export_pdf')
 @login_required
 def bulk_export_pdf():
     # Pass db, Actual, Target to the function
     from utils import generate_bulk_pdf
-    distributors = Distributor.query.all()
-    # Correctly pass db, Actual, Target
-    pdf_data = generate_bulk_pdf(distributors, db, Actual, Target) 
+    with metrics.EXPORT_DURATION.time(job="bulk_export_pdf"):
+        distributors = Distributor.query.all()
+        # Correctly pass db, Actual, Target
+        pdf_data = generate_bulk_pdf(distributors, db, Actual, Target)
     # Helper for timestamp
     export_time = datetime.now().strftime('%Y%m%d_%H%M')
     return send_file(
@@ -981,7 +1061,7 @@ def bulk_export_pdf():
         download_name=f'bulk_reports_{export_time}.pdf'
     )
 
-@app.route('/reports')
+@main.route('/reports')
 @login_required
 def reports():
     # Get current date for default values
@@ -1005,6 +1085,7 @@ def reports():
     # Get all months
     months = ['All', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
 
+    start_phase("aggregate")
     # Fetch performance data for the selected period
     performance_data = []
     query_distributors = Distributor.query.all() # Fetch all distributors initially
@@ -1107,6 +1188,7 @@ def reports():
 
     # Sort data if needed, e.g., by name
     performance_data.sort(key=lambda x: x['name'])
+    end_phase("aggregate")
 
     return render_template(
         'reports.html',
@@ -1120,7 +1202,7 @@ def reports():
     )
 
 
-@app.route('/generate_report/<report_type>', methods=['POST'])
+@main.route('/generate_report/<report_type>', methods=['POST'])
 @login_required
 def generate_report(report_type):
     distributor_id = request.form.get('distributor_id')
@@ -1130,7 +1212,7 @@ def generate_report(report_type):
     
     if not all([distributor_id, financial_year, month]):
         flash('All fields are required', 'danger')
-        return redirect(url_for('reports'))
+        return redirect(url_for('main.reports'))
     
     # Get distributor
     distributor = Distributor.query.get_or_404(distributor_id)
@@ -1172,9 +1254,9 @@ def generate_report(report_type):
         )
     
     flash('Invalid report type', 'danger')
-    return redirect(url_for('reports'))
+    return redirect(url_for('main.reports'))
 
-@app.route('/send_email_report', methods=['POST'])
+@main.route('/send_email_report', methods=['POST'])
 @login_required
 def send_email_report_route():
     distributor_id = request.form.get('distributor_id')
@@ -1185,7 +1267,7 @@ def send_email_report_route():
     
     if not all([distributor_id, financial_year, month, email]):
         flash('All fields are required', 'danger')
-        return redirect(url_for('reports'))
+        return redirect(url_for('main.reports'))
     
     # Get distributor
     distributor = Distributor.query.get_or_404(distributor_id)
@@ -1207,9 +1289,9 @@ def send_email_report_route():
     except Exception as e:
         flash(f'Error sending email: {str(e)}', 'danger')
     
-    return redirect(url_for('reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
+    return redirect(url_for('main.reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
 
-@app.route('/bulk_export_reports', methods=['POST'])
+@main.route('/bulk_export_reports', methods=['POST'])
 @login_required
 def bulk_export_reports():
     financial_year = request.form.get('financial_year')
@@ -1218,34 +1300,35 @@ def bulk_export_reports():
     
     if not all([financial_year, month]):
         flash('Financial year and month are required', 'danger')
-        return redirect(url_for('reports'))
+        return redirect(url_for('main.reports'))
     
     # Get all distributors
     distributors = Distributor.query.all()
     
     if not distributors:
         flash('No distributors found', 'warning')
-        return redirect(url_for('reports'))
+        return redirect(url_for('main.reports'))
     
     # Create period identifier for database query (e.g., "Apr-FY24-25")
     period_identifier = f"{month}-{financial_year}"
     
     # Create a ZIP file with reports for all distributors
     memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w') as zf:
-        for distributor in distributors:
-            # Get performance data
-            performance_data = generate_performance_data(distributor.id, 'Monthly', period_identifier, db, Actual, Target)
+    with metrics.EXPORT_DURATION.time(job="bulk_export_reports"):
+        with zipfile.ZipFile(memory_file, 'w') as zf:
+            for distributor in distributors:
+                # Get performance data
+                performance_data = generate_performance_data(distributor.id, 'Monthly', period_identifier, db, Actual, Target)
             
-            # Generate PDF report
-            pdf_data = generate_pdf_report(distributor.name, 'Monthly', period_identifier, performance_data)
-            pdf_filename = f"{distributor.name}_Report_{month}_{financial_year}.pdf"
-            zf.writestr(pdf_filename, pdf_data)
+                # Generate PDF report
+                pdf_data = generate_pdf_report(distributor.name, 'Monthly', period_identifier, performance_data)
+                pdf_filename = f"{distributor.name}_Report_{month}_{financial_year}.pdf"
+                zf.writestr(pdf_filename, pdf_data)
             
-            # Generate Excel report
-            excel_data = generate_excel_report(distributor.name, 'Monthly', period_identifier, performance_data)
-            excel_filename = f"{distributor.name}_Report_{month}_{financial_year}.xlsx"
-            zf.writestr(excel_filename, excel_data)
+                # Generate Excel report
+                excel_data = generate_excel_report(distributor.name, 'Monthly', period_identifier, performance_data)
+                excel_filename = f"{distributor.name}_Report_{month}_{financial_year}.xlsx"
+                zf.writestr(excel_filename, excel_data)
     
     # Reset file pointer
     memory_file.seek(0)
@@ -1262,7 +1345,7 @@ def bulk_export_reports():
     )
 
 # AJAX Routes
-@app.route('/api/periods/<period_type>')
+@main.route('/api/periods/<period_type>')
 @login_required
 def get_periods(period_type):
     today = datetime.now()
@@ -1294,7 +1377,155 @@ def get_periods(period_type):
     
     return jsonify(periods)
 
-@app.route('/email/test', methods=['GET', 'POST'])
+@main.route('/api/ingest', methods=['POST'])
+@login_required
+def ingest_api():
+    """Upsert batches of actuals and targets posted as JSON by integration jobs."""
+    idempotency_key = request.headers.get('Idempotency-Key')
+    # A key only replays for the same user sending the same body
+    request_hash = hashlib.sha256(
+        f"{current_user.get_id()}\n".encode() + request.get_data()
+    ).hexdigest() if idempotency_key else None
+    
+    def replay(stored):
+        # Keys stored before request hashes were recorded match any request
+        if stored.request_hash is not None and stored.request_hash != request_hash:
+            return jsonify({
+                'status': 'error',
+                'message': 'Idempotency-Key was already used with a different request'
+            }), 422
+        response = jsonify(json.loads(stored.response_json))
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    
+    # Replay the stored response for a retried request
+    if idempotency_key:
+        stored = IdempotencyKey.query.filter_by(key=idempotency_key).first()
+        if stored:
+            return replay(stored)
+    
+    payload = request.get_json(silent=True)
+    
+    def write_batch():
+        results = ingest_records(payload, db, Actual, Target, Distributor)
+        body = {'status': 'success', **results}
+        
+        # Store the response in the same transaction as the data it describes
+        if idempotency_key:
+            db.session.add(IdempotencyKey(
+                key=idempotency_key, request_hash=request_hash, response_json=json.dumps(body)
+            ))
+        return body
+    
+    try:
+        body = run_in_write_transaction(db, write_batch)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except IntegrityError:
+        # A concurrent request with the same key committed first
+        db.session.rollback()
+        stored = IdempotencyKey.query.filter_by(key=idempotency_key).first() if idempotency_key else None
+        if not stored:
+            raise
+        return replay(stored)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error ingesting records: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Failed to save records'}), 500
+    
+    return jsonify(body)
+
+@main.route('/api/changes')
+@login_required
+def get_changes():
+    """Return changes to actuals, targets and distributors after the 'since' cursor."""
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "'since' and 'limit' must be integers"}), 400
+    if changes_pruned_after(db, ChangeLog, since):
+        return jsonify({
+            'status': 'error',
+            'resync_required': True,
+            'message': "Resync required: changes after 'since' were pruned from the change log"
+        }), 410
+    
+    return jsonify(get_changes_since(db, ChangeLog, since, limit))
+
+@main.route('/api/sync')
+@login_required
+def sync_api():
+    """Return distributors, targets and actuals changed since the client's sync token."""
+    try:
+        token = request.args.get('token')
+        token = int(token) if token not in (None, '') else None
+        limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': "'token' and 'limit' must be integers"}), 400
+    # Without a token the client pages through a full snapshot, passing back
+    # 'snapshot_token' until a response carries a 'token' instead
+    snapshot_token = request.args.get('snapshot_token') or None
+    if token is not None and changes_pruned_after(db, ChangeLog, token):
+        # The client starts over with a snapshot by calling again without a token
+        return jsonify({
+            'status': 'error',
+            'resync_required': True,
+            'message': "Resync required: changes after 'token' were pruned from the change log"
+        }), 410
+    
+    models = {'distributor': Distributor, 'target': Target, 'actual': Actual}
+    try:
+        return jsonify(get_sync_delta(db, ChangeLog, models, token, limit, snapshot_token))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@main.route('/api/db/contention')
+@login_required
+def db_contention():
+    """Report write-lock waits, busy errors and retries since startup."""
+    return jsonify(get_contention_metrics())
+
+@main.route('/api/db/queries')
+@login_required
+def db_queries():
+    """Report statement counts, database time and repeated statements per route since startup."""
+    return jsonify(get_query_stats())
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """Expose in-process metrics in the Prometheus text format."""
+    if not current_app.config.get("METRICS"):
+        return "Metrics are disabled", 404
+    # Scrapers don't log in; a bearer token can be required instead
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return current_app.response_class(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@main.route('/profiles')
+@login_required
+def profiles():
+    """List recent request profiles captured with X-Profile or ?_profile."""
+    if not is_profile_admin(current_user):
+        abort(403)
+    return render_template('profiles.html', profiles=list_profiles())
+
+@main.route('/profiles/<profile_id>.<any(prof, txt):kind>')
+@login_required
+def download_profile(profile_id, kind):
+    """Download a profile's cProfile stats or show its text summary."""
+    if not is_profile_admin(current_user):
+        abort(403)
+    try:
+        path = profile_file(profile_id, f".{kind}")
+    except FileNotFoundError:
+        abort(404)
+    if kind == 'txt':
+        return send_file(path, mimetype='text/plain')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f"{profile_id}.prof")
+
+@main.route('/email/test', methods=['GET', 'POST'])
 @login_required
 def test_email():
     if request.method == 'POST':
@@ -1327,7 +1558,7 @@ def test_email():
     return render_template('email_test.html', config_status=config_status)
 
 # Backup Routes
-@app.route('/backup', methods=['GET', 'POST'])
+@main.route('/backup', methods=['GET', 'POST'])
 @login_required
 def backup_page():
     # Local backups are always available
@@ -1337,26 +1568,47 @@ def backup_page():
     
     if request.method == 'POST':
         if 'perform_backup' in request.form:
-            # Perform manual backup
-            success = perform_backup()
-            if success:
-                success_message = "Backup created successfully!"
+            # Start a manual backup in the background backup process
+            if run_backup_process(wait=False):
+                success_message = "Backup started. It runs in the background and will appear below when finished."
             else:
-                error_message = "Failed to create backup. Check logs for details."
+                error_message = "A backup is already running. Please wait for it to finish."
         elif 'restore_backup' in request.form:
             # Restore from selected backup
             backup_id = request.form.get('backup_id')
             if backup_id:
-                success = restore_from_backup(backup_id)
+                success = restore_from_backup(backup_id, quiesce=quiesce_database)
                 if success:
                     success_message = f"Database restored successfully from backup {backup_id}!"
                 else:
                     error_message = f"Failed to restore from backup {backup_id}. Check logs for details."
             else:
                 error_message = "No backup selected for restore."
+        elif 'verify_backups' in request.form:
+            # Verify checksums and integrity of every backup in the background
+            if start_verification():
+                success_message = "Verification started. The results will appear below when it finishes."
+            else:
+                error_message = "Backups are already being verified. Please wait for it to finish."
+        elif 'restore_point_in_time' in request.form:
+            # Rebuild the database as it was at the chosen time from the WAL archive
+            target = request.form.get('target_time', '')
+            try:
+                target_time = datetime.fromisoformat(target)
+            except ValueError:
+                target_time = None
+            if target_time:
+                success = restore_to_point_in_time(target_time, quiesce=quiesce_database)
+                if success:
+                    success_message = f"Database restored to {target_time.strftime('%Y-%m-%d %H:%M:%S')}!"
+                else:
+                    error_message = "Failed to restore to that time. Check logs for details."
+            else:
+                error_message = "Please choose a valid date and time to restore to."
     
     # Get available backups
     available_backups = get_available_backups() if is_configured else []
+    recovery_window = get_recovery_window() if is_configured else None
     
     # Flash messages if any
     if success_message:
@@ -1364,9 +1616,10 @@ def backup_page():
     if error_message:
         flash(error_message, 'danger')
     
-    return render_template('backup.html', is_configured=is_configured, available_backups=available_backups)
+    return render_template('backup.html', is_configured=is_configured, available_backups=available_backups,
+                         recovery_window=recovery_window, backup_status=get_backup_status())
 
-@app.route('/send_to_distributor', methods=['POST'])
+@main.route('/send_to_distributor', methods=['POST'])
 @login_required
 def send_to_distributor():
     distributor_id = request.form.get('distributor_id')
@@ -1376,7 +1629,7 @@ def send_to_distributor():
     
     if not all([distributor_id, financial_year, month]):
         flash('All fields are required', 'danger')
-        return redirect(url_for('reports'))
+        return redirect(url_for('main.reports'))
     
     # Get distributor
     distributor = Distributor.query.get_or_404(distributor_id)
@@ -1384,7 +1637,7 @@ def send_to_distributor():
     # Verify distributor has an email
     if not distributor.email:
         flash('Selected distributor does not have an email address', 'danger')
-        return redirect(url_for('reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
+        return redirect(url_for('main.reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
     
     # Create period identifier for database query (e.g., "Apr-FY24-25")
     period_identifier = f"{month}-{financial_year}"
@@ -1403,15 +1656,15 @@ def send_to_distributor():
     except Exception as e:
         flash(f'Error sending email: {str(e)}', 'danger')
     
-    return redirect(url_for('reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
+    return redirect(url_for('main.reports', financial_year=financial_year, month=month, date_range=date_range, distributor_id=distributor_id))
 
-@app.route('/api/months/<financial_year>')
+@main.route('/api/months/<financial_year>')
 @login_required
 def get_months(financial_year):
     month_names = ['All', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec', 'Jan', 'Feb', 'Mar']
     return jsonify(month_names)
 
-@app.route('/api/date_range/<financial_year>/<month>')
+@main.route('/api/date_range/<financial_year>/<month>')
 @login_required
 def get_date_range(financial_year, month):
     """Return the date range for a given financial year and month."""
@@ -1494,25 +1747,25 @@ def get_date_range(financial_year, month):
     # By default, return the first week's date range (which is now the full month)
     return jsonify(month_range if weeks else "No dates available")
 
-@app.route('/batch_targets', methods=['GET'])
+@main.route('/batch_targets', methods=['GET'])
 @login_required
 def batch_targets():
     # Redirect to the main targets page
-    return redirect(url_for('targets'))
+    return redirect(url_for('main.targets'))
 
-@app.route('/batch_target_entry', methods=['GET'])
+@main.route('/batch_target_entry', methods=['GET'])
 @login_required
 def batch_target_entry():
     # Redirect to the main targets page
-    return redirect(url_for('targets'))
+    return redirect(url_for('main.targets'))
 
-@app.route('/batch_sales_entry', methods=['GET'])
+@main.route('/batch_sales_entry', methods=['GET'])
 @login_required
 def batch_sales_entry():
     # Redirect to the main actuals page
-    return redirect(url_for('actuals'))
+    return redirect(url_for('main.actuals'))
 
-@app.route('/save_batch_targets', methods=['POST'])
+@main.route('/save_batch_targets', methods=['POST'])
 @login_required
 def save_batch_targets():
     financial_year = request.form.get('financial_year')
@@ -1522,122 +1775,32 @@ def save_batch_targets():
     
     if not all([financial_year, month, date_range]) or not distributor_ids:
         flash('Please select at least one distributor and specify the period', 'danger')
-        return redirect(url_for('targets'))
+        return redirect(url_for('main.targets'))
     
     # Create period identifier for database (e.g., "Apr-FY24-25")
     period_identifier = f"{month}-{financial_year}"
     
+    # Parse the date range once for the whole batch (not stored for 'All')
+    week_start_date = week_end_date = None
+    if month != 'All' and date_range:
+        try:
+            week_start_date, week_end_date = parse_date_range(date_range, financial_year, month)
+        except ValueError as e:
+            # Log error but continue without the date range
+            current_app.logger.error(f"Error parsing date range: {str(e)}")
+    
     try:
-        # Process each selected distributor
-        updated_count = 0
-        new_count = 0
-        
-        for distributor_id in distributor_ids:
-            target_value = request.form.get(f'target_values[{distributor_id}]')
-            if not target_value or float(target_value) <= 0:
-                continue
-                
-            # Check if target already exists
-            existing = Target.query.filter_by(
-                distributor_id=distributor_id,
-                period_type='Monthly',
-                period_identifier=period_identifier
-            ).first()
-            
-            if existing:
-                # Update existing target
-                existing.target_value = float(target_value)
-                
-                # If we have date range info and it's not 'All' month, update the week dates
-                if month != 'All' and date_range:
-                    try:
-                        # Parse date range to get actual dates
-                        date_parts = date_range.split(' - ')
-                        if len(date_parts) == 2:
-                            # Parse the financial year
-                            fy_start_year = int("20" + financial_year[2:4])
-                            
-                            # Map month names to numbers
-                            month_map = {
-                                'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
-                                'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
-                            }
-                            
-                            # Determine the default year for this month
-                            month_num = month_map.get(month, 1)
-                            default_year = fy_start_year if month_num >= 4 else fy_start_year + 1
-                            
-                            # Parse start date
-                            start_parts = date_parts[0].strip().split(' ')
-                            start_day = int(start_parts[0])
-                            start_month = start_parts[1]
-                            start_year = int(start_parts[2]) if len(start_parts) > 2 else default_year
-                            
-                            # Parse end date
-                            end_parts = date_parts[1].strip().split(' ')
-                            end_day = int(end_parts[0])
-                            end_month = end_parts[1]
-                            end_year = int(end_parts[2]) if len(end_parts) > 2 else default_year
-                            
-                            # Create date objects
-                            existing.week_start_date = datetime(start_year, month_map[start_month], start_day).strftime('%Y-%m-%d')
-                            existing.week_end_date = datetime(end_year, month_map[end_month], end_day).strftime('%Y-%m-%d')
-                    except Exception as e:
-                        # Log error but continue with the update
-                        app.logger.error(f"Error updating date range: {str(e)}")
-                
-                updated_count += 1
-            else:
-                # Create new target
-                new_target = Target(
-                    distributor_id=distributor_id,
-                    period_type='Monthly',
-                    period_identifier=period_identifier,
-                    target_value=float(target_value)
-                )
-                
-                # If we have date range info and it's not 'All' month, set the week dates
-                if month != 'All' and date_range:
-                    try:
-                        # Parse date range to get actual dates
-                        date_parts = date_range.split(' - ')
-                        if len(date_parts) == 2:
-                            # Parse the financial year
-                            fy_start_year = int("20" + financial_year[2:4])
-                            
-                            # Map month names to numbers
-                            month_map = {
-                                'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
-                                'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
-                            }
-                            
-                            # Determine the default year for this month
-                            month_num = month_map.get(month, 1)
-                            default_year = fy_start_year if month_num >= 4 else fy_start_year + 1
-                            
-                            # Parse start date
-                            start_parts = date_parts[0].strip().split(' ')
-                            start_day = int(start_parts[0])
-                            start_month = start_parts[1]
-                            start_year = int(start_parts[2]) if len(start_parts) > 2 else default_year
-                            
-                            # Parse end date
-                            end_parts = date_parts[1].strip().split(' ')
-                            end_day = int(end_parts[0])
-                            end_month = end_parts[1]
-                            end_year = int(end_parts[2]) if len(end_parts) > 2 else default_year
-                            
-                            # Create date objects
-                            new_target.week_start_date = datetime(start_year, month_map[start_month], start_day).strftime('%Y-%m-%d')
-                            new_target.week_end_date = datetime(end_year, month_map[end_month], end_day).strftime('%Y-%m-%d')
-                    except Exception as e:
-                        # Log error but continue with the creation
-                        app.logger.error(f"Error setting date range: {str(e)}")
-                
-                db.session.add(new_target)
-                new_count += 1
-        
-        db.session.commit()
+        # Upsert every selected distributor's target in one statement
+        target_values = {
+            distributor_id: request.form.get(f'target_values[{distributor_id}]')
+            for distributor_id in distributor_ids
+        }
+        outcomes = run_in_write_transaction(db, lambda: upsert_targets(
+            db, Target, target_values, 'Monthly', period_identifier,
+            week_start_date, week_end_date
+        ))
+        new_count = sum(1 for outcome in outcomes.values() if outcome == 'new')
+        updated_count = sum(1 for outcome in outcomes.values() if outcome == 'updated')
         
         if updated_count > 0 or new_count > 0:
             message = []
@@ -1654,9 +1817,9 @@ def save_batch_targets():
         flash(f'Error saving targets: {str(e)}', 'danger')
         print(f"Error details: {e}")  # For debugging
     
-    return redirect(url_for('targets'))
+    return redirect(url_for('main.targets'))
 
-@app.route('/save_batch_sales', methods=['POST'])
+@main.route('/save_batch_sales', methods=['POST'])
 @login_required
 def save_batch_sales():
     financial_year = request.form.get('financial_year')
@@ -1666,14 +1829,14 @@ def save_batch_sales():
     
     if not all([financial_year, month, date_range]) or not distributor_ids:
         flash('Please select at least one distributor and specify the period', 'danger')
-        return redirect(url_for('actuals'))
+        return redirect(url_for('main.actuals'))
     
     try:
         # Parse date range to get actual dates
         date_parts = date_range.split(' - ')
         if len(date_parts) != 2:
             flash('Invalid date range format', 'danger')
-            return redirect(url_for('actuals'))
+            return redirect(url_for('main.actuals'))
         
         # Parse date parts format: "DD MMM" or "DD MMM YYYY"
         try:
@@ -1707,46 +1870,50 @@ def save_batch_sales():
             week_end_date = datetime(end_year, month_map[end_month], end_day).strftime('%Y-%m-%d')
         except (ValueError, KeyError) as e:
             flash(f'Error parsing date range: {str(e)}', 'danger')
-            return redirect(url_for('actuals'))
-        
-        # Process each selected distributor
-        updated_count = 0
-        new_count = 0
+            return redirect(url_for('main.actuals'))
         
+        # Read the form and work out the period before taking the write lock
+        sales_values = {}
         for distributor_id in distributor_ids:
             sales_value = request.form.get(f'sales_values[{distributor_id}]')
-            if not sales_value or float(sales_value) <= 0:
-                continue
-                
-            # Check if sales record already exists for this period
-            existing = Actual.query.filter_by(
-                distributor_id=distributor_id,
-                week_start_date=week_start_date,
-                week_end_date=week_end_date
-            ).first()
+            if sales_value and float(sales_value) > 0:
+                sales_values[int(distributor_id)] = float(sales_value)
+        calculated_month, calculated_quarter, calculated_year = calculate_periods(week_start_date)
+        
+        # Process each selected distributor in one write transaction
+        def save_sales():
+            # Sales records that already exist for this period, fetched in one query
+            existing_ids = dict(db.session.query(Actual.distributor_id, Actual.id).filter(
+                Actual.distributor_id.in_(list(sales_values)),
+                Actual.week_start_date == week_start_date,
+                Actual.week_end_date == week_end_date
+            ).all())
             
-            if existing:
-                # Update existing sales record
-                existing.actual_sales = float(sales_value)
-                updated_count += 1
-            else:
-                # Calculate period identifiers
-                calculated_month, calculated_quarter, calculated_year = calculate_periods(week_start_date)
-                
-                # Create new sales record
-                new_actual = Actual(
-                    distributor_id=distributor_id,
-                    week_start_date=week_start_date,
-                    week_end_date=week_end_date,
-                    actual_sales=float(sales_value),
-                    month=month,
-                    quarter=calculated_quarter,
-                    year=calculated_year
-                )
-                db.session.add(new_actual)
-                new_count += 1
+            # Update existing sales records and create the rest, one executemany each
+            updates = [
+                {'id': existing_ids[distributor_id], 'actual_sales': sales_value}
+                for distributor_id, sales_value in sales_values.items() if distributor_id in existing_ids
+            ]
+            new_actuals = [
+                {
+                    'distributor_id': distributor_id,
+                    'week_start_date': week_start_date,
+                    'week_end_date': week_end_date,
+                    'actual_sales': sales_value,
+                    'month': month,
+                    'quarter': calculated_quarter,
+                    'year': calculated_year
+                }
+                for distributor_id, sales_value in sales_values.items() if distributor_id not in existing_ids
+            ]
+            if updates:
+                db.session.execute(update(Actual), updates)
+            if new_actuals:
+                db.session.execute(insert(Actual), new_actuals)
+            
+            return len(new_actuals), len(updates)
         
-        db.session.commit()
+        new_count, updated_count = run_in_write_transaction(db, save_sales)
         
         if updated_count > 0 or new_count > 0:
             message = []
@@ -1763,4 +1930,4 @@ def save_batch_sales():
         flash(f'Error saving sales: {str(e)}', 'danger')
         print(f"Error details: {e}")  # For debugging
     
-    return redirect(url_for('actuals'))
+    return redirect(url_for('main.actuals'))
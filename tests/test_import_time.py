@@ -0,0 +1,67 @@
+"""
+Import-time budget for the web app
+
+Runs `python -X importtime` in a fresh interpreter that imports the app and
+builds it with create_app(), which is what every worker does at start-up.
+Report, spreadsheet and email backends must not be imported on that path,
+and importing the routes must stay within a time budget.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only report generation and email delivery need
+HEAVY_MODULES = ["pandas", "numpy", "reportlab", "openpyxl", "smtplib", "email.mime.multipart"]
+
+# Cumulative import time of routes (which pulls in utils and the backup modules)
+ROUTES_IMPORT_BUDGET_MS = float(os.environ.get("ROUTES_IMPORT_BUDGET_MS", 400))
+
+def run_importtime(code, tmp_path):
+    """Run code under -X importtime and return {module: (self_us, cumulative_us)}"""
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / "import_time.db"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+@pytest.fixture(scope="module")
+def startup_imports(tmp_path_factory):
+    return run_importtime("import app; app.create_app()", tmp_path_factory.mktemp("importtime"))
+
+def test_app_startup_skips_heavy_backends(startup_imports):
+    loaded = [name for name in HEAVY_MODULES if name in startup_imports]
+    assert not loaded, f"Imported at start-up but only needed for reports or email: {loaded}"
+
+def test_routes_import_within_budget(startup_imports):
+    assert "routes" in startup_imports
+    cumulative_ms = startup_imports["routes"][1] / 1000
+    assert cumulative_ms <= ROUTES_IMPORT_BUDGET_MS, (
+        f"Importing routes took {cumulative_ms:.0f} ms, budget is {ROUTES_IMPORT_BUDGET_MS:.0f} ms"
+    )
+
+def test_startup_does_not_create_database(tmp_path):
+    run_importtime("import app; app.create_app()", tmp_path)
+    assert not (tmp_path / "import_time.db").exists()
+
+def test_backends_load_on_first_use(tmp_path):
+    timings = run_importtime(
+        "import utils; utils.generate_pdf_report('Test', 'Monthly', 'Apr-FY24-25', "
+        "{'target': 100, 'actual': 80, 'achievement_percent': 80, 'shortfall': 20})",
+        tmp_path
+    )
+    # Submodules import first, so the package may not get a line of its own
+    assert any(name.startswith("reportlab.platypus") for name in timings)
+    assert "pandas" not in timings
@@ -0,0 +1,51 @@
+"""
+/metrics exposition
+
+Builds the app against a temporary database and scrapes /metrics with the
+test client, so no Prometheus server is involved.
+"""
+import pytest
+
+import metrics
+
+@pytest.fixture(scope="module")
+def client(make_app, login):
+    return login(make_app("metrics", {"METRICS": True, "QUERY_STATS": True}))
+
+def parse_samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+def test_route_latency_and_statements(client):
+    client.get("/distributors")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    samples = parse_samples(response.get_data(as_text=True))
+    assert samples['http_request_duration_seconds_count{endpoint="main.distributors",method="GET"}'] >= 1
+    assert samples['http_request_duration_seconds_bucket{endpoint="main.distributors",method="GET",le="+Inf"}'] >= 1
+    assert samples['http_requests_total{endpoint="main.distributors",method="GET",status="200"}'] >= 1
+    assert samples['db_statements_per_request_sum{endpoint="main.distributors"}'] >= 1
+    assert 0 <= samples['cache_hit_ratio{cache="sqlalchemy_compiled"}'] <= 1
+    assert "db_busy_errors_total" in samples
+    assert "backup_running" in samples
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_histogram_seconds", "Test histogram", ("job",), buckets=(1, 5))
+    for value in (0.5, 2, 7):
+        histogram.observe(value, job="a")
+    samples = parse_samples(metrics.render())
+    assert samples['test_histogram_seconds_bucket{job="a",le="1"}'] == 1
+    assert samples['test_histogram_seconds_bucket{job="a",le="5"}'] == 2
+    assert samples['test_histogram_seconds_bucket{job="a",le="+Inf"}'] == 3
+    assert samples['test_histogram_seconds_sum{job="a"}'] == 9.5
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
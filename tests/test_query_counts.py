@@ -0,0 +1,308 @@
+"""
+Statement counts that must not grow with the data
+
+Every route in routes.py and the report generators in utils run against two
+apps, one seeded with a small synthetic data set and one with a larger set
+(more distributors and more years of actuals and targets). Batch forms,
+imports and ingest payloads carry one entry per distributor. A route that
+queries once per distributor or per row runs more statements on the larger
+app, and the test fails listing the statements whose counts grew.
+
+Routes that still aggregate in a per-distributor loop are marked
+known_n_plus_one. The mark is strict, so a fix that makes one of them
+constant fails the test until the mark is removed.
+"""
+import io
+
+import pytest
+
+from query_stats import install_query_stats, track_queries
+
+SMALL = {"distributors": 5, "years": 2}
+LARGE = {"distributors": 15, "years": 3}
+
+try:
+    import xlsxwriter  # noqa: F401
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
+needs_xlsxwriter = pytest.mark.skipif(not HAS_XLSXWRITER, reason="Excel reports are written with xlsxwriter")
+known_n_plus_one = pytest.mark.xfail(strict=True, raises=AssertionError, reason="queries once per distributor")
+
+def build_app(make_app, distributors, years):
+    from app import db
+
+    # Requests are counted with track_queries() around each call instead of per-request trackers
+    app = make_app("query_counts", {"QUERY_STATS": False}, distributors=distributors, years=years)
+    with app.app_context():
+        install_query_stats(db.engine)
+    return app, describe_data(app)
+
+def describe_data(app):
+    """Ids, names and the period the route cases fill their URLs and forms from"""
+    from datetime import datetime
+    from models import Distributor, Target, Actual
+    from database.synthetic import SYNTHETIC_PREFIX, financial_year_label
+
+    # The last complete financial year, which both data sets cover
+    today = datetime.now()
+    fy_start = (today.year if today.month >= 4 else today.year - 1) - 1
+    fy = financial_year_label(fy_start)
+
+    with app.app_context():
+        synthetic = Distributor.query.filter(
+            Distributor.name.like(f"{SYNTHETIC_PREFIX}%")
+        ).order_by(Distributor.id).all()
+        first, second, last = synthetic[0], synthetic[1], synthetic[-1]
+        return {
+            "fy": fy,
+            "month": "Jun",
+            "date_range": f"03 Jun {fy_start} - 09 Jun {fy_start}",
+            "distributor_ids": [d.id for d in synthetic],
+            "distributor_names": [d.name for d in synthetic],
+            "distributor_id": first.id,
+            "target_id": Target.query.filter_by(distributor_id=first.id).first().id,
+            "actual_id": Actual.query.filter_by(distributor_id=first.id).first().id,
+            # Deleted by the delete cases, which run last
+            "doomed_target_id": Target.query.filter_by(distributor_id=second.id).first().id,
+            "doomed_actual_id": Actual.query.filter_by(distributor_id=second.id).first().id,
+            "doomed_distributor_id": last.id
+        }
+
+@pytest.fixture(scope="module")
+def apps(make_app):
+    return {
+        "small": build_app(make_app, **SMALL),
+        "large": build_app(make_app, **LARGE)
+    }
+
+@pytest.fixture(autouse=True)
+def no_email(monkeypatch):
+    """Report and test emails are accepted without an SMTP server"""
+    import routes
+
+    monkeypatch.setattr(routes, "send_email_report", lambda *args, **kwargs: True)
+    monkeypatch.setattr(routes, "send_test_email", lambda recipient: {"success": True, "message": "Sent"})
+
+def assert_constant(name, small, large):
+    """Fail with the statement shapes whose counts differ between the two data sets"""
+    if small.count == large.count:
+        return
+    changed = sorted(
+        (shape for shape in set(small.shapes) | set(large.shapes) if small.shapes[shape] != large.shapes[shape]),
+        key=lambda shape: large.shapes[shape] - small.shapes[shape], reverse=True
+    )
+    lines = [f"  {small.shapes[shape]} -> {large.shapes[shape]}: {shape}" for shape in changed]
+    raise AssertionError(
+        f"{name} ran {small.count} statements on the small data set and {large.count} on the large one:\n"
+        + "\n".join(lines)
+    )
+
+# Route cases
+
+def route(method, path, make_request=None, anonymous=False, label=None, marks=()):
+    """
+    A request to count
+
+    Args:
+        method (str): HTTP method
+        path (str): URL path, formatted with the data description
+        make_request: Function of the data description returning client.open() keyword arguments
+        anonymous (bool): Send the request without logging in
+        label (str): Told apart from other cases of the same route in the test id
+        marks: pytest marks for the case
+    """
+    case_id = f"{method} {path} ({label})" if label else f"{method} {path}"
+    return pytest.param(method, path, make_request, anonymous, marks=marks, id=case_id)
+
+def period(ctx, **extra):
+    return {"query_string": {"financial_year": ctx["fy"], "month": ctx["month"], **extra}}
+
+def ajax(query):
+    return {**query, "headers": {"X-Requested-With": "XMLHttpRequest"}}
+
+def report_form(ctx):
+    return {"data": {"distributor_id": ctx["distributor_id"], "financial_year": ctx["fy"], "month": ctx["month"],
+                     "email": "reports@example.com"}}
+
+def batch_form(ctx, field, value):
+    return {"data": {
+        "financial_year": ctx["fy"],
+        "month": ctx["month"],
+        "date_range": ctx["date_range"],
+        "distributor_ids": [str(distributor_id) for distributor_id in ctx["distributor_ids"]],
+        **{f"{field}[{distributor_id}]": value for distributor_id in ctx["distributor_ids"]}
+    }}
+
+def import_upload(ctx):
+    rows = ["distributor,week_start_date,week_end_date,actual_sales"]
+    rows += [f"{name},2020-04-06,2020-04-12,150" for name in ctx["distributor_names"]]
+    return {"data": {"file": (io.BytesIO("\n".join(rows).encode()), "actuals.csv")},
+            "content_type": "multipart/form-data"}
+
+def ingest_payload(ctx):
+    return {"json": {
+        "actuals": [{"distributor": name, "week_start": "2020-04-13", "week_end": "2020-04-19", "sales": 120}
+                    for name in ctx["distributor_names"]],
+        "targets": [{"distributor": name, "fy": "FY20-21", "month": "May", "target": 500}
+                    for name in ctx["distributor_names"]]
+    }}
+
+ROUTE_CASES = [
+    route("GET", "/"),
+    route("GET", "/login", anonymous=True),
+    route("POST", "/login", lambda ctx: {"data": {"username": "admin", "password": "admin123"}}, anonymous=True),
+    route("GET", "/logout"),
+
+    route("GET", "/dashboard", label="initial load"),
+    route("GET", "/dashboard", lambda ctx: period(ctx), label="month", marks=known_n_plus_one),
+    route("GET", "/dashboard", lambda ctx: ajax(period(ctx, month="All")), label="all months, JSON",
+          marks=known_n_plus_one),
+    route("GET", "/dashboard", lambda ctx: ajax(period(ctx, date_range=ctx["date_range"])), label="date range, JSON",
+          marks=known_n_plus_one),
+
+    route("GET", "/distributors"),
+    route("GET", "/distributors/new"),
+    route("POST", "/distributors/new", lambda ctx: {"data": {"name": "Query Count Distributor", "area": "North"}}),
+    route("GET", "/distributors/{distributor_id}/edit"),
+    route("POST", "/distributors/{distributor_id}/edit",
+          lambda ctx: {"data": {"name": ctx["distributor_names"][0], "email": "edited@example.com", "area": "South"}}),
+
+    route("GET", "/targets", lambda ctx: period(ctx), label="month", marks=known_n_plus_one),
+    route("GET", "/targets", lambda ctx: period(ctx, month="All"), label="all months", marks=known_n_plus_one),
+    route("GET", "/targets/new"),
+    route("POST", "/targets/new", lambda ctx: {"data": {
+        "distributor_id": ctx["distributor_id"], "financial_year": "FY20-21", "month": "Apr", "target_value": "900"
+    }}),
+    route("GET", "/targets/{target_id}/edit"),
+    route("POST", "/targets/{target_id}/edit", lambda ctx: {"data": {
+        "distributor_id": ctx["distributor_id"], "financial_year": "FY20-21", "month": "Jun", "target_value": "950"
+    }}),
+    route("GET", "/batch_targets"),
+    route("GET", "/batch_target_entry"),
+    route("POST", "/save_batch_targets", lambda ctx: batch_form(ctx, "target_values", "5000")),
+
+    route("GET", "/actuals", lambda ctx: period(ctx), marks=known_n_plus_one),
+    route("GET", "/actuals/new"),
+    route("POST", "/actuals/new", lambda ctx: {"data": {
+        "distributor_id": ctx["distributor_id"], "week_start_date": "2020-04-20", "week_end_date": "2020-04-26",
+        "actual_sales": "300"
+    }}),
+    route("GET", "/actuals/{actual_id}/edit"),
+    route("POST", "/actuals/{actual_id}/edit", lambda ctx: {"data": {
+        "distributor_id": ctx["distributor_id"], "week_start_date": "2020-04-27", "week_end_date": "2020-05-03",
+        "actual_sales": "310"
+    }}),
+    route("GET", "/actuals/import"),
+    route("POST", "/actuals/import", import_upload),
+    route("GET", "/batch_sales_entry"),
+    route("POST", "/save_batch_sales", lambda ctx: batch_form(ctx, "sales_values", "1200")),
+
+    route("GET", "/reports", lambda ctx: period(ctx), label="month", marks=known_n_plus_one),
+    route("GET", "/reports", lambda ctx: period(ctx, month="All"), label="all months", marks=known_n_plus_one),
+    route("GET", "/reports", lambda ctx: period(ctx, distributor_id=ctx["distributor_id"]), label="one distributor"),
+    route("POST", "/generate_report/pdf", report_form),
+    route("POST", "/generate_report/excel", report_form, marks=needs_xlsxwriter),
+    route("POST", "/send_email_report", report_form, marks=needs_xlsxwriter),
+    route("POST", "/send_to_distributor", report_form, marks=needs_xlsxwriter),
+    route("POST", "/bulk_export_reports", lambda ctx: {"data": {"financial_year": ctx["fy"], "month": ctx["month"]}},
+          marks=(needs_xlsxwriter, known_n_plus_one)),
+    route("GET", "/generate_summary_pdf", marks=known_n_plus_one),
+    route("GET", "/bulk_export_pdf", marks=known_n_plus_one),
+
+    route("GET", "/api/periods/Monthly"),
+    route("GET", "/api/months/{fy}"),
+    route("GET", "/api/date_range/{fy}/{month}", lambda ctx: {"query_string": {"all_weeks": "1"}}),
+    route("POST", "/api/ingest", ingest_payload),
+    route("GET", "/api/changes", lambda ctx: {"query_string": {"since": 0}}),
+    route("GET", "/api/sync", lambda ctx: {"query_string": {"limit": 10}}, label="snapshot page"),
+    route("GET", "/api/sync", lambda ctx: {"query_string": {"token": 0, "limit": 10}}, label="delta page"),
+    route("GET", "/api/db/contention"),
+    route("GET", "/api/db/queries"),
+    route("GET", "/metrics", anonymous=True),
+    route("GET", "/profiles"),
+    route("GET", "/profiles/missing.txt"),
+    route("GET", "/email/test"),
+    route("POST", "/email/test", lambda ctx: {"data": {"recipient_email": "reports@example.com"}}),
+    # The backup actions run in the backup process or replace the database file, so only the page is counted
+    route("GET", "/backup"),
+
+    route("POST", "/targets/{doomed_target_id}/delete"),
+    route("POST", "/actuals/{doomed_actual_id}/delete"),
+    route("POST", "/distributors/{doomed_distributor_id}/delete")
+]
+
+def run_route(login, app, ctx, method, path, make_request, anonymous):
+    client = app.test_client() if anonymous else login(app)
+
+    url = path.format(**ctx)
+    kwargs = make_request(ctx) if make_request else {}
+    with track_queries() as tracker:
+        response = client.open(url, method=method, **kwargs)
+    assert response.status_code < 500, f"{method} {url} returned {response.status_code}"
+    return tracker
+
+@pytest.mark.parametrize("method, path, make_request, anonymous", ROUTE_CASES)
+def test_route_statements_are_constant(apps, login, method, path, make_request, anonymous):
+    small = run_route(login, *apps["small"], method, path, make_request, anonymous)
+    large = run_route(login, *apps["large"], method, path, make_request, anonymous)
+    assert_constant(f"{method} {path}", small, large)
+
+def test_every_route_has_a_case(apps):
+    app, ctx = apps["small"]
+    adapter = app.url_map.bind("localhost")
+    covered = set()
+    for case in ROUTE_CASES:
+        method, path = case.values[:2]
+        endpoint, _ = adapter.match(path.format(**ctx), method=method)
+        covered.add(endpoint)
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith("main.")}
+    assert endpoints - covered == set()
+
+# Report generators in utils
+
+def generate(name, make_args, marks=()):
+    return pytest.param(name, make_args, marks=marks, id=name)
+
+def performance_args(ctx):
+    from app import db
+    from models import Actual, Target
+
+    return (ctx["distributor_id"], 'Monthly', f"{ctx['month']}-{ctx['fy']}", db, Actual, Target)
+
+def all_distributors_args(ctx):
+    from app import db
+    from models import Distributor, Actual, Target
+
+    return (Distributor.query.all(), db, Actual, Target)
+
+def report_args(ctx):
+    from utils import generate_performance_data
+
+    performance_data = generate_performance_data(*performance_args(ctx))
+    return ("Query Count Distributor", 'Monthly', f"{ctx['month']}-{ctx['fy']}", performance_data)
+
+GENERATOR_CASES = [
+    generate("generate_performance_data", performance_args),
+    generate("generate_summary_pdf", all_distributors_args, marks=known_n_plus_one),
+    generate("generate_bulk_pdf", all_distributors_args, marks=known_n_plus_one),
+    generate("generate_pdf_report", report_args),
+    generate("generate_excel_report", report_args, marks=needs_xlsxwriter)
+]
+
+def run_generator(app, ctx, name, make_args):
+    import utils
+
+    with app.app_context():
+        args = make_args(ctx)
+        with track_queries() as tracker:
+            getattr(utils, name)(*args)
+    return tracker
+
+@pytest.mark.parametrize("name, make_args", GENERATOR_CASES)
+def test_report_generator_statements_are_constant(apps, name, make_args):
+    small = run_generator(*apps["small"], name, make_args)
+    large = run_generator(*apps["large"], name, make_args)
+    assert_constant(name, small, large)
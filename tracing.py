@@ -0,0 +1,299 @@
+"""
+Local tracing spans in the OpenTelemetry JSON shape
+
+With TRACING=true, every request is a server span. Functions decorated
+with @traced, such as report generation and email delivery, and blocks
+wrapped in span() are recorded as its children. Backups started by the
+scheduler are traced as their own root spans. The current span is kept in a
+ContextVar, so nesting follows the call stack, and copy_context() carries it
+into helper threads. An incoming W3C traceparent header continues the
+caller's trace, and responses carry a traceparent naming theirs.
+
+When a root span ends, the trace's spans are written as one line of
+traces/traces.jsonl in the OTLP/JSON ExportTraceServiceRequest shape (the
+same as the OpenTelemetry Collector's file exporter), so the files can be
+loaded into any OTLP-aware viewer to draw flame charts. The file rotates
+at TRACE_FILE_MAX_BYTES. Set TRACE_MIN_DURATION_MS to keep only traces
+slower than that.
+"""
+import os
+import json
+import time
+import logging
+import secrets
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+TRACING_ENABLED = os.environ.get("TRACING", "false").lower() == "true"
+TRACES_DIR = os.environ.get("TRACES_DIR", "")
+TRACE_FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_BYTES", 10 * 1024 * 1024))
+TRACE_FILE_BACKUPS = int(os.environ.get("TRACE_FILE_BACKUPS", 5))
+TRACE_MIN_DURATION_MS = float(os.environ.get("TRACE_MIN_DURATION_MS", 0))
+
+SERVICE_NAME = "distributor-sales-management"
+SCOPE_NAME = "tracing"
+
+_current_span = ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_writer = None
+
+# Whether spans are recorded; set_tracing_enabled changes it at runtime
+_enabled = TRACING_ENABLED
+
+def set_tracing_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+def tracing_enabled():
+    return _enabled
+
+def _get_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            traces_dir = TRACES_DIR or os.path.join(os.getcwd(), 'traces')
+            os.makedirs(traces_dir, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(traces_dir, "traces.jsonl"),
+                maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _writer = logging.getLogger("tracing.export")
+            _writer.propagate = False
+            _writer.setLevel(logging.INFO)
+            _writer.addHandler(handler)
+        return _writer
+
+def _any_value(value):
+    # OTLP/JSON AnyValue; 64-bit integers are encoded as strings
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _attributes(values):
+    return [{"key": key, "value": _any_value(value)} for key, value in values.items() if value is not None]
+
+class _Trace:
+    """Spans of one trace recorded in this process, written when its local root ends"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.finished = False
+        self.dropped = False
+
+class Span:
+    """A timed operation with attributes, recorded in the OTLP span shape"""
+
+    def __init__(self, name, trace, parent_span_id=None, kind="SPAN_KIND_INTERNAL", attributes=None, root=False):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = {"code": "STATUS_CODE_UNSET"}
+        self.root = root
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append({"timeUnixNano": str(time.time_ns()), "name": name, "attributes": _attributes(attributes)})
+
+    def record_exception(self, error):
+        self.status = {"code": "STATUS_CODE_ERROR", "message": str(error)}
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    def set_error(self, message):
+        self.status = {"code": "STATUS_CODE_ERROR", "message": message}
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        _finish(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": self.status
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+def _finish(span):
+    trace = span.trace
+    with _lock:
+        if trace.dropped:
+            return
+        trace.spans.append(span)
+        if not (span.root or trace.finished):
+            return
+        if span.root:
+            trace.finished = True
+            if (span.end_ns - span.start_ns) / 1e6 < TRACE_MIN_DURATION_MS:
+                trace.dropped = True
+                trace.spans = []
+                return
+        spans, trace.spans = trace.spans, []
+    _export(spans)
+
+def _export(spans):
+    request = {"resourceSpans": [{
+        "resource": {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [span.to_otlp() for span in spans]}]
+    }]}
+    try:
+        _get_writer().info(json.dumps(request, separators=(",", ":")))
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Could not write trace: {str(e)}")
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or None"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+def current_span():
+    """Return the active span, if any"""
+    return _current_span.get()
+
+def start_span(name, kind="SPAN_KIND_INTERNAL", traceparent=None, **attributes):
+    """
+    Start a span as a child of the active span, or as a new root
+
+    The span is not made active; use span() for that. Call end() on it.
+
+    Args:
+        name (str): Span name
+        kind (str): OTLP span kind
+        traceparent (str): W3C header of a remote parent, used when no span is active
+        **attributes: Span attributes
+
+    Returns:
+        Span: The started span, or None when tracing is off
+    """
+    if not _enabled:
+        return None
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace, parent.span_id, kind, attributes)
+    remote = parse_traceparent(traceparent)
+    if remote:
+        return Span(name, _Trace(remote[0]), remote[1], kind, attributes, root=True)
+    return Span(name, _Trace(secrets.token_hex(16)), None, kind, attributes, root=True)
+
+@contextmanager
+def _active(span_obj):
+    token = _current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span_obj.end()
+
+def span(name, **attributes):
+    """
+    Record the block as a span and make it the active span
+
+    Yields the Span, or None when tracing is off.
+    """
+    span_obj = start_span(name, **attributes)
+    if span_obj is None:
+        return nullcontext()
+    return _active(span_obj)
+
+def traced(name=None):
+    """Decorator recording each call of a function as a span"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def init_tracing(app):
+    """Record each request as a server span when TRACING is enabled"""
+    if not app.config.get("TRACING"):
+        return
+    set_tracing_enabled(True)
+
+    from flask import request
+
+    @app.before_request
+    def start_request_span():
+        span_obj = start_span(
+            f"{request.method} {request.path}", kind="SPAN_KIND_SERVER",
+            traceparent=request.headers.get("traceparent"),
+            **{"http.request.method": request.method, "url.path": request.path}
+        )
+        request.environ["tracing.span"] = span_obj
+        request.environ["tracing.token"] = _current_span.set(span_obj)
+
+    @app.after_request
+    def tag_request_span(response):
+        span_obj = request.environ.get("tracing.span")
+        if span_obj is not None:
+            if request.url_rule is not None:
+                span_obj.name = f"{request.method} {request.url_rule.rule}"
+                span_obj.set_attribute("http.route", request.url_rule.rule)
+            span_obj.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 500:
+                span_obj.set_error(f"HTTP {response.status_code}")
+            response.headers["traceparent"] = span_obj.traceparent
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        span_obj = request.environ.pop("tracing.span", None)
+        token = request.environ.pop("tracing.token", None)
+        if token is not None:
+            _current_span.reset(token)
+        if span_obj is not None:
+            if exc is not None:
+                span_obj.record_exception(exc)
+            span_obj.end()
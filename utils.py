@@ -1,17 +1,17 @@
 from datetime import datetime, timedelta
-import pandas as pd
 import io
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
 import os
 import logging
 from sqlalchemy import func # Ensure func is imported
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# pandas, ReportLab and the email modules are only imported once a report or email needs them
+from report_backends import (
+    pd, colors, pagesizes, platypus, stylesheet, canvas, smtplib,
+    mime_multipart, mime_text, mime_application
+)
+from metrics import EMAIL_DURATION, EMAIL_SENDS
+from tracing import traced
 
 def calculate_periods(week_start_date_str):
     """
@@ -146,6 +146,7 @@ def get_period_weeks(period_type, period_identifier):
             
     return []
 
+@traced()
 def generate_performance_data(distributor_id, period_type, period_identifier, db, Actual, Target):
     """
     Generate performance data for a distributor in a specific period
@@ -264,14 +265,13 @@ def generate_performance_data(distributor_id, period_type, period_identifier, db
         'shortfall': shortfall
     }
 
+@traced()
 def generate_summary_pdf(distributors, db, Actual, Target):
     """Generates a summary PDF for all distributors for the current financial year."""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
     from io import BytesIO
     
     buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
+    pdf = canvas.Canvas(buffer, pagesize=pagesizes.letter)
     pdf.setTitle("Distributor Summary Report")
     
     # Get current financial year
@@ -335,13 +335,13 @@ def generate_summary_pdf(distributors, db, Actual, Target):
     buffer.seek(0)
     return buffer.getvalue()
 
+@traced()
 def generate_bulk_pdf(distributors, db, Actual, Target):
     """Generates a combined PDF with individual reports for all distributors for the current financial year."""
-    from reportlab.pdfgen import canvas
     from io import BytesIO
     
     buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter)
+    pdf = canvas.Canvas(buffer, pagesize=pagesizes.letter)
     pdf.setTitle("Bulk Distributor Reports")
     
     # Get current financial year
@@ -401,6 +401,7 @@ def generate_bulk_pdf(distributors, db, Actual, Target):
     buffer.seek(0)
     return buffer.getvalue() # Return the single PDF buffer
 
+@traced()
 def generate_pdf_report(distributor_name, period_type, period_identifier, performance_data):
     """
     Generate PDF report for distributor performance
@@ -417,24 +418,24 @@ def generate_pdf_report(distributor_name, period_type, period_identifier, perfor
     buffer = io.BytesIO()
     
     # Create PDF document
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
+    doc = platypus.SimpleDocTemplate(buffer, pagesize=pagesizes.letter)
+    styles = stylesheet.getSampleStyleSheet()
     elements = []
     
     # Title
     title = f"Performance Report: {distributor_name}"
-    elements.append(Paragraph(title, styles['Title']))
-    elements.append(Spacer(1, 12))
+    elements.append(platypus.Paragraph(title, styles['Title']))
+    elements.append(platypus.Spacer(1, 12))
     
     # Period information
     period_info = f"Period: {period_type} {period_identifier}"
-    elements.append(Paragraph(period_info, styles['Heading2']))
-    elements.append(Spacer(1, 12))
+    elements.append(platypus.Paragraph(period_info, styles['Heading2']))
+    elements.append(platypus.Spacer(1, 12))
     
     # Report date
     report_date = f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    elements.append(Paragraph(report_date, styles['Normal']))
-    elements.append(Spacer(1, 24))
+    elements.append(platypus.Paragraph(report_date, styles['Normal']))
+    elements.append(platypus.Spacer(1, 24))
     
     # Performance data table
     data = [
@@ -445,8 +446,8 @@ def generate_pdf_report(distributor_name, period_type, period_identifier, perfor
         ['Shortfall', f"{int(performance_data['shortfall']):,} cases"]
     ]
     
-    table = Table(data, colWidths=[200, 200])
-    table.setStyle(TableStyle([
+    table = platypus.Table(data, colWidths=[200, 200])
+    table.setStyle(platypus.TableStyle([
         ('BACKGROUND', (0, 0), (1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (1, 0), 'CENTER'),
@@ -459,12 +460,12 @@ def generate_pdf_report(distributor_name, period_type, period_identifier, perfor
     ]))
     
     elements.append(table)
-    elements.append(Spacer(1, 24))
+    elements.append(platypus.Spacer(1, 24))
     
     # Additional notes
-    elements.append(Paragraph("Notes:", styles['Heading3']))
-    elements.append(Paragraph("- Achievement percentage is calculated as (Actual/Target) * 100%", styles['Normal']))
-    elements.append(Paragraph("- Shortfall is calculated as Target - Actual when Actual < Target", styles['Normal']))
+    elements.append(platypus.Paragraph("Notes:", styles['Heading3']))
+    elements.append(platypus.Paragraph("- Achievement percentage is calculated as (Actual/Target) * 100%", styles['Normal']))
+    elements.append(platypus.Paragraph("- Shortfall is calculated as Target - Actual when Actual < Target", styles['Normal']))
     
     # Build PDF
     doc.build(elements)
@@ -473,6 +474,7 @@ def generate_pdf_report(distributor_name, period_type, period_identifier, perfor
     buffer.seek(0)
     return buffer.getvalue()
 
+@traced()
 def generate_excel_report(distributor_name, period_type, period_identifier, performance_data):
     """
     Generate Excel report for distributor performance
@@ -555,6 +557,7 @@ def generate_excel_report(distributor_name, period_type, period_identifier, perf
     buffer.seek(0)
     return buffer.getvalue()
 
+@traced()
 def send_email_report(recipient_email, distributor_name, period_type, period_identifier, pdf_data, excel_data=None):
     """
     Send performance report via email
@@ -572,7 +575,7 @@ def send_email_report(recipient_email, distributor_name, period_type, period_ide
     """
     try:
         # Create message container
-        msg = MIMEMultipart()
+        msg = mime_multipart.MIMEMultipart()
         msg['From'] = os.environ.get('EMAIL_FROM', 'noreply@example.com')
         msg['To'] = recipient_email
         msg['Subject'] = f"Performance Report: {distributor_name} - {period_type} {period_identifier}"
@@ -586,16 +589,16 @@ def send_email_report(recipient_email, distributor_name, period_type, period_ide
         Thank you,
         Distributor Tracking System
         """
-        msg.attach(MIMEText(body, 'plain'))
+        msg.attach(mime_text.MIMEText(body, 'plain'))
         
         # Attach PDF report
-        pdf_attachment = MIMEApplication(pdf_data, _subtype='pdf')
+        pdf_attachment = mime_application.MIMEApplication(pdf_data, _subtype='pdf')
         pdf_attachment.add_header('Content-Disposition', 'attachment', filename=f"{distributor_name}_Report_{period_identifier}.pdf")
         msg.attach(pdf_attachment)
         
         # Attach Excel report if provided
         if excel_data:
-            excel_attachment = MIMEApplication(excel_data, _subtype='xlsx')
+            excel_attachment = mime_application.MIMEApplication(excel_data, _subtype='xlsx')
             excel_attachment.add_header('Content-Disposition', 'attachment', filename=f"{distributor_name}_Report_{period_identifier}.xlsx")
             msg.attach(excel_attachment)
         
@@ -605,16 +608,18 @@ def send_email_report(recipient_email, distributor_name, period_type, period_ide
         smtp_username = os.environ.get('SMTP_USERNAME', '')
         smtp_password = os.environ.get('SMTP_PASSWORD', '')
         
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+        with EMAIL_DURATION.time(kind="report"), smtplib.SMTP(smtp_server, smtp_port) as server:
             server.starttls()
             # Only login if credentials are provided
             if smtp_username and smtp_password:
                 server.login(smtp_username, smtp_password)
             server.send_message(msg)
         
+        EMAIL_SENDS.inc(kind="report", result="success")
         logging.info(f"Email sent successfully to {recipient_email}")
         return True
     except Exception as e:
+        EMAIL_SENDS.inc(kind="report", result="failure")
         logging.error(f"Failed to send email: {str(e)}")
         return False
 
@@ -742,6 +747,368 @@ def get_financial_quarter_dates(fy_quarter):
             datetime(fy_start + 1, 3, 31)
         )
 
+def parse_date_range(date_range, financial_year, month):
+    """
+    Parse a date range string from the batch entry forms into ISO dates
+
+    Accepts "DD MMM - DD MMM" or "DD MMM YYYY - DD MMM YYYY". When the year is
+    omitted it is derived from the financial year and the selected month.
+
+    Args:
+        date_range (str): Date range like "01 Apr - 07 Apr"
+        financial_year (str): Financial year in format "FY24-25"
+        month (str): Selected month name like "Apr" ('All' defaults to April)
+
+    Returns:
+        tuple: (start_date, end_date) as 'YYYY-MM-DD' strings
+
+    Raises:
+        ValueError: If the date range cannot be parsed
+    """
+    date_parts = date_range.split(' - ')
+    if len(date_parts) != 2:
+        raise ValueError(f"Invalid date range format: {date_range}")
+
+    # Parse the financial year
+    fy_start_year = int("20" + financial_year[2:4])
+
+    # Map month names to numbers
+    month_map = {
+        'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+        'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+    }
+
+    # Determine the default year for this month
+    month_num = month_map.get(month, 1) if month != 'All' else 4  # Default to April for 'All'
+    default_year = fy_start_year if month_num >= 4 else fy_start_year + 1
+
+    dates = []
+    for part in date_parts:
+        day_parts = part.strip().split(' ')
+        try:
+            day = int(day_parts[0])
+            part_month = month_map[day_parts[1]]
+            part_year = int(day_parts[2]) if len(day_parts) > 2 else default_year
+        except (IndexError, KeyError) as e:
+            raise ValueError(f"Invalid date in range: {part}") from e
+        dates.append(datetime(part_year, part_month, day).strftime('%Y-%m-%d'))
+
+    return dates[0], dates[1]
+
+def upsert_targets(db, Target, target_values, period_type, period_identifier,
+                   week_start_date=None, week_end_date=None, chunk_size=500):
+    """
+    Insert or update targets for many distributors with one upsert statement
+
+    Rows are written with INSERT ... ON CONFLICT DO UPDATE against the
+    uix_target_distributor_period constraint, so no per-row lookups are needed.
+    Rows whose returned id is above the table's previous maximum were inserted.
+
+    Args:
+        db: Database session
+        Target: Target model
+        target_values (dict): Mapping of distributor_id -> target value
+        period_type (str): Type of period, usually 'Monthly'
+        period_identifier (str): Period identifier like "Apr-FY24-25"
+        week_start_date (str, optional): Start date stored on the targets
+        week_end_date (str, optional): End date stored on the targets
+        chunk_size (int): Maximum rows per execution
+
+    Returns:
+        dict: distributor_id (int) -> 'new', 'updated' or 'skipped'
+    """
+    outcomes = {}
+    rows = []
+
+    for distributor_id, target_value in target_values.items():
+        try:
+            distributor_id = int(distributor_id)
+            target_value = float(target_value)
+        except (TypeError, ValueError):
+            outcomes[distributor_id] = 'skipped'
+            continue
+
+        if target_value <= 0:
+            outcomes[distributor_id] = 'skipped'
+            continue
+
+        rows.append({
+            'distributor_id': distributor_id,
+            'period_type': period_type,
+            'period_identifier': period_identifier,
+            'target_value': target_value,
+            'week_start_date': week_start_date,
+            'week_end_date': week_end_date
+        })
+
+    if not rows:
+        return outcomes
+
+    # Ids above the current maximum can only belong to freshly inserted rows
+    max_id = db.session.query(func.max(Target.id)).scalar() or 0
+
+    # One compiled statement, executed with batches of parameters
+    table = Target.__table__
+    stmt = sqlite_insert(table)
+
+    update_values = {'target_value': stmt.excluded.target_value}
+    if week_start_date and week_end_date:
+        update_values['week_start_date'] = stmt.excluded.week_start_date
+        update_values['week_end_date'] = stmt.excluded.week_end_date
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['distributor_id', 'period_type', 'period_identifier'],
+        set_=update_values
+    ).returning(table.c.id, table.c.distributor_id)
+
+    for start in range(0, len(rows), chunk_size):
+        for target_id, distributor_id in db.session.execute(stmt, rows[start:start + chunk_size]):
+            outcomes[distributor_id] = 'new' if target_id > max_id else 'updated'
+
+    return outcomes
+
+def upsert_actuals(db, Actual, rows, chunk_size=500):
+    """
+    Insert or update weekly actuals with one upsert statement
+
+    Rows are written with INSERT ... ON CONFLICT DO UPDATE against the
+    uix_actual_distributor_week constraint, mirroring upsert_targets.
+
+    Args:
+        db: Database session
+        Actual: Actual model
+        rows (list): Dicts with distributor_id, week_start_date, week_end_date,
+            actual_sales, month, quarter and year
+        chunk_size (int): Maximum rows per execution
+
+    Returns:
+        dict: (distributor_id, week_start_date, week_end_date) -> 'new' or 'updated'
+    """
+    outcomes = {}
+    if not rows:
+        return outcomes
+
+    # Ids above the current maximum can only belong to freshly inserted rows
+    max_id = db.session.query(func.max(Actual.id)).scalar() or 0
+
+    # One compiled statement, executed with batches of parameters
+    table = Actual.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['distributor_id', 'week_start_date', 'week_end_date'],
+        set_={
+            'actual_sales': stmt.excluded.actual_sales,
+            'month': stmt.excluded.month,
+            'quarter': stmt.excluded.quarter,
+            'year': stmt.excluded.year
+        }
+    ).returning(table.c.id, table.c.distributor_id, table.c.week_start_date, table.c.week_end_date)
+
+    for start in range(0, len(rows), chunk_size):
+        results = db.session.execute(stmt, rows[start:start + chunk_size])
+        for actual_id, distributor_id, week_start_date, week_end_date in results:
+            key = (distributor_id, week_start_date, week_end_date)
+            outcomes[key] = 'new' if actual_id > max_id else 'updated'
+
+    return outcomes
+
+def changes_pruned_after(db, ChangeLog, cursor):
+    """
+    Check whether changes after a cursor were pruned from the change log
+
+    Retention deletes the oldest entries, and sequences are never reused or
+    skipped otherwise, so a gap between the cursor and the oldest retained
+    entry means changes the client has not seen are gone.
+
+    Args:
+        db: Database session
+        ChangeLog: ChangeLog model
+        cursor (int): Sequence number of the last change the client processed
+
+    Returns:
+        bool: True if the client must resync instead of reading the log
+    """
+    oldest = db.session.query(func.min(ChangeLog.seq)).scalar()
+    return oldest is not None and cursor < oldest - 1
+
+def get_changes_since(db, ChangeLog, since=0, limit=500):
+    """
+    Get change log entries recorded after a cursor
+
+    Args:
+        db: Database session
+        ChangeLog: ChangeLog model
+        since (int): Sequence number of the last change already processed
+        limit (int): Maximum number of changes to return
+
+    Returns:
+        dict: Changes page with keys:
+            - changes: List of change dicts in sequence order
+            - next_since: Cursor to pass on the next call
+            - has_more: bool indicating if more changes are waiting
+    """
+    entries = db.session.query(ChangeLog).filter(
+        ChangeLog.seq > since
+    ).order_by(ChangeLog.seq).limit(limit + 1).all()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    return {
+        'changes': [{
+            'seq': entry.seq,
+            'table': entry.table_name,
+            'row_id': entry.row_id,
+            'distributor_id': entry.distributor_id,
+            'operation': entry.operation,
+            'changed_at': entry.changed_at
+        } for entry in entries],
+        'next_since': entries[-1].seq if entries else since,
+        'has_more': has_more
+    }
+
+def serialize_row(row):
+    """Convert a model instance into a JSON-friendly dict of its columns"""
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+def get_sync_delta(db, ChangeLog, models, token=None, limit=1000, snapshot_token=None):
+    """
+    Get the rows created, updated or deleted since a sync token
+
+    The token is a change log sequence number. Each page collapses repeated
+    changes to the same row, loads the surviving rows with one query per
+    table, and reports deleted rows as tombstones.
+
+    Without a token the client first pages through a full snapshot, table by
+    table in id order, following snapshot_token. The snapshot pages are read
+    in separate transactions, so they may mix states while writers run.
+    Every change made after the snapshot started is replayed afterwards,
+    because the last page returns the change log position read before the
+    first page as its token.
+
+    Args:
+        db: Database session
+        ChangeLog: ChangeLog model
+        models (dict): Table name -> model for the synced tables
+        token (int, optional): Token returned by the previous sync
+        limit (int): Maximum change log entries or snapshot rows per page
+        snapshot_token (str, optional): Snapshot position returned by the
+            previous snapshot page
+
+    Returns:
+        dict: Sync page with keys:
+            - token: Token to pass on the next call, or None while a snapshot
+              is being paged
+            - snapshot_token: Snapshot position to pass on the next call, or
+              None once the snapshot is complete
+            - has_more: bool indicating if another page is waiting
+            - changes: Table name -> {'upserts': [rows], 'deletes': [ids]}
+
+    Raises:
+        ValueError: If snapshot_token is malformed
+    """
+    changes = {table_name: {'upserts': [], 'deletes': []} for table_name in models}
+
+    if token is None:
+        return get_sync_snapshot(db, ChangeLog, models, changes, limit, snapshot_token)
+
+    entries = db.session.query(
+        ChangeLog.seq, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.operation
+    ).filter(
+        ChangeLog.seq > token,
+        ChangeLog.table_name.in_(list(models))
+    ).order_by(ChangeLog.seq).limit(limit + 1).all()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Keep only the last operation seen for each row
+    last_operation = {}
+    for entry in entries:
+        last_operation[(entry.table_name, entry.row_id)] = entry.operation
+
+    changed_ids = {table_name: [] for table_name in models}
+    for (table_name, row_id), operation in last_operation.items():
+        if operation == 'delete':
+            changes[table_name]['deletes'].append(row_id)
+        else:
+            changed_ids[table_name].append(row_id)
+
+    # Rows deleted after this page are skipped here; their tombstone follows later
+    for table_name, row_ids in changed_ids.items():
+        if row_ids:
+            model = models[table_name]
+            rows = model.query.filter(model.id.in_(row_ids)).order_by(model.id).all()
+            changes[table_name]['upserts'] = [serialize_row(row) for row in rows]
+
+    return {
+        'token': entries[-1].seq if entries else token,
+        'snapshot_token': None,
+        'has_more': has_more,
+        'changes': changes
+    }
+
+def get_sync_snapshot(db, ChangeLog, models, changes, limit, snapshot_token=None):
+    """
+    Get one page of the full snapshot that starts a sync
+
+    A snapshot token is "seq:table:last_id". seq is the change log position
+    read before the first page. table and last_id mark where the previous
+    page stopped. Rows are read with a keyset cursor on id, so each page
+    costs one indexed range query per table it touches.
+
+    Args:
+        db: Database session
+        ChangeLog: ChangeLog model
+        models (dict): Table name -> model for the synced tables, in paging order
+        changes (dict): Empty changes structure to fill
+        limit (int): Maximum rows per page
+        snapshot_token (str, optional): Position returned by the previous page
+
+    Returns:
+        dict: Sync page, as returned by get_sync_delta
+
+    Raises:
+        ValueError: If snapshot_token is malformed
+    """
+    table_names = list(models)
+    if snapshot_token is None:
+        seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        table_name, last_id = table_names[0], 0
+    else:
+        try:
+            seq, table_name, last_id = snapshot_token.split(':')
+            seq, last_id = int(seq), int(last_id)
+        except ValueError as e:
+            raise ValueError(f"Invalid snapshot token: {snapshot_token!r}") from e
+        if table_name not in models:
+            raise ValueError(f"Invalid snapshot token: {snapshot_token!r}")
+
+    remaining = limit
+    for table_name in table_names[table_names.index(table_name):]:
+        if remaining == 0:
+            return {'token': None, 'snapshot_token': f"{seq}:{table_name}:{last_id}",
+                    'has_more': True, 'changes': changes}
+
+        model = models[table_name]
+        rows = model.query.filter(model.id > last_id).order_by(model.id).limit(remaining + 1).all()
+        if len(rows) > remaining:
+            rows = rows[:remaining]
+            changes[table_name]['upserts'] = [serialize_row(row) for row in rows]
+            return {'token': None, 'snapshot_token': f"{seq}:{table_name}:{rows[-1].id}",
+                    'has_more': True, 'changes': changes}
+
+        changes[table_name]['upserts'] = [serialize_row(row) for row in rows]
+        remaining -= len(rows)
+        last_id = 0
+
+    # Changes made while the snapshot was paged follow as deltas from seq
+    pending = db.session.query(ChangeLog.seq).filter(
+        ChangeLog.seq > seq,
+        ChangeLog.table_name.in_(table_names)
+    ).first() is not None
+    return {'token': seq, 'snapshot_token': None, 'has_more': pending, 'changes': changes}
+
 def test_email_config():
     """
     Test the email configuration by checking if required environment variables are set
@@ -808,7 +1175,7 @@ def send_test_email(recipient_email):
     """
     try:
         # Create message container
-        msg = MIMEMultipart()
+        msg = mime_multipart.MIMEMultipart()
         msg['From'] = os.environ.get('EMAIL_FROM', 'noreply@example.com')
         msg['To'] = recipient_email
         msg['Subject'] = f"Test Email from Sales Management System"
@@ -821,7 +1188,7 @@ def send_test_email(recipient_email):
         
         Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         """
-        msg.attach(MIMEText(body, 'plain'))
+        msg.attach(mime_text.MIMEText(body, 'plain'))
         
         # Connect to mail server and send
         smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
@@ -829,19 +1196,21 @@ def send_test_email(recipient_email):
         smtp_username = os.environ.get('SMTP_USERNAME', '')
         smtp_password = os.environ.get('SMTP_PASSWORD', '')
         
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+        with EMAIL_DURATION.time(kind="test"), smtplib.SMTP(smtp_server, smtp_port) as server:
             server.starttls()
             # Only login if credentials are provided
             if smtp_username and smtp_password:
                 server.login(smtp_username, smtp_password)
             server.send_message(msg)
         
+        EMAIL_SENDS.inc(kind="test", result="success")
         logging.info(f"Test email sent successfully to {recipient_email}")
         return {
             'success': True,
             'message': f"Test email sent successfully to {recipient_email}"
         }
     except Exception as e:
+        EMAIL_SENDS.inc(kind="test", result="failure")
         error_msg = f"Failed to send test email: {str(e)}"
         logging.error(error_msg)
         return {
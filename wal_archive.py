@@ -0,0 +1,526 @@
+import os
+import json
+import struct
+import logging
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+
+from backup_utils import (
+    _backup_lock, ensure_backup_dir, ensure_chunk_dir, resolve_database_path, copy_database,
+    store_chunks, assemble_chunks, swap_database, BACKUP_CHUNK_SIZE, BACKUP_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+# Continuous WAL archiving for point-in-time recovery (on unless WAL_ARCHIVE is "false")
+WAL_ARCHIVE_ENABLED = os.environ.get("WAL_ARCHIVE", "true").lower() == "true"
+# Seconds between archive passes; this is also the granularity of point-in-time restores
+WAL_ARCHIVE_INTERVAL = int(os.environ.get("WAL_ARCHIVE_INTERVAL", 10))
+# Checkpoint once the archived WAL holds this many frames, so it doesn't grow without bound
+WAL_CHECKPOINT_FRAMES = int(os.environ.get("WAL_CHECKPOINT_FRAMES", 1000))
+# Hours between base snapshots that segments are replayed onto
+WAL_BASE_INTERVAL_HOURS = int(os.environ.get("WAL_BASE_INTERVAL_HOURS", 24))
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def ensure_wal_archive_dir():
+    """Create the WAL archive directories if they don't exist"""
+    archive_dir = os.path.join(ensure_backup_dir(), 'wal_archive')
+    os.makedirs(os.path.join(archive_dir, 'bases'), exist_ok=True)
+    os.makedirs(os.path.join(archive_dir, 'segments'), exist_ok=True)
+    return archive_dir
+
+def read_wal_header(wal_path):
+    """
+    Read the header of a WAL file
+
+    Returns:
+        tuple: (page size, checkpoint sequence, salt bytes), or None if the
+            WAL is missing or empty
+    """
+    try:
+        with open(wal_path, 'rb') as f:
+            header = f.read(WAL_HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) < WAL_HEADER_SIZE:
+        return None
+
+    magic, _, page_size, checkpoint_seq = struct.unpack('>IIII', header[:16])
+    if magic not in WAL_MAGIC:
+        raise ValueError(f"Not a WAL file: {wal_path}")
+    return page_size, checkpoint_seq, header[16:24]
+
+def read_committed_frames(wal_path, offset, page_size, salt):
+    """
+    Read the committed frames of the current WAL generation from an offset
+
+    Frames are valid while their salt matches the WAL header; anything after
+    the last commit frame belongs to a transaction still being written.
+
+    Returns:
+        tuple: (raw frame bytes, offset just past the last commit frame)
+    """
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    with open(wal_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+
+    committed = 0
+    position = 0
+    while position + frame_size <= len(data):
+        frame_header = data[position:position + WAL_FRAME_HEADER_SIZE]
+        if frame_header[8:16] != salt:
+            break
+        position += frame_size
+        if struct.unpack('>I', frame_header[4:8])[0]:
+            committed = position
+
+    return data[:committed], offset + committed
+
+def replay_frames(db_file, frames, page_size):
+    """
+    Apply archived WAL frames to a database file, one transaction at a time
+
+    Pages are buffered until their commit frame and then written in place,
+    and the file is truncated to the size the commit recorded.
+    """
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    pending = []
+    with open(db_file, 'r+b') as f:
+        for position in range(0, len(frames) - frame_size + 1, frame_size):
+            page_number, commit_size = struct.unpack('>II', frames[position:position + 8])
+            pending.append((page_number, position + WAL_FRAME_HEADER_SIZE))
+            if not commit_size:
+                continue
+
+            for page_number, page_offset in pending:
+                f.seek((page_number - 1) * page_size)
+                f.write(frames[page_offset:page_offset + page_size])
+            f.truncate(commit_size * page_size)
+            pending = []
+
+class WalArchiver:
+    """
+    Continuously archives committed WAL frames for point-in-time recovery
+
+    Each pass briefly takes the write lock, copies the frames committed since
+    the last pass into a compressed segment, and checkpoints once enough has
+    been archived. Between passes the archiver holds a read transaction open,
+    which stops any other connection from checkpointing past frames it has
+    not yet copied and restarting the WAL over them.
+
+    Segments belong to the base snapshot taken before them. A base is taken
+    when the archiver starts, every WAL_BASE_INTERVAL_HOURS, and whenever the
+    chain is broken (the database was restored or the WAL was reset by
+    something else), so every segment can be replayed onto its base.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = resolve_database_path(db_path)
+        self.wal_path = self.db_path + "-wal"
+        self.archive_dir = ensure_wal_archive_dir()
+        self.index_path = os.path.join(self.archive_dir, "segments.jsonl")
+        self._lock = threading.Lock()
+        self._writer = None
+        self._reader = None
+        self._base_id = None
+        self._salt = None
+        self._checkpoint_seq = None
+        self._offset = WAL_HEADER_SIZE
+        self._next_seq = self._last_segment_seq() + 1
+
+    def start(self):
+        """Switch the database to WAL mode, open connections and take a base"""
+        with self._lock:
+            self._open()
+            self._take_base()
+        logger.info(f"WAL archiver started for {self.db_path}")
+
+    def stop(self):
+        """Archive what is left and close the connections"""
+        with self._lock:
+            if self._writer is not None:
+                # Closing the connections checkpoints anyway
+                self._archive(checkpoint=False)
+                self._close()
+
+    @contextmanager
+    def paused(self):
+        """
+        Release the database while it is replaced, then start a new chain
+
+        The old file's frames cannot be replayed onto the new one, so a
+        fresh base is taken once the swap is done.
+        """
+        with self._lock:
+            running = self._writer is not None
+            if running:
+                # The file is about to be replaced, so a checkpoint would be wasted
+                self._archive(checkpoint=False)
+                self._close()
+            try:
+                yield
+            finally:
+                if running:
+                    self._open()
+                    self._take_base()
+
+    def archive(self):
+        """Run one archive pass; safe to call from a scheduler thread"""
+        with self._lock:
+            if self._writer is None:
+                return
+            try:
+                self._archive()
+            except Exception as e:
+                logger.error(f"WAL archive pass failed: {str(e)}")
+
+    def take_base(self):
+        """Take a new base snapshot and prune bases past the retention period"""
+        with self._lock:
+            if self._writer is None:
+                return
+            try:
+                self._take_base()
+                prune_wal_archive()
+            except Exception as e:
+                logger.error(f"WAL archive base failed: {str(e)}")
+
+    def _open(self):
+        self._writer = sqlite3.connect(self.db_path, isolation_level=None, timeout=30, check_same_thread=False)
+        mode = self._writer.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != "wal":
+            self._writer.close()
+            self._writer = None
+            raise RuntimeError(f"Could not switch {self.db_path} to WAL mode (journal_mode is {mode})")
+        self._reader = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._hold_read_snapshot()
+
+    def _close(self):
+        for conn in (self._reader, self._writer):
+            if conn is not None:
+                conn.close()
+        self._reader = None
+        self._writer = None
+
+    def _hold_read_snapshot(self):
+        self._reader.execute("BEGIN")
+        self._reader.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def _last_segment_seq(self):
+        last = 0
+        for entry in load_segment_index(self.index_path):
+            last = max(last, entry["seq"])
+        return last
+
+    def _archive(self, checkpoint=True):
+        """
+        Copy newly committed frames into a segment; call with self._lock held
+
+        Args:
+            checkpoint (bool): Checkpoint once WAL_CHECKPOINT_FRAMES are archived.
+                The final passes before closing skip it.
+        """
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            header = read_wal_header(self.wal_path)
+            if header is None:
+                return
+            page_size, checkpoint_seq, salt = header
+
+            if salt != self._salt:
+                # The WAL restarted. That is only expected straight after our own
+                # checkpoint; anything else means frames may have been missed.
+                expected = self._salt is None or checkpoint_seq == self._checkpoint_seq + 1
+                if not expected:
+                    logger.warning("WAL was reset outside the archiver; starting a new base")
+                    self._writer.execute("ROLLBACK")
+                    self._take_base()
+                    return
+                self._salt = salt
+                self._checkpoint_seq = checkpoint_seq
+                self._offset = WAL_HEADER_SIZE
+
+            frames, end = read_committed_frames(self.wal_path, self._offset, page_size, salt)
+            if frames:
+                self._write_segment(frames, page_size)
+                self._offset = end
+
+            frame_count = (self._offset - WAL_HEADER_SIZE) // (WAL_FRAME_HEADER_SIZE + page_size)
+            if checkpoint and frame_count >= WAL_CHECKPOINT_FRAMES:
+                # Everything in the WAL is archived and writers are held off, so
+                # the next writer may safely restart the WAL from the beginning
+                self._reader.execute("COMMIT")
+                self._reader.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                self._hold_read_snapshot()
+        finally:
+            if self._writer.in_transaction:
+                self._writer.execute("ROLLBACK")
+
+    def _write_segment(self, frames, page_size):
+        seq = self._next_seq
+        file_name = f"{seq:010d}.wal.z"
+        path = os.path.join(self.archive_dir, 'segments', file_name)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(zlib.compress(frames, 1))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        entry = {
+            "seq": seq,
+            "base": self._base_id,
+            "time": datetime.now().strftime(TIME_FORMAT),
+            "page_size": page_size,
+            "frames": len(frames) // (WAL_FRAME_HEADER_SIZE + page_size),
+            "file": file_name
+        }
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._next_seq += 1
+
+    def _take_base(self):
+        """Snapshot the database at a known WAL position; call with self._lock held"""
+        base_time = datetime.now()
+        base_id = f"base_{base_time.strftime('%Y-%m-%d_%H-%M-%S-%f')}"
+        temp_path = os.path.join(self.archive_dir, 'bases', base_id + ".db")
+
+        # Close off the current chain, then copy the database while writers
+        # are held off so the base matches the WAL position exactly
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            header = read_wal_header(self.wal_path)
+            if header is not None:
+                page_size, checkpoint_seq, salt = header
+                if salt == self._salt:
+                    frames, self._offset = read_committed_frames(self.wal_path, self._offset, page_size, salt)
+                    if frames:
+                        self._write_segment(frames, page_size)
+                else:
+                    _, self._offset = read_committed_frames(self.wal_path, WAL_HEADER_SIZE, page_size, salt)
+                self._salt = salt
+                self._checkpoint_seq = checkpoint_seq
+            else:
+                self._salt = None
+                self._checkpoint_seq = None
+                self._offset = WAL_HEADER_SIZE
+
+            size = copy_database(self.db_path, temp_path, pages=-1, step_sleep=0)
+            self._base_id = base_id
+        finally:
+            self._writer.execute("ROLLBACK")
+
+        try:
+            with _backup_lock:
+                hashes, new_bytes = store_chunks(temp_path, ensure_chunk_dir())
+                with open(os.path.join(self.archive_dir, 'bases', base_id + ".json"), 'w') as f:
+                    json.dump({
+                        "id": base_id,
+                        "time": base_time.strftime(TIME_FORMAT),
+                        "chunk_size": BACKUP_CHUNK_SIZE,
+                        "size": size,
+                        "chunks": hashes
+                    }, f)
+        finally:
+            os.remove(temp_path)
+
+        logger.info(f"WAL archive base {base_id} taken ({size} bytes, {new_bytes} new)")
+
+def load_segment_index(index_path=None):
+    """Return the archived segment entries in sequence order"""
+    index_path = index_path or os.path.join(ensure_wal_archive_dir(), "segments.jsonl")
+    if not os.path.exists(index_path):
+        return []
+    entries = []
+    with open(index_path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return sorted(entries, key=lambda entry: entry["seq"])
+
+def load_bases():
+    """Return the base snapshot records, oldest first"""
+    bases_dir = os.path.join(ensure_wal_archive_dir(), 'bases')
+    bases = []
+    for file_name in os.listdir(bases_dir):
+        if file_name.endswith(".json"):
+            with open(os.path.join(bases_dir, file_name), 'r') as f:
+                bases.append(json.load(f))
+    return sorted(bases, key=lambda base: base["id"])
+
+def get_recovery_window():
+    """
+    Return the range of times the database can be restored to
+
+    Returns:
+        tuple: (earliest, latest) as 'YYYY-MM-DD HH:MM:SS' strings, or None
+            if nothing has been archived
+    """
+    bases = load_bases()
+    if not bases:
+        return None
+    latest = bases[-1]["time"]
+    for entry in load_segment_index():
+        latest = max(latest, entry["time"])
+    return bases[0]["time"], latest
+
+def build_point_in_time(target_time, dest_path):
+    """
+    Rebuild the database as it was at a given time
+
+    The newest base taken at or before the target is assembled from the chunk
+    store and the segments archived after it, up to the target, are replayed
+    onto it.
+
+    Args:
+        target_time (datetime): Time to restore to
+        dest_path: Path of the database file to write
+
+    Returns:
+        int: Number of segments replayed
+
+    Raises:
+        ValueError: If no base snapshot is old enough or a segment is missing
+    """
+    target = target_time.strftime(TIME_FORMAT)
+    archive_dir = ensure_wal_archive_dir()
+    candidates = [base for base in load_bases() if base["time"] <= target]
+    if not candidates:
+        raise ValueError(f"No archived base snapshot at or before {target}")
+    base = candidates[-1]
+
+    assemble_chunks(base, ensure_chunk_dir(), dest_path)
+
+    replayed = 0
+    for entry in load_segment_index():
+        if entry["base"] != base["id"] or entry["time"] > target:
+            continue
+        path = os.path.join(archive_dir, 'segments', entry["file"])
+        if not os.path.exists(path):
+            raise ValueError(f"Missing WAL segment {entry['file']}")
+        with open(path, 'rb') as f:
+            replay_frames(dest_path, zlib.decompress(f.read()), entry["page_size"])
+        replayed += 1
+
+    logger.info(f"Rebuilt database at {target} from {base['id']} and {replayed} WAL segments")
+    return replayed
+
+def restore_to_point_in_time(target_time, quiesce=None, db_path=None):
+    """
+    Restore the live database to a point in time
+
+    Args:
+        target_time (datetime): Time to restore to
+        quiesce: Optional context manager factory that stops database use
+            around the swap
+        db_path: Database to replace (defaults to the current app's DATABASE_PATH)
+
+    Returns:
+        bool: Success status
+    """
+    db_path = resolve_database_path(db_path)
+    temp_path = db_path + ".restore"
+    try:
+        build_point_in_time(target_time, temp_path)
+        swap_database(temp_path, db_path, quiesce)
+        logger.info(f"Successfully restored database to {target_time.strftime(TIME_FORMAT)}")
+        return True
+    except Exception as e:
+        logger.error(f"Point-in-time restore failed: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+def prune_wal_archive(retention_days=None):
+    """
+    Delete bases older than the retention period and the segments built on them
+
+    The newest base is always kept. Chunks freed here are collected by
+    backup_utils.prune_backups. Called by the archiver with its lock held, so
+    the segment index is not appended to while it is rewritten.
+
+    Returns:
+        int: Number of bases deleted
+    """
+    retention_days = BACKUP_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TIME_FORMAT)
+    archive_dir = ensure_wal_archive_dir()
+    index_path = os.path.join(archive_dir, "segments.jsonl")
+
+    bases = load_bases()
+    expired = {base["id"] for base in bases[:-1] if base["time"] < cutoff}
+    if not expired:
+        return 0
+
+    kept = []
+    for entry in load_segment_index(index_path):
+        if entry["base"] in expired:
+            segment_path = os.path.join(archive_dir, 'segments', entry["file"])
+            if os.path.exists(segment_path):
+                os.remove(segment_path)
+        else:
+            kept.append(entry)
+    with open(index_path + ".tmp", 'w') as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in kept)
+    os.replace(index_path + ".tmp", index_path)
+
+    for base_id in expired:
+        os.remove(os.path.join(archive_dir, 'bases', base_id + ".json"))
+
+    logger.info(f"Pruned {len(expired)} WAL archive bases older than {retention_days} days")
+    return len(expired)
+
+# The running archiver, if any; a restore pauses it around the file swap
+_archiver = None
+_archiver_lock = threading.Lock()
+
+def start_wal_archiver(scheduler, db_path=None):
+    """
+    Start continuous WAL archiving on a scheduler
+
+    Args:
+        scheduler: Running APScheduler scheduler to add the jobs to
+        db_path: Database to archive (defaults to the current app's DATABASE_PATH)
+
+    Returns:
+        WalArchiver: The archiver, or None if archiving is disabled
+    """
+    global _archiver
+    if not WAL_ARCHIVE_ENABLED:
+        return None
+
+    with _archiver_lock:
+        if _archiver is None:
+            archiver = WalArchiver(db_path)
+            archiver.start()
+            _archiver = archiver
+
+    scheduler.add_job(_archiver.archive, 'interval', seconds=WAL_ARCHIVE_INTERVAL,
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_archiver.take_base, 'interval', hours=WAL_BASE_INTERVAL_HOURS,
+                      max_instances=1, coalesce=True)
+    logger.info(f"WAL archiving every {WAL_ARCHIVE_INTERVAL}s with a new base every {WAL_BASE_INTERVAL_HOURS}h")
+    return _archiver
+
+def stop_wal_archiver():
+    """Stop the running archiver, if there is one"""
+    global _archiver
+    with _archiver_lock:
+        archiver, _archiver = _archiver, None
+    if archiver is not None:
+        archiver.stop()
+        logger.info("WAL archiver stopped")
+
+def archiver_paused():
+    """Context manager that pauses the running archiver, if there is one"""
+    return _archiver.paused() if _archiver is not None else nullcontext()